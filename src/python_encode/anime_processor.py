@@ -1,15 +1,23 @@
+import collections
+import concurrent.futures
+import functools
+import io
 import json
 import logging
+import os
 import re
-import signal
 import subprocess
-from pathlib import Path
-from typing import Optional, Callable, Dict, List, Union, Set, Tuple
+import threading
+from pathlib import Path, PurePath
+from typing import Optional, Callable, Dict, List, Union, Set, Tuple, BinaryIO, TextIO, Iterator, Deque, Iterable
 
 import alive_progress
 
-from python_encode.custom_objects import AnimeFileObject, EncodePresetObject
+from python_encode.custom_objects import AnimeFileObject, EncodePresetObject, FFmpegProgress, FileNameTable
+from python_encode.file_cache import ProbeCache, LeanProbeCache, Crc32Cache, SfvSidecar
+from python_encode.probe_backend import PyAVProbe
 from python_encode.ui.model_encoder_settings import Defaults
+from python_encode.utils import HashingFileWriter, EncodeStage, ProbeBackend, ProbeProfile, FrameCountSource
 from python_encode.utils_site_package import ProbeResultKeys, HelperFunctions, Constants
 
 
@@ -20,18 +28,142 @@ class AnimeProcessor:
     brackets = {'(': ')', '[': ']'}
     ignoring_left_brackets = set()
     tag_content_spliter = None
+    use_probe_cache = True  # set to False to always run ffprobe (e.g. "--no-probe-cache")
+    probe_caches: Dict[str, ProbeCache] = dict()  # per `ProbeProfile`, opened on first use, see `get_probe_cache()`
+    use_crc32_cache = True  # set to False to always hash source files (e.g. "--no-crc32-cache")
+    crc32_cache: Optional[Crc32Cache] = None  # opened on first use, see `get_crc32_cache()`
+    trust_sfv_sidecar = False  # take source crc32 from a ".sfv" file next to it instead of hashing
+    _cache_lock = threading.Lock()  # files may be read from multiple threads, see `read_anime_files()`
+    # what `read_anime_file_probe_result` and the encode steps read, everything else ffprobe prints is skipped
+    LEAN_PROBE_ENTRIES = "format=duration,start_time" \
+                         ":stream=index,codec_type,codec_name,width,height,nb_frames,avg_frame_rate,duration" \
+                         ":stream_tags" \
+                         ":chapter=start_time,end_time:chapter_tags=title"
+
+    CRC32_TAG_PATTERN = re.compile(r'[0-9|a-f]{8}', re.IGNORECASE)
+    RESOLUTION_TAG_PATTERN = re.compile(r'\d+[p|i|P|I]|\d+[x|X]\d+')  # "1080p", "1920x1080"
+    _name_token_patterns: Dict[Tuple[Tuple[str, str], ...], re.Pattern] = dict()  # see `_get_name_token_pattern()`
+    # episode info, see `parse_episode_info()`
+    _SPECIALS = r'OVA|OAD|ONA|NCOP|NCED|SPECIALS?|SP|MOVIE'
+    SEASON_EPISODE_PATTERN = re.compile(  # "S01E07", "S2E01-E12"
+        r'\bS(?P<season>\d{1,2})\s?EP?(?P<first>\d{1,4})(?:(?:-|\s?~\s?)(?:EP?)?(?P<last>\d{1,4}))?'
+        r'(?:\s?v(?P<version>\d{1,2}))?\b', re.IGNORECASE)
+    DASH_EPISODE_PATTERN = re.compile(  # "Show - 07", "Show - 07v2", "Show - 01~12", "Show - OVA2"
+        r'(?:^|\s)-\s*(?:(?P<special>' + _SPECIALS + r')\s?)?(?:EP?|#)?(?P<first>\d{1,4})'
+        r'(?:(?:-|\s?~\s?)(?P<last>\d{1,4}))?(?:\s?v(?P<version>\d{1,2}))?(?=\s|$)', re.IGNORECASE)
+    TAG_EPISODE_PATTERN = re.compile(  # "[07]", "[07v2]", "[01-12]", "[EP07 END]"
+        r'(?:EP?|#)?(?P<first>\d{1,3})(?:(?:-|\s?~\s?)(?P<last>\d{1,3}))?(?:\s?v(?P<version>\d{1,2}))?(?:\s?END)?',
+        re.IGNORECASE)
+    SPECIAL_PATTERN = re.compile(r'\b(?P<special>' + _SPECIALS + r')(?:\s?(?P<number>\d{1,3}))?\b', re.IGNORECASE)
+    VERSION_TAG_PATTERN = re.compile(r'v(\d{1,2})', re.IGNORECASE)
+    SEASON_PATTERN = re.compile(  # "S2", "Season 2", "2nd Season"
+        r'\bS(\d{1,2})\b|\bSeason\s?(\d{1,2})\b|\b(\d{1,2})(?:st|nd|rd|th)\s+Season\b', re.IGNORECASE)
 
     @staticmethod
-    def probe_file(file: Path, ffprobe_path: str = ffprobe) -> dict:
+    def get_probe_cache(profile: str = ProbeProfile.FULL) -> ProbeCache:
+        if profile not in ProbeProfile.values():
+            raise ValueError(f"Unknown probe profile {profile}, expect one of {ProbeProfile.values()}")
+        with AnimeProcessor._cache_lock:
+            if profile not in AnimeProcessor.probe_caches:
+                AnimeProcessor.probe_caches[profile] = LeanProbeCache() if profile == ProbeProfile.LEAN else ProbeCache()
+            return AnimeProcessor.probe_caches[profile]
+
+    @staticmethod
+    def get_cached_probe_result(file: Path, profile: str) -> Optional[dict]:
+        # a full result answers a lean probe as well
+        for cache_profile in [ProbeProfile.LEAN, ProbeProfile.FULL] if profile == ProbeProfile.LEAN else [profile]:
+            cached_result = AnimeProcessor.get_probe_cache(cache_profile).get(file)
+            if cached_result is not None:
+                return cached_result
+        return None
+
+    @staticmethod
+    def compile_probe_param(file: Path, ffprobe_path: str = ffprobe, profile: Optional[str] = None) -> List[str]:
+        """:param profile: One of `ProbeProfile`, defaults to `Constants.PROBE_PROFILE`"""
+        profile = profile if profile is not None else Constants.PROBE_PROFILE
+        if profile not in ProbeProfile.values():
+            raise ValueError(f"Unknown probe profile {profile}, expect one of {ProbeProfile.values()}")
         # eqvalant cmd: ffprobe {file} -show_format -show_streams -show_chapters -print_format json >> probe.json
-        probe_result = subprocess.run([
-            ffprobe_path,
-            file.absolute().__str__(),
-            "-show_format",
-            "-show_streams",
-            "-show_chapters",
-            "-print_format", "json"
-        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if profile == ProbeProfile.LEAN:
+            entries = ["-show_entries", AnimeProcessor.LEAN_PROBE_ENTRIES]
+        else:
+            entries = ["-show_format", "-show_streams", "-show_chapters"]
+        return [ffprobe_path, file.absolute().__str__()] + entries + ["-print_format", "json"]
+
+    @staticmethod
+    def get_crc32_cache() -> Crc32Cache:
+        with AnimeProcessor._cache_lock:
+            if AnimeProcessor.crc32_cache is None:
+                AnimeProcessor.crc32_cache = Crc32Cache()
+            return AnimeProcessor.crc32_cache
+
+    @staticmethod
+    def probe_file(file: Path, ffprobe_path: str = ffprobe, use_cache: bool = True,
+                   backend: Optional[str] = None, profile: Optional[str] = None) -> dict:
+        """
+        Run ffprobe on `file` and return its json output as dict.
+
+        :param file:
+        :param ffprobe_path:
+        :param use_cache: Look up (and save to) the on-disk probe cache, unless `AnimeProcessor.use_probe_cache` is False.
+        :param backend: One of `ProbeBackend`, defaults to `Constants.PROBE_BACKEND`. PyAV gives the same dict without
+            spawning ffprobe, ffprobe is still used for files PyAV fails on.
+        :param profile: One of `ProbeProfile`, defaults to `Constants.PROBE_PROFILE`. PyAV only reads what the lean
+            profile has, so `ProbeProfile.FULL` always runs ffprobe.
+        """
+        profile = profile if profile is not None else Constants.PROBE_PROFILE
+        use_cache = use_cache and AnimeProcessor.use_probe_cache
+        if use_cache:
+            cached_result = AnimeProcessor.get_cached_probe_result(file, profile)
+            if cached_result is not None:
+                return cached_result
+        probe_result_dict = None
+        if profile == ProbeProfile.LEAN and PyAVProbe.resolve(backend) == ProbeBackend.PYAV:
+            try:
+                probe_result_dict = PyAVProbe.probe(file)
+            except Exception as ex:
+                AnimeProcessor.logger.debug(f'PyAV cannot probe "{file}" ({ex}), trying ffprobe')
+        if probe_result_dict is None:
+            probe_result_dict = AnimeProcessor._run_ffprobe(file, ffprobe_path, profile)
+        if use_cache:
+            AnimeProcessor.get_probe_cache(profile).put(file, probe_result_dict)
+        return probe_result_dict
+
+    @staticmethod
+    def probe_files(files: List[Path], ffprobe_path: str = ffprobe, use_cache: bool = True,
+                    backend: Optional[str] = None, profile: Optional[str] = None, max_workers: Optional[int] = None,
+                    abort_signal: Optional[Callable[[], bool]] = ...) -> List[Optional[dict]]:
+        """
+        `probe_file` for many files at once, for folders of short files (OP/ED, extras...) where starting ffprobe
+        costs more than what it reads. Cache hits are returned right away, the rest is probed `max_workers` at a time
+        (default `Constants.PROBE_WORKERS`), in-process if PyAV is used.
+
+        :return: Probe results in the same order as `files`, `None` for files that can't be probed (or skipped)
+        """
+        if not isinstance(abort_signal, Callable):
+            abort_signal = lambda: False
+        if max_workers is None:
+            max_workers = Constants.PROBE_WORKERS
+        probe_one = lambda file: AnimeProcessor._probe_file_or_none(file, ffprobe_path, use_cache, backend, profile,
+                                                                    abort_signal)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            return list(executor.map(probe_one, files))
+
+    @staticmethod
+    def _probe_file_or_none(file: Path, ffprobe_path: str, use_cache: bool, backend: Optional[str],
+                            profile: Optional[str], abort_signal: Callable[[], bool]) -> Optional[dict]:
+        if abort_signal():
+            return None
+        try:
+            return AnimeProcessor.probe_file(file, ffprobe_path, use_cache, backend, profile)
+        except (subprocess.SubprocessError, OSError) as ex:
+            AnimeProcessor.logger.debug(f'Cannot probe "{file}": {ex}')
+            return None
+
+    @staticmethod
+    def _run_ffprobe(file: Path, ffprobe_path: str, profile: str) -> dict:
+        probe_result = subprocess.run(AnimeProcessor.compile_probe_param(file, ffprobe_path, profile),
+                                      stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         if probe_result.returncode != 0:
             raise subprocess.SubprocessError(
                 str.format('Process "{0}" error: {1}', ffprobe_path, probe_result.stderr.splitlines()[-1].decode()))
@@ -42,27 +174,20 @@ class AnimeProcessor:
                     known_omittable_tags: Optional[Set[str]] = None) -> None:
         """Check tag content and write it to the corresponding anime object property"""
 
-        # known_tag list
-        for known_omittable_tag in known_omittable_tags:
-            if tag_content.upper() == known_omittable_tag:
-                anime_object.omittable_tags.add(tag_content)
-                AnimeProcessor.logger.debug(f"known tag: {tag_content}")
-                return
+        # known_tag list (upper case)
+        if known_omittable_tags is not None and tag_content.upper() in known_omittable_tags:
+            anime_object.omittable_tags.add(tag_content)
+            return
 
         # crc32
-        if len(tag_content) == 8:
-            potential_crc = re.match(r'([0-9|a-f]*)', tag_content, re.IGNORECASE)
-            if potential_crc is not None and potential_crc.group() == tag_content:
-                anime_object.crc32 = (anime_object.crc32[0], tag_content)
-                AnimeProcessor.logger.debug(f"crc32: {tag_content}")
-                return
+        if len(tag_content) == 8 and AnimeProcessor.CRC32_TAG_PATTERN.fullmatch(tag_content) is not None:
+            anime_object.crc32 = (anime_object.crc32[0], tag_content)
+            return
 
         # resolution
-        for exp in [r'(\d+)[p|i|P|I]', r'\d+[x|X](\d+)']:
-            if re.search(exp, tag_content) is not None:
-                anime_object.omittable_tags.add(tag_content)
-                AnimeProcessor.logger.debug(f"resolution: {tag_content}")
-                return
+        if AnimeProcessor.RESOLUTION_TAG_PATTERN.search(tag_content) is not None:
+            anime_object.omittable_tags.add(tag_content)
+            return
 
         # a tag that is not known or should not omit
         anime_object.non_omittable_tags.add(tag_content)
@@ -118,49 +243,192 @@ class AnimeProcessor:
         if not HelperFunctions.is_subject_empty(anime.video_stream_indexes):
             first_video_stream = streams[list(anime.video_stream_indexes)[0]]
             # resolution
-            anime.video_resolution = (
-                first_video_stream.get('width', None).__str__(),
-                first_video_stream.get('height', None).__str__()
+            anime.video_resolution = tuple(
+                first_video_stream[_].__str__() if first_video_stream.get(_, None) is not None else None
+                for _ in ('width', 'height')
             )
             # show warning if resolution is not found
             if None in anime.video_resolution:
                 AnimeProcessor.logger.warning('Unable to read video resolution with ffprobe: %s', anime.file)
-            # frame count / duration (if previous attempt failed)
-            stream_tags: dict = first_video_stream.get('tags')
+            # duration (if previous attempt failed) / frame count
+            stream_tags: dict = first_video_stream.get('tags', dict())
             for key in stream_tags.keys():
-                if 'NUMBER_OF_FRAMES' in key:
-                    anime.video_frame_count = int(stream_tags.get(key))
                 if anime.video_length_seconds is None and 'DURATION' in key:
-                    hour, minute, second = stream_tags.get(key).split(':')
-                    anime.video_length_seconds = float(hour) * 3600 + float(minute) * 60 + float(second)
+                    anime.video_length_seconds = AnimeProcessor._parse_duration_tag(stream_tags.get(key))
             # show warning if video length is not found
             if anime.video_length_seconds is None:
                 AnimeProcessor.logger.warning('Unable to read video length with ffprobe: %s', anime.file)
+            anime.video_frame_count, anime.video_frame_count_source = \
+                AnimeProcessor.read_video_frame_count(first_video_stream, anime.video_length_seconds)
+            if anime.video_frame_count is None:
+                AnimeProcessor.logger.warning('Unable to read video frame count with ffprobe: %s', anime.file)
+
+    @staticmethod
+    def _parse_duration_tag(text: str) -> float:
+        """"DURATION" tag of matroska streams (hh:mm:ss.nnnnnnnnn), in seconds"""
+        hour, minute, second = text.split(':')
+        return float(hour) * 3600 + float(minute) * 60 + float(second)
+
+    @staticmethod
+    def read_video_frame_count(video_stream: dict,
+                               fallback_duration: Optional[float] = None) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Frame count of a video stream (from probe result), taken from the most reliable info it has:
+        NUMBER_OF_FRAMES tag, nb_frames, packets counted earlier (see `read_anime_file_packet_count`), and at last
+        duration x avg_frame_rate.
+
+        :param video_stream: A stream of probe result
+        :param fallback_duration: In seconds, used for the estimate if the stream has no duration of its own
+        :return: Frame count and one of `FrameCountSource`, or (None, None) if there's nothing to go by
+        """
+        stream_tags: dict = video_stream.get('tags', dict())
+        for key in stream_tags.keys():
+            if 'NUMBER_OF_FRAMES' in key:
+                try:
+                    frame_count = int(stream_tags.get(key))
+                except (TypeError, ValueError):
+                    continue
+                if frame_count > 0:
+                    return frame_count, FrameCountSource.TAGS
+        for key, source in (('nb_frames', FrameCountSource.NB_FRAMES), ('nb_read_packets', FrameCountSource.PACKETS)):
+            try:
+                frame_count = int(video_stream.get(key))
+            except (TypeError, ValueError):
+                continue
+            if frame_count > 0:
+                return frame_count, source
+
+        duration = None
+        try:
+            duration = float(video_stream.get('duration'))
+        except (TypeError, ValueError):
+            for key in stream_tags.keys():
+                if 'DURATION' in key:
+                    try:
+                        duration = AnimeProcessor._parse_duration_tag(stream_tags.get(key))
+                    except (AttributeError, ValueError):
+                        continue
+        if duration is None:
+            duration = fallback_duration
+        try:
+            numerator, denominator = str(video_stream.get('avg_frame_rate', '0/0')).split('/')
+            frame_rate = int(numerator) / int(denominator)
+        except (ValueError, ZeroDivisionError):
+            frame_rate = 0
+        if duration is None or duration <= 0 or frame_rate <= 0:
+            return None, None
+        return round(duration * frame_rate), FrameCountSource.ESTIMATE
+
+    @staticmethod
+    def count_video_packets(file: Path, ffprobe: str = ffprobe, stream_index: Optional[int] = None) -> Optional[int]:
+        """
+        Count packets of a video stream (first one by default) with "ffprobe -count_packets". Only demuxes, but still
+        reads the whole file. One packet is one frame for the video codecs around.
+
+        :return: `None` if ffprobe fails
+        """
+        try:
+            result = subprocess.run([
+                ffprobe, "-v", "error",
+                "-select_streams", str(stream_index) if stream_index is not None else "v:0",
+                "-count_packets",
+                "-show_entries", "stream=nb_read_packets",
+                "-of", "csv=p=0",
+                file.absolute().__str__()
+            ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except OSError as ex:
+            AnimeProcessor.logger.warning(f'Cannot count packets of "{file}": {ex}')
+            return None
+        try:
+            return int(result.stdout.decode('ascii', errors='replace').strip().split(',')[0])
+        except ValueError:
+            return None
+
+    @staticmethod
+    def read_anime_file_packet_count(anime: AnimeFileObject, probe_result: dict, ffprobe: str = ffprobe,
+                                     profile: Optional[str] = None) -> None:
+        """
+        Replace an estimated (or missing) frame count with counted video packets, which are also added to the cached
+        probe result ("nb_read_packets" of the stream, as ffprobe names it), so they are only counted once per file.
+
+        :param profile: Probe cache to update, defaults to `Constants.PROBE_PROFILE`
+        """
+        if FrameCountSource.is_exact(anime.video_frame_count_source) or \
+                HelperFunctions.is_subject_empty(anime.video_stream_indexes):
+            return
+        stream_index = list(anime.video_stream_indexes)[0]  # same one `read_anime_file_probe_result` reads
+        packet_count = AnimeProcessor.count_video_packets(anime.file, ffprobe, stream_index)
+        if packet_count is None or packet_count <= 0:
+            return
+        AnimeProcessor.logger.debug(f"{anime.file_name}: {packet_count} video packets "
+                                    f"(was {anime.video_frame_count}, {anime.video_frame_count_source})")
+        anime.video_frame_count, anime.video_frame_count_source = packet_count, FrameCountSource.PACKETS
+        probe_result["streams"][stream_index]["nb_read_packets"] = str(packet_count)
+        if AnimeProcessor.use_probe_cache:
+            AnimeProcessor.get_probe_cache(profile if profile is not None else Constants.PROBE_PROFILE) \
+                .put(anime.file, probe_result)
+
+    @staticmethod
+    def read_anime_file_streams(anime: AnimeFileObject, probe_result: dict, ffprobe: str = ffprobe,
+                                profile: Optional[str] = None, count_packets: Optional[bool] = None) -> None:
+        """
+        Everything `read_anime_file` does with a probe result: `read_anime_file_probe_result`, then
+        `read_anime_file_packet_count` if `count_packets` (defaults to `Constants.COUNT_PACKETS`).
+        Blocks while counting packets.
+        """
+        AnimeProcessor.read_anime_file_probe_result(anime, probe_result)
+        if count_packets if count_packets is not None else Constants.COUNT_PACKETS:
+            AnimeProcessor.read_anime_file_packet_count(anime, probe_result, ffprobe, profile)
 
     @staticmethod
     def read_anime_file_crc32(anime: AnimeFileObject, on_bytes_read: Optional[Callable[[int], None]] = ...,
-                              abort_signal: Optional[Callable[[None], bool]] = ..., ) -> None:
+                              abort_signal: Optional[Callable[[None], bool]] = ...,
+                              crc32_workers: int = 1, use_cache: bool = True) -> None:
         """
         Use zlib to calculate video file's crc32.
         And use alive_progress without "with/as" context: https://github.com/rsalmei/alive-progress/issues/3
+
+        Before hashing, the crc32 cache (unless `AnimeProcessor.use_crc32_cache` is False) and then sfv sidecar files
+        (only if `AnimeProcessor.trust_sfv_sidecar` is True) are checked. Progress is reported as fully read if found.
+
         :param anime:
         :param progress_emit:
         :param abort_signal:
+        :param crc32_workers: Number of threads hashing the file, see `HelperFunctions.get_file_crc32`
+        :param use_cache: False to always hash, and leave the crc32 cache and sfv files alone (encoded outputs are
+            renamed right after, a cache entry of their temporary name would only go stale)
         :return:
         """
         progress_emit: Callable[[int], None]
         if not isinstance(anime.file, Path) or not anime.file.exists() or anime.file.is_dir():
             raise RuntimeError('File "%s" is invalid.', anime.file)
+
+        use_cache = use_cache and AnimeProcessor.use_crc32_cache
+        known_crc32 = None
+        if use_cache:
+            known_crc32 = AnimeProcessor.get_crc32_cache().get(anime.file)
+        if known_crc32 is None and use_cache and AnimeProcessor.trust_sfv_sidecar:
+            known_crc32 = SfvSidecar.find_crc32(anime.file)
+        if known_crc32 is not None:
+            anime.crc32 = (known_crc32, None)
+            if isinstance(on_bytes_read, Callable):
+                on_bytes_read(anime.file.stat().st_size)
+            return
+
         bar = alive_progress.alive_bar(anime.file.stat().st_size, title="Calculating CRC32", theme='classic', scale=2)
         if not isinstance(on_bytes_read, Callable):
             progress_emit = bar.__enter__()
         else:
             progress_emit = on_bytes_read
         anime.crc32 = (
-            HelperFunctions.get_file_crc32(anime.file, on_file_chunk_read=progress_emit, abort_signal=abort_signal),
+            HelperFunctions.get_file_crc32(anime.file, on_file_chunk_read=progress_emit, abort_signal=abort_signal,
+                                           workers=crc32_workers),
             None)
         if not isinstance(on_bytes_read, Callable):
             bar.__exit__(None, None, None)
+        # an aborted hash is only a partial one
+        if use_cache and not (isinstance(abort_signal, Callable) and abort_signal()):
+            AnimeProcessor.get_crc32_cache().put(anime.file, anime.crc32[0])
 
     # @staticmethod
     # def read_anime_file_crc32_str(anime: Path, on_bytes_read: Optional[Callable[[int], None]] = ...,
@@ -178,6 +446,21 @@ class AnimeProcessor:
     #         bar.__exit__()
     #     return crc32
 
+    @staticmethod
+    def _get_name_token_pattern(brackets: Dict[str, str]) -> re.Pattern:
+        """
+        One token per match: text in a bracket pair (one group per pair, from the left bracket to the first right
+        one, or to the end if it's not closed), or text up to the next left bracket (last group)
+        """
+        key = tuple(brackets.items())
+        pattern = AnimeProcessor._name_token_patterns.get(key, None)
+        if pattern is None:
+            tokens = [f"{re.escape(left)}([^{re.escape(right)}]*){re.escape(right)}?" for left, right in key]
+            tokens.append(f"([^{''.join(re.escape(_) for _ in brackets.keys())}]+)" if len(key) > 0 else "(.+)")
+            pattern = re.compile('|'.join(tokens))
+            AnimeProcessor._name_token_patterns[key] = pattern
+        return pattern
+
     @staticmethod
     def read_anime_file_name(anime: AnimeFileObject,
                              brackets: Dict[str, str] = ...,
@@ -187,19 +470,29 @@ class AnimeProcessor:
         """Parse filename and extract info like episode name and release group"""
         if not isinstance(anime.file, Path) or not anime.file.exists() or anime.file.is_dir():
             raise RuntimeError('File "%s" is invalid.', anime.file)
+        AnimeProcessor.parse_anime_file_name(anime, anime.file.stem, brackets, ignoring_left_brackets,
+                                             multiple_content_spliter)
+
+    @staticmethod
+    def parse_anime_file_name(anime: AnimeFileObject,
+                              title: str,
+                              brackets: Dict[str, str] = ...,
+                              ignoring_left_brackets: Set[str] = ...,
+                              multiple_content_spliter: Optional[str] = None,
+                              ) -> None:
+        """
+        `read_anime_file_name` without the file, `title` being the file name without extension.
+
+        "[Group] Episode Name - 01 [1080p][ABCD1234]": Release group is the first bracket at the very beginning, other
+        brackets are tags (see `process_tag`), and the text between them is joined into the episode name.
+        """
         if not isinstance(brackets, Dict):
             brackets = AnimeProcessor.brackets
-        if isinstance(ignoring_left_brackets, List):
-            for left_bracket in ignoring_left_brackets:
-                brackets.pop(left_bracket, None)
-
-        anime.episode_name = ""  # initialize episode name
-        title = anime.file.stem
-        left_brackets = tuple(brackets.keys())
+        if isinstance(ignoring_left_brackets, (List, Set)):
+            brackets = {left: right for left, right in brackets.items() if left not in ignoring_left_brackets}
 
-        # I can assume filename length > 0 right?
-        right_bracket = brackets.get(title[0], None)
         # Finding release group
+        right_bracket = brackets.get(title[0], None) if len(title) > 0 else None
         if right_bracket is not None:
             right_bracket_position = title.find(right_bracket)
             anime.release_group = title[1:right_bracket_position]
@@ -208,34 +501,177 @@ class AnimeProcessor:
             anime.release_group = None
         title = title.replace('_', ' ')
 
-        while len(title) > 0:
-            # treat text wrapped in brackets tags
-            if title.startswith(left_brackets):
-                right_bracket_position = title.find(brackets.get(title[0]))
-                if right_bracket_position == -1:
-                    right_bracket_position = len(title)
-                tag_content = title[1:right_bracket_position]
-                if multiple_content_spliter is not None:
-                    for tag_content_part in tag_content.split(multiple_content_spliter):
-                        AnimeProcessor.process_tag(anime, tag_content_part,
-                                                   known_omittable_tags=Constants.KNOWN_OMITTABLE_TAGS)
-                else:
-                    AnimeProcessor.process_tag(anime_object=anime, tag_content=tag_content,
-                                               known_omittable_tags=Constants.KNOWN_OMITTABLE_TAGS)
-                title = title[right_bracket_position + 1:].strip()  # no index out of range error
-                AnimeProcessor.logger.debug(str.format("title='{}', tag_content='{}'", title, tag_content))
+        known_omittable_tags = Constants.KNOWN_OMITTABLE_TAGS
+        episode_name_parts = list()
+        tag_contents = list()
+        text_group = len(brackets) + 1
+        after_tag = False
+        for token in AnimeProcessor._get_name_token_pattern(brackets).finditer(title):
+            if token.lastindex == text_group:
+                text = token.group(text_group).strip()
+                if len(text) > 0:
+                    episode_name_parts.append(text)
                 continue
+            # treat text wrapped in brackets tags
+            tag_content = token.group(token.lastindex)
+            if after_tag and token.end() == len(title) and len(token.group(0)) == len(tag_content) + 1:
+                # not closed, runs to the end of the name, which has no trailing spaces after a tag
+                tag_content = tag_content.rstrip()
+            after_tag = True
+            if multiple_content_spliter is not None:
+                for tag_content_part in tag_content.split(multiple_content_spliter):
+                    AnimeProcessor.process_tag(anime, tag_content_part, known_omittable_tags)
+                    tag_contents.append(tag_content_part)
+            else:
+                AnimeProcessor.process_tag(anime, tag_content, known_omittable_tags)
+                tag_contents.append(tag_content)
+        anime.episode_name = " ".join(episode_name_parts)
+        AnimeProcessor.parse_episode_info(anime, tag_contents)
+
+    @staticmethod
+    def parse_episode_info(anime: AnimeFileObject, tags: List[str] = ()) -> None:
+        """
+        Episode range, season, version and special out of a parsed name (`episode_name`, then `tags` in the order they
+        appear in the name). "[Group] Show S2 - 07v2 [1080p]" is series "Show S2", season 2, episode 7, version 2.
+        """
+        anime.episodes = anime.season = anime.version = anime.special = None
+        name = anime.episode_name if anime.episode_name is not None else ""
+        anime.series_title = name
+
+        match = AnimeProcessor.SEASON_EPISODE_PATTERN.search(name)
+        if match is None:
+            for match in AnimeProcessor.DASH_EPISODE_PATTERN.finditer(name):
+                pass  # the last one, titles may have numbers of their own
+        if match is not None:
+            anime.series_title = name[:match.start()].strip(' -.')
+            if 'season' in match.re.groupindex:
+                anime.season = int(match.group('season'))
+            if 'special' in match.re.groupindex and match.group('special') is not None:
+                anime.special = match.group('special')
+        else:
+            # "[Group][Show][07][1080p]"
+            for tag in tags:
+                match = AnimeProcessor.TAG_EPISODE_PATTERN.fullmatch(tag.strip())
+                if match is not None:
+                    break
+        if match is not None:
+            first = int(match.group('first'))
+            anime.episodes = (first, int(match.group('last')) if match.group('last') is not None else first)
+            if match.group('version') is not None:
+                anime.version = int(match.group('version'))
+
+        if anime.special is None:
+            special_match = AnimeProcessor.SPECIAL_PATTERN.search(name) if anime.episodes is None else None
+            if special_match is not None:
+                anime.series_title = name[:special_match.start()].strip(' -.')
+            else:
+                special_match = next(filter(None, (AnimeProcessor.SPECIAL_PATTERN.fullmatch(_.strip()) for _ in tags)),
+                                     None)
+            if special_match is not None:
+                anime.special = special_match.group('special')
+                if anime.episodes is None and special_match.group('number') is not None:
+                    anime.episodes = (int(special_match.group('number')), int(special_match.group('number')))
+        if anime.special is not None:
+            anime.special = anime.special.upper() if not anime.special.upper().startswith('SPECIAL') else 'SP'
+        if anime.version is None:
+            version_match = next(filter(None, (AnimeProcessor.VERSION_TAG_PATTERN.fullmatch(_.strip()) for _ in tags)),
+                                 None)
+            if version_match is not None:
+                anime.version = int(version_match.group(1))
+        if anime.season is None:
+            season_match = AnimeProcessor.SEASON_PATTERN.search(anime.series_title)
+            if season_match is not None:
+                anime.season = int(next(_ for _ in season_match.groups() if _ is not None))
+        if len(anime.series_title) == 0:
+            # series in a tag, the first one that's not a known tag or what's parsed above
+            anime.series_title = next((_ for _ in tags if _ in anime.non_omittable_tags
+                                       and AnimeProcessor.TAG_EPISODE_PATTERN.fullmatch(_.strip()) is None
+                                       and AnimeProcessor.SPECIAL_PATTERN.fullmatch(_.strip()) is None
+                                       and AnimeProcessor.VERSION_TAG_PATTERN.fullmatch(_.strip()) is None), "")
+
+    @staticmethod
+    def order_episode_files(files: List[Path], drop_old_versions: bool = False,
+                            brackets: Dict[str, str] = ...) -> List[Path]:
+        """
+        Sort `files` by series, season and episode (specials after regular episodes), only their names are read.
+        Files without an episode number keep their relative order, after the ones with.
+
+        :param drop_old_versions: Keep only the newest version ("07v2" over "07") of an episode from the same group.
+            The first file is kept if they are the same version.
+        """
+        anime_list = list()
+        for file in files:
+            anime = AnimeFileObject()
+            anime.file = file
+            anime.file_name = file.name
+            AnimeProcessor.parse_anime_file_name(anime, file.stem, brackets)
+            anime_list.append(anime)
+
+        if drop_old_versions:
+            newest: Dict[tuple, AnimeFileObject] = dict()
+            for anime in anime_list:
+                if anime.episodes is None and anime.special is None:
+                    continue
+                key = ((anime.release_group or "").casefold(), anime.series_title.casefold(), anime.season,
+                       anime.special, anime.episodes)
+                kept = newest.get(key, None)
+                if kept is None or (anime.version or 1) > (kept.version or 1):
+                    newest[key] = anime
+            kept = {id(_) for _ in newest.values()}
+            for anime in anime_list:
+                if (anime.episodes is not None or anime.special is not None) and id(anime) not in kept:
+                    AnimeProcessor.logger.info(f'Skipping "{anime.file_name}", there is a newer version')
+            anime_list = [_ for _ in anime_list if (_.episodes is None and _.special is None) or id(_) in kept]
+
+        # sort() is stable, files without episode info all get the same key
+        anime_list.sort(key=lambda anime: (True,) if anime.episodes is None and anime.special is None else (
+            False, anime.series_title.casefold(), anime.season or 0, anime.special is not None, anime.special or "",
+            anime.episodes or (0, 0), anime.version or 1))
+        return [_.file for _ in anime_list]
 
-            # not starting with brackets, treating the following texts as text
-            left_pointer = 0
-            while left_pointer < len(title) and title[left_pointer] not in left_brackets:
-                left_pointer += 1  # move pointer until reaching
-            if not HelperFunctions.is_string_empty(anime.episode_name):
-                anime.episode_name += " "
-            anime.episode_name += title[:left_pointer].strip()
-            title = title[left_pointer:]
-            AnimeProcessor.logger.debug(str.format("title='{}', episode_name='{}'", title, anime.episode_name))
-            continue
+    @staticmethod
+    def parse_anime_file_names(names: Iterable[Union[str, PurePath]],
+                               brackets: Dict[str, str] = ...,
+                               ignoring_left_brackets: Set[str] = ...,
+                               multiple_content_spliter: Optional[str] = None,
+                               strip_extension: bool = True,
+                               processes: int = 1,
+                               chunk_size: int = Constants.NAME_PARSE_CHUNK_SIZE,
+                               ) -> FileNameTable:
+        """
+        `parse_anime_file_name` on a lot of names at once, without touching the filesystem (files don't have to exist),
+        no probing or hashing. Good for cataloging or checking which episodes are already there.
+
+        :param names: File names or paths, rows of the result are in the same order
+        :param strip_extension: Drop the extension (`Path.stem`), turn it off if `names` are stems already
+        :param processes: Parse in this many processes, `chunk_size` names per task. Only pays off for huge lists.
+        """
+        names = [_.__str__() for _ in names]
+        processes = max(1, processes)
+        chunk_size = max(1, chunk_size)
+        parse_chunk = functools.partial(AnimeProcessor._parse_anime_file_name_chunk, brackets=brackets,
+                                        ignoring_left_brackets=ignoring_left_brackets,
+                                        multiple_content_spliter=multiple_content_spliter,
+                                        strip_extension=strip_extension)
+        if processes == 1 or len(names) <= chunk_size:
+            return parse_chunk(names)
+        table = FileNameTable()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as executor:
+            for chunk_table in executor.map(parse_chunk, [names[_:_ + chunk_size]
+                                                          for _ in range(0, len(names), chunk_size)]):
+                table.extend(chunk_table)
+        return table
+
+    @staticmethod
+    def _parse_anime_file_name_chunk(names: List[str], brackets: Dict[str, str], ignoring_left_brackets: Set[str],
+                                     multiple_content_spliter: Optional[str], strip_extension: bool) -> FileNameTable:
+        table = FileNameTable()
+        for name in names:
+            anime = AnimeFileObject()
+            AnimeProcessor.parse_anime_file_name(anime, PurePath(name).stem if strip_extension else name, brackets,
+                                                 ignoring_left_brackets, multiple_content_spliter)
+            table.append(name, anime)
+        return table
 
     @staticmethod
     def read_anime_file(file: Path,
@@ -245,7 +681,11 @@ class AnimeProcessor:
                         brackets: Dict[str, str] = ...,
                         ignoring_left_brackets: Set[str] = ...,
                         skip_crc32: bool = False,
-                        tag_content_spliter: Optional[str] = None) -> Optional[AnimeFileObject]:
+                        tag_content_spliter: Optional[str] = None,
+                        crc32_workers: int = 1,
+                        probe_result: Optional[dict] = None,
+                        probe_profile: Optional[str] = None,
+                        count_packets: Optional[bool] = None) -> Optional[AnimeFileObject]:
         """
         Read information from a video file using ffprobe.
         This function calls all other "read_anime_file_XXX" function
@@ -260,6 +700,11 @@ class AnimeProcessor:
         :param ignoring_left_brackets: Ignore a specific set of bracket presented in "brackets" argument.
         :param tag_content_spliter:  Pass a spliter to deal with some releases that put multiple tags in one brackets.
         :param skip_crc32:
+        :param crc32_workers: Number of threads hashing the file, see `HelperFunctions.get_file_crc32`
+        :param probe_result: Already probed (e.g. by `probe_files`), only hash and parse file name
+        :param probe_profile: One of `ProbeProfile`, defaults to `Constants.PROBE_PROFILE`
+        :param count_packets: Count video packets if the frame count is only an estimate, while hashing.
+            Defaults to `Constants.COUNT_PACKETS`.
         :return Return `None` if parse failed.
         """
 
@@ -271,9 +716,6 @@ class AnimeProcessor:
             abort_signal = None
         if not isinstance(brackets, Dict):
             brackets = AnimeProcessor.brackets
-        if isinstance(ignoring_left_brackets, Set):
-            for left_bracket in ignoring_left_brackets:
-                brackets.pop(left_bracket, None)
         if tag_content_spliter is not None:
             tag_content_spliter = tag_content_spliter.replace('_', " ")
 
@@ -283,18 +725,117 @@ class AnimeProcessor:
             anime.file = file
             anime.file_name = file.name
 
-            probe_result = AnimeProcessor.probe_file(file=file, ffprobe_path=ffprobe)
-            AnimeProcessor.read_anime_file_probe_result(anime, probe_result)
-
-            if not skip_crc32:
-                AnimeProcessor.read_anime_file_crc32(anime, on_bytes_read_callback, abort_signal)
+            def read_streams(probe_result: Optional[dict]) -> None:
+                if probe_result is None:
+                    probe_result = AnimeProcessor.probe_file(file=file, ffprobe_path=ffprobe, profile=probe_profile)
+                AnimeProcessor.read_anime_file_streams(anime, probe_result, ffprobe, probe_profile, count_packets)
+
+            # ffprobe runs in a child process, so hash the file while waiting for it instead of after it
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as probe_executor:
+                probe_future = probe_executor.submit(read_streams, probe_result)
+                if not skip_crc32:
+                    # no point finishing the hash if ffprobe can't read the file
+                    probe_failed = lambda: probe_future.done() and probe_future.exception() is not None
+                    AnimeProcessor.read_anime_file_crc32(
+                        anime, on_bytes_read_callback,
+                        probe_failed if abort_signal is None else lambda: abort_signal() or probe_failed(),
+                        crc32_workers
+                    )
+                probe_future.result()
 
             AnimeProcessor.read_anime_file_name(anime=anime, brackets=brackets,
+                                                ignoring_left_brackets=ignoring_left_brackets,
                                                 multiple_content_spliter=tag_content_spliter)
             return anime
         except subprocess.SubprocessError:
             return None
 
+    @staticmethod
+    def read_anime_files(files: List[Path],
+                         max_workers: int = 4,
+                         ffprobe: str = ffprobe,
+                         on_bytes_read_callback: Optional[Callable[[int], None]] = ...,
+                         on_file_read: Optional[Callable[[int, Path, Optional[AnimeFileObject], Optional[Exception]], None]] = ...,
+                         abort_signal: Optional[Callable[[], bool]] = ...,
+                         brackets: Dict[str, str] = ...,
+                         ignoring_left_brackets: Set[str] = ...,
+                         skip_crc32: bool = False,
+                         tag_content_spliter: Optional[str] = None,
+                         crc32_workers: int = 1,
+                         probe_profile: Optional[str] = None) -> List[Optional[AnimeFileObject]]:
+        """
+        Batch version of `read_anime_file`. Files are probed `Constants.PROBE_WORKERS` at a time (see `probe_files`),
+        and each one is hashed as soon as its own probe is done, up to `max_workers` files at the same time. So
+        hashing the first files overlaps probing the rest, and the whole batch takes about max(probe, hash).
+
+        :param files: Video files to read
+        :param max_workers: Maximum number of files being read concurrently
+        :param on_bytes_read_callback: Called with chunk size whenever any file has a chunk hashed. Shared by all files,
+            so the total is the sum of all file sizes. Calls are serialized.
+        :param on_file_read: (index, file, result, exception) Called once per file upon completion, in completion order.
+            `result` is `None` if file cannot be read, and `exception` is the reason if it's an error other than ffprobe's.
+        :param abort_signal: A callable that returns a boolean. Files not yet started are skipped once it returns True.
+        :param crc32_workers: Number of threads hashing each file, see `HelperFunctions.get_file_crc32`
+        :param probe_profile: One of `ProbeProfile`, defaults to `Constants.PROBE_PROFILE`
+        :return: A list of `AnimeFileObject` in the same order as `files`, `None` for file that cannot be read or skipped.
+        """
+        if not isinstance(abort_signal, Callable):
+            abort_signal = lambda: False
+        if not isinstance(on_file_read, Callable):
+            on_file_read = lambda idx, file, result, exception: ...
+        # always pass a callback, or each `read_anime_file` will draw its own progress bar
+        callback_lock = threading.Lock()
+        if isinstance(on_bytes_read_callback, Callable):
+            def on_chunk_read(chunk_size: int) -> None:
+                with callback_lock:
+                    on_bytes_read_callback(chunk_size)
+        else:
+            on_chunk_read = lambda chunk_size: ...
+
+        # probing is mostly process start up (or nothing at all with PyAV), hashing is disk bound, so they get
+        # separate pools. Files that can't be probed aren't hashed.
+        def read_one(file: Path, probe_result: Optional[dict]) -> Optional[AnimeFileObject]:
+            if abort_signal():
+                return None
+            if probe_result is None:
+                if not file.is_file():
+                    raise FileNotFoundError(f'File "{file.__str__()}" is invalid.')
+                return None
+            return AnimeProcessor.read_anime_file(
+                file=file, ffprobe=ffprobe, on_bytes_read_callback=on_chunk_read, abort_signal=abort_signal,
+                brackets=brackets, ignoring_left_brackets=ignoring_left_brackets, skip_crc32=skip_crc32,
+                tag_content_spliter=tag_content_spliter, crc32_workers=crc32_workers, probe_result=probe_result,
+                probe_profile=probe_profile
+            )
+
+        results: List[Optional[AnimeFileObject]] = [None] * len(files)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, Constants.PROBE_WORKERS)) as probe_executor, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            probe_indexes = {
+                probe_executor.submit(AnimeProcessor._probe_file_or_none, file, ffprobe, True, None, probe_profile,
+                                      abort_signal): idx
+                for idx, file in enumerate(files)
+            }
+            future_indexes = dict()
+            pending = set(probe_indexes)
+            while len(pending) > 0:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    if future in probe_indexes:  # probed, hash it
+                        idx = probe_indexes[future]
+                        read_future = executor.submit(read_one, files[idx], future.result())
+                        future_indexes[read_future] = idx
+                        pending.add(read_future)
+                        continue
+                    idx = future_indexes[future]
+                    exception = future.exception()
+                    if exception is not None:
+                        AnimeProcessor.logger.error(f'Cannot read file "{files[idx]}": {exception}')
+                    else:
+                        results[idx] = future.result()
+                    on_file_read(idx, files[idx], results[idx], exception)
+        return results
+
     @staticmethod
     def compile_encode_param(anime_file: AnimeFileObject,
                              output_file_path: Path,
@@ -304,7 +845,8 @@ class AnimeProcessor:
                              select_subtitle_streams: Set[Union[int, str]] = ...,
                              select_attachment_streams: Set[Union[int, str]] = ...,
                              ffmpeg: str = ffmpeg,
-                             ignore_warning: bool = False
+                             ignore_warning: bool = False,
+                             pipe_output_format: Optional[str] = None
                              ) -> List[str]:
         """
         
@@ -317,6 +859,8 @@ class AnimeProcessor:
         :param select_attachment_streams: Specify attachment stream(s) to encode
         :param ffmpeg: Specify ffmpeg executable
         :param ignore_warning:
+        :param pipe_output_format: Write output to stdout in this format (ffmpeg "-f" value) instead of writing
+            to `output_file_path`. Only use it for formats that don't seek, see `Constants.PIPE_SAFE_CONTAINER_FORMATS`
         :return:
         """
         command_args = [ffmpeg]
@@ -390,7 +934,10 @@ class AnimeProcessor:
             command_args.extend(['-map_chapters', '-1'])
         command_args.extend(extra_options)
 
-        command_args.extend([output_file_path.absolute().__str__(), '-y'])
+        if pipe_output_format is not None:
+            command_args.extend(['-f', pipe_output_format, 'pipe:1'])
+        else:
+            command_args.extend([output_file_path.absolute().__str__(), '-y'])
         debug_args = [_ if ' ' not in _ else f'"{_}"' for _ in command_args]
         AnimeProcessor.logger.debug(f"Encode param: {' '.join(debug_args)}")
 
@@ -404,58 +951,121 @@ class AnimeProcessor:
             progress_update_callback_string: Callable[[str], None] = Ellipsis,
             abort_signal: Callable[[], bool] = Ellipsis,
             show_ffmpeg_stdout: bool = False,
+            on_output_chunk: Optional[Callable[[bytes], None]] = None,
+            progress_update_callback_object: Callable[[FFmpegProgress], None] = Ellipsis,
+            on_process_started: Optional[Callable[[subprocess.Popen], None]] = None,
     ) -> Tuple[Optional[int], str]:
         """
         todo: lambdas used here are hurting future me (why the fuck did I use 2 parameters?)
 
+        Progress is read from ffmpeg's "-progress" key=value output on its own pipe, so the console output is only
+        kept for error messages. (Windows can't pass an extra fd, stdout is used unless it carries the encoded file;
+        if it does, progress falls back to scraping "frame=" from the console output.)
+
         :param anime_src_info:
         :param subprocess_args:
         :param progress_update_callback_integer: A function taking two integer arguments. First one is encoded_frame_count, second one is total_frame_count
-        :param progress_update_callback_string: FFmpeg's progress stdout will be passed into this function.
+        :param progress_update_callback_string: A one line progress summary (frame, fps, bitrate, time, size, speed) will be passed into this function.
         :param abort_signal: A function returns a boolean, which indicates if the process should terminate.
         :param show_ffmpeg_stdout: Print ffmpeg console output (replaces the default progress bar)
+        :param on_output_chunk: Set this if ffmpeg writes its output to stdout ("pipe:1").
+            Output bytes are passed into it as they come out, from a separate thread.
+        :param progress_update_callback_object: Receives every progress update as a `FFmpegProgress`
+        :param on_process_started: Receives the ffmpeg `Popen` right after it's started
         :return: return code, return message
         """
         bar = alive_progress.alive_bar(anime_src_info.video_frame_count, title="Encoding", unit="frames",
                                        theme='classic')
         on_frame_encoded = progress_update_callback_integer
         on_string_progress_returned = progress_update_callback_string
+        on_progress_returned = progress_update_callback_object
         progress_bar_enabled = not show_ffmpeg_stdout  # for the sake of readability
 
-        get_current_frame_expression = re.compile(r'frame= *(\d+)')
-
         if not isinstance(progress_update_callback_string, Callable) or show_ffmpeg_stdout:
             on_string_progress_returned = lambda progress_str: ...
+        if not isinstance(progress_update_callback_object, Callable):
+            on_progress_returned = lambda progress: ...
         if not isinstance(progress_update_callback_integer, Callable):
             if show_ffmpeg_stdout:
                 on_frame_encoded = lambda encoded_frame_count, total_frame_count: ...
             else:
                 update_progress = bar.__enter__()
                 update_progress(-1)
-                on_frame_encoded = lambda encoded_frame_count, total_frame_count: update_progress(
-                    encoded_frame_count - update_progress.current)
+
+                def on_frame_encoded(encoded_frame_count: int, total_frame_count: int) -> None:
+                    update_progress(encoded_frame_count - update_progress.current)
+                if not isinstance(progress_update_callback_object, Callable):
+                    on_progress_returned = lambda progress: update_progress.text(
+                        f"{progress.fps or 0:.1f} fps, {progress.speed or 0:.2f}x")
         proc = None
-        last_stdout = list()
+        last_stdout: Deque[str] = collections.deque(maxlen=10)
         if not isinstance(abort_signal, Callable):
             abort_signal = lambda: False
+        # when stdout carries the encoded file, ffmpeg's console output is read from stderr instead
+        piping_output = isinstance(on_output_chunk, Callable)
+
+        progress_read_fd, progress_write_fd = os.pipe() if os.name == 'posix' else (None, None)
+        if progress_write_fd is not None:
+            progress_target = f"pipe:{progress_write_fd}"
+        elif not piping_output:
+            progress_target = "pipe:1"
+        else:
+            progress_target = None
+        if progress_target is not None:
+            # "-progress" is a global option, put it right after the executable
+            subprocess_args = [subprocess_args[0], '-progress', progress_target] + \
+                ([] if show_ffmpeg_stdout else ['-nostats']) + subprocess_args[1:]
         try:
-            with subprocess.Popen(args=subprocess_args, shell=False, stderr=subprocess.STDOUT, stdout=subprocess.PIPE,
-                                  universal_newlines=True) as proc:
-                while proc.poll() is None:
-                    stdout = proc.stdout.readline()
-                    if show_ffmpeg_stdout:
-                        print(stdout, end='')
-                    stdout = stdout.strip()
-                    if stdout != '':
-                        last_stdout.append(stdout)
-                    frame = get_current_frame_expression.match(stdout)
-                    if frame is not None:
-                        on_frame_encoded(int(frame.groups()[0]), anime_src_info.video_frame_count)
-                        on_string_progress_returned(stdout)
-                    if abort_signal():
-                        AnimeProcessor.logger.info("Abort signal received. Shutting down ffmpeg...")
-                        proc.terminate()
-                        return None, "Aborted"
+            with subprocess.Popen(args=subprocess_args, shell=False,
+                                  stdin=subprocess.PIPE,  # for stop_ffmpeg(), also keeps ffmpeg off the terminal
+                                  stdout=subprocess.PIPE if piping_output or progress_target == "pipe:1"
+                                  else subprocess.DEVNULL,
+                                  stderr=subprocess.PIPE,
+                                  pass_fds=(progress_write_fd,) if progress_write_fd is not None else ()) as proc:
+                if progress_write_fd is not None:
+                    # ffmpeg has its own copy, progress stream ends when ffmpeg closes it
+                    os.close(progress_write_fd)
+                    progress_write_fd = None
+                if isinstance(on_process_started, Callable):
+                    on_process_started(proc)
+                output_thread = None
+                if piping_output:
+                    output_thread = threading.Thread(
+                        target=AnimeProcessor._copy_output_stream, args=(proc.stdout, on_output_chunk), daemon=True)
+                    output_thread.start()
+                console_output = io.TextIOWrapper(proc.stderr, errors='replace')
+                console_thread = None
+                if progress_target is None:
+                    progress_updates = AnimeProcessor._read_console_progress(
+                        console_output, last_stdout, show_ffmpeg_stdout)
+                else:
+                    console_thread = threading.Thread(
+                        target=AnimeProcessor._read_console_output,
+                        args=(console_output, last_stdout, show_ffmpeg_stdout), daemon=True)
+                    console_thread.start()
+                    progress_stream = open(progress_read_fd, 'rb') if progress_read_fd is not None else proc.stdout
+                    progress_read_fd = None  # closed along with progress_stream
+                    progress_updates = AnimeProcessor._read_progress_stream(progress_stream)
+                try:
+                    for progress in progress_updates:
+                        on_frame_encoded(progress.frame, anime_src_info.video_frame_count)
+                        on_string_progress_returned(progress.__str__())
+                        on_progress_returned(progress)
+                        if abort_signal():
+                            AnimeProcessor.logger.info("Abort signal received. Shutting down ffmpeg...")
+                            # progress stream stays open until ffmpeg exits, it still writes into it while finishing
+                            AnimeProcessor.stop_ffmpeg(proc)
+                            progress_updates.close()
+                            return None, "Aborted"
+                except KeyboardInterrupt:
+                    # ffmpeg got the Ctrl+C too, it needs its pipes open while it finishes the file
+                    AnimeProcessor.stop_ffmpeg(proc)
+                    raise
+                proc.wait()
+                if console_thread is not None:
+                    console_thread.join()
+                if output_thread is not None:
+                    output_thread.join()  # stdout is closed when leaving "with", drain it first
             if not isinstance(progress_update_callback_integer, Callable) and progress_bar_enabled:
                 bar.__exit__(None, None, None)
             AnimeProcessor.logger.debug("encode complete")
@@ -465,10 +1075,7 @@ class AnimeProcessor:
                 bar.__exit__(None, None, None)
             AnimeProcessor.logger.info("User pressed Ctrl+C.")
             if isinstance(proc, subprocess.Popen):
-                proc.send_signal(signal.SIGTERM)
-                AnimeProcessor.logger.info("Shutting down ffmpeg...")
-            while proc.poll() is None:
-                pass
+                AnimeProcessor.stop_ffmpeg(proc)
             return None, "User pressed Ctrl+C."
         except Exception as ex:
             # in case my code went wrong...
@@ -476,25 +1083,132 @@ class AnimeProcessor:
                 bar.__exit__(None, None, None)
             AnimeProcessor.logger.error(f"Application error: {ex.__str__()}")
             if isinstance(proc, subprocess.Popen):
-                proc.send_signal(signal.SIGTERM)
                 AnimeProcessor.logger.info("Shutting down ffmpeg...")
+                AnimeProcessor.stop_ffmpeg(proc)
             return None, f"Application error: {ex.__str__()}"
+        finally:
+            for fd in (progress_read_fd, progress_write_fd):
+                if fd is not None:
+                    os.close(fd)
 
         if proc is None:
             return None, "Subprocess not created"
         if proc.returncode == 0:
             return proc.returncode, ""
-        last_stdout = last_stdout[-10:]
-        last_stdout.insert(0, "Last 10 output: ")
-        return proc.returncode, "\n".join(last_stdout)
+        return proc.returncode, "\n".join(["Last 10 output: "] + list(last_stdout))
+
+    @staticmethod
+    def stop_ffmpeg(proc: subprocess.Popen,
+                    quit_timeout: float = Constants.FFMPEG_QUIT_TIMEOUT,
+                    terminate_timeout: float = Constants.FFMPEG_TERMINATE_TIMEOUT) -> Optional[int]:
+        """
+        Stop a running ffmpeg and wait for it to exit. Asks nicely first ("q" on stdin, so the output gets its
+        trailer / index and stays playable), then SIGTERM, then SIGKILL.
+
+        :param proc: ffmpeg started with `stdin=subprocess.PIPE` (otherwise it goes straight to SIGTERM)
+        :param quit_timeout: Seconds to wait for ffmpeg to finish the file after "q"
+        :param terminate_timeout: Seconds to wait after SIGTERM before SIGKILL
+        :return: ffmpeg return code
+        """
+        if proc.poll() is not None:
+            return proc.returncode
+        if proc.stdin is not None and not proc.stdin.closed:
+            try:
+                proc.stdin.write(b'q')
+                proc.stdin.close()
+                return proc.wait(timeout=quit_timeout)
+            except OSError:
+                pass  # broken pipe, already on its way out, SIGTERM makes it finish up the same way
+            except subprocess.TimeoutExpired:
+                AnimeProcessor.logger.warning(f"ffmpeg (pid {proc.pid}) still running, sending SIGTERM")
+        proc.terminate()
+        try:
+            return proc.wait(timeout=terminate_timeout)
+        except subprocess.TimeoutExpired:
+            AnimeProcessor.logger.warning(f"ffmpeg (pid {proc.pid}) ignored SIGTERM, killing it")
+            proc.kill()
+            return proc.wait()
+
+    @staticmethod
+    def _read_progress_stream(stream: BinaryIO) -> Iterator[FFmpegProgress]:
+        """Parse ffmpeg "-progress" output block by block, each block ends with a "progress=continue|end" line"""
+        fields: Dict[str, str] = dict()
+        with stream:
+            for line in stream:
+                progress = AnimeProcessor._parse_progress_line(line, fields)
+                if progress is not None:
+                    yield progress
+
+    @staticmethod
+    def _parse_progress_line(line: bytes, fields: Dict[str, str]) -> Optional[FFmpegProgress]:
+        """Collect one "-progress" line into `fields`, returns the block once it's complete (and empties `fields`)"""
+        key, separator, value = line.partition(b'=')
+        if not separator:
+            return None
+        key = key.strip().decode('ascii', errors='replace')
+        if key not in FFmpegProgress.KEYS:
+            return None
+        fields[key] = value.strip().decode('ascii', errors='replace')
+        if key != 'progress':
+            return None
+        progress = FFmpegProgress.from_fields(fields)
+        fields.clear()
+        return progress
+
+    @staticmethod
+    def _read_console_output(console_output: TextIO, last_stdout: Deque[str], show_ffmpeg_stdout: bool) -> None:
+        try:
+            for line in console_output:
+                if show_ffmpeg_stdout:
+                    print(line, end='')
+                line = line.strip()
+                if line != '':
+                    last_stdout.append(line)
+        except (ValueError, OSError) as ex:
+            AnimeProcessor.logger.debug(f"Console output closed: {ex}")
+
+    @staticmethod
+    def _read_console_progress(console_output: TextIO, last_stdout: Deque[str],
+                               show_ffmpeg_stdout: bool) -> Iterator[FFmpegProgress]:
+        """Fallback when there's no pipe left for "-progress": only frame count from the status line"""
+        get_current_frame_expression = re.compile(r'frame= *(\d+)')
+        for line in console_output:
+            if show_ffmpeg_stdout:
+                print(line, end='')
+            line = line.strip()
+            if line != '':
+                last_stdout.append(line)
+            frame = get_current_frame_expression.match(line)
+            if frame is not None:
+                progress = FFmpegProgress()
+                progress.frame = int(frame.groups()[0])
+                yield progress
+
+    @staticmethod
+    def _copy_output_stream(stream: BinaryIO, on_output_chunk: Callable[[bytes], None],
+                            chunk_size: int = 1024 * 1024) -> None:
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                on_output_chunk(chunk)
+        except (ValueError, OSError) as ex:
+            # pipe closed under us, which happens when encode is aborted
+            AnimeProcessor.logger.debug(f"Output stream closed: {ex}")
 
     @staticmethod
     def build_rename_keyword_replacement(
             source_anime_object: AnimeFileObject, encoded_anime_file: Path,
             encoded_anime_object: Optional[AnimeFileObject] = ..., ffprobe: str = ffprobe,
             encode_preset_object: Optional[EncodePresetObject] = None,
-            on_byte_read_callback: Optional[Callable[[int], None]] = ...
+            on_byte_read_callback: Optional[Callable[[int], None]] = ...,
+            encoded_crc32: Optional[str] = None
     ) -> Dict[str, Union[str, int]]:
+        """
+        :param encoded_crc32: CRC32 of the encoded file if it's already known. Otherwise, the encoded file will be
+            read again to calculate it (only if preset naming has "{crc32}").
+        """
         assert isinstance(source_anime_object,
                           AnimeFileObject), f"Invalid input source_anime_object: expect {type(AnimeFileObject)}, got {type(source_anime_object)}"
 
@@ -510,12 +1224,18 @@ class AnimeProcessor:
             )
 
         AnimeProcessor.read_anime_file_probe_result(
-            encoded_anime_object, AnimeProcessor.probe_file(encoded_anime_object.file, ffprobe)
+            encoded_anime_object, AnimeProcessor.probe_file(encoded_anime_object.file, ffprobe, use_cache=False)
         )
 
+        episode = None
+        if source_anime_object.episodes is not None:
+            first, last = source_anime_object.episodes
+            episode = f"{first:02d}" if first == last else f"{first:02d}-{last:02d}"  # "07", "01-12"
         kw_replace_dict = {
             "{release_group}": source_anime_object.release_group,
             "{episode_name}": source_anime_object.episode_name,
+            "{episode}": episode,
+            "{season}": None if source_anime_object.season is None else f"{source_anime_object.season:02d}",
             "{resolution_width}": encoded_anime_object.video_resolution[0],
             "{resolution_height}": encoded_anime_object.video_resolution[1],
             "{tags}": encode_preset_object.tag_divider.join(source_anime_object.non_omittable_tags),
@@ -526,7 +1246,10 @@ class AnimeProcessor:
                 kw_replace_dict[k] = ""
 
         if "{crc32}" in encode_preset_object.naming:
-            AnimeProcessor.read_anime_file_crc32(encoded_anime_object, on_byte_read_callback)
+            if encoded_crc32 is not None:
+                encoded_anime_object.crc32 = (encoded_crc32, None)
+            else:
+                AnimeProcessor.read_anime_file_crc32(encoded_anime_object, on_byte_read_callback, use_cache=False)
             kw_replace_dict["{crc32}"] = encoded_anime_object.crc32[0]
 
         return kw_replace_dict
@@ -574,6 +1297,10 @@ class AnimeProcessor:
             encode_progress_callback: Optional[Callable[[int, int], None]] = ...,  # why am I compliating myself...
             show_ffmpeg_stdout: bool = False,
             abort_signal: Optional[Callable[[], bool]] = ...,
+            encode_progress_object_callback: Optional[Callable[[FFmpegProgress], None]] = ...,
+            on_stage_changed: Optional[Callable[[str, Path], None]] = ...,
+            on_process_started: Optional[Callable[[subprocess.Popen], None]] = None,
+            segment_jobs: int = 1,
     ) -> Tuple[Optional[Path], bool]:
         """
 
@@ -587,36 +1314,117 @@ class AnimeProcessor:
         :param encode_progress_callback:
         :param show_ffmpeg_stdout:
         :param abort_signal:
+        :param encode_progress_object_callback: Receives ffmpeg progress (fps, bitrate, speed...) as `FFmpegProgress`
+        :param on_stage_changed: Called with an `EncodeStage` (ENCODING, ENCODED, RENAMED) and the output file path
+            at that point, so an interrupted encode can be cleaned up or finished later.
+        :param on_process_started: Receives the ffmpeg `Popen` once started (e.g. to suspend it)
+        :param segment_jobs: Above 1, video is cut at keyframes and that many segments are encoded at the same time,
+            see `SegmentEncoder`. Needs exactly one selected video stream, otherwise encoded in one piece.
         :return: Path object of encoded file if encode successful, and an is_aborted mark
         """
+        if not isinstance(on_stage_changed, Callable):
+            on_stage_changed = lambda stage, file: ...
         if not isinstance(selected_streams, Set):
             selected_streams = source_file_object.get_all_stream_indexes()
         if not isinstance(output_dir, Path) or not Path(source_file_object.file.root).exists():
             raise NotADirectoryError('Output directory "%s" is invalid.', output_dir)
-        output_file_extension: Optional[str] = encode_preset.stream_params.get("container", None)
-        if not isinstance(output_file_extension, str):
-            output_file_extension = Defaults.CONTAINER[0]
-        # fixme: Should I move all miscellaneous options like naming and container and tag divider into a Json file?
-        num = 1
-        output_file = output_dir / f"{source_file_object.file.stem}_{num}{output_file_extension}"
-        while output_file.exists():
-            num += 1
-            output_file = output_dir / f"{source_file_object.file.stem}_{num}{output_file_extension}"
+        output_file = AnimeProcessor._reserve_output_file(output_dir, source_file_object, encode_preset)
+        output_file_extension = output_file.suffix
+        on_stage_changed(EncodeStage.ENCODING, output_file)
+
+        selected_video_streams = source_file_object.video_stream_indexes.intersection(selected_streams)
+        segment_plan = None
+        if segment_jobs > 1 and len(selected_video_streams) == 1:
+            from python_encode.segment_encoder import SegmentEncoder  # it builds on AnimeProcessor
+            try:
+                segment_plan = SegmentEncoder.plan(source_file_object, list(selected_video_streams)[0], segment_jobs,
+                                                   ffprobe_executable)
+            except subprocess.SubprocessError as ex:
+                AnimeProcessor.logger.warning(f"Cannot find keyframes, encoding in one piece: {ex}")
+            if segment_plan is None:
+                AnimeProcessor.logger.info(f'"{source_file_object.file_name}" is too short to cut, '
+                                           f'encoding in one piece')
+            else:
+                AnimeProcessor.logger.debug(segment_plan)
+        if segment_plan is not None:
+            returned_code, error_text = SegmentEncoder.encode(
+                source_file_object=source_file_object, output_file=output_file, plan=segment_plan,
+                encode_preset=encode_preset, segment_jobs=segment_jobs,
+                select_audio_streams=sorted(source_file_object.audio_stream_indexes.intersection(selected_streams)),
+                select_subtitle_streams=sorted(
+                    source_file_object.subtitle_stream_indexes.intersection(selected_streams)),
+                select_attachment_streams=sorted(
+                    source_file_object.attachment_stream_indexes.intersection(selected_streams)),
+                ffmpeg_executable=ffmpeg_executable, ffprobe_executable=ffprobe_executable,
+                encode_progress_callback=encode_progress_callback, show_ffmpeg_stdout=show_ffmpeg_stdout,
+                abort_signal=abort_signal, encode_progress_object_callback=encode_progress_object_callback,
+                on_process_started=on_process_started
+            )
+            return AnimeProcessor._finish_encode(source_file_object, output_file, encode_preset, ffprobe_executable,
+                                                 returned_code, error_text, on_stage_changed)
+
+        # if the name needs encoded file's crc32, hash it on its way to disk instead of reading it again afterwards.
+        # only possible if the container can be written to a pipe.
+        pipe_output_format = Constants.PIPE_SAFE_CONTAINER_FORMATS.get(output_file_extension.lower(), None)
+        output_writer: Optional[HashingFileWriter] = None
+        if "{crc32}" in encode_preset.naming and pipe_output_format is not None:
+            output_writer = HashingFileWriter(output_file)
 
         encode_command_args = AnimeProcessor.compile_encode_param(
             anime_file=source_file_object, output_file_path=output_file, encode_preset_object=encode_preset,
-            select_video_streams=source_file_object.video_stream_indexes.intersection(selected_streams),
+            select_video_streams=selected_video_streams,
             select_audio_streams=source_file_object.audio_stream_indexes.intersection(selected_streams),
             select_subtitle_streams=source_file_object.subtitle_stream_indexes.intersection(selected_streams),
             select_attachment_streams=source_file_object.attachment_stream_indexes.intersection(selected_streams),
-            ffmpeg=ffmpeg_executable
+            ffmpeg=ffmpeg_executable,
+            pipe_output_format=pipe_output_format if output_writer is not None else None
         )
 
-        returned_code, error_text = AnimeProcessor.calling_subprocess_encode(
-            anime_src_info=source_file_object, subprocess_args=encode_command_args,
-            progress_update_callback_integer=encode_progress_callback, abort_signal=abort_signal,
-            show_ffmpeg_stdout=show_ffmpeg_stdout
-        )
+        try:
+            returned_code, error_text = AnimeProcessor.calling_subprocess_encode(
+                anime_src_info=source_file_object, subprocess_args=encode_command_args,
+                progress_update_callback_integer=encode_progress_callback, abort_signal=abort_signal,
+                show_ffmpeg_stdout=show_ffmpeg_stdout,
+                on_output_chunk=output_writer.write if output_writer is not None else None,
+                progress_update_callback_object=encode_progress_object_callback,
+                on_process_started=on_process_started
+            )
+        finally:
+            if output_writer is not None:
+                output_writer.close()
+        return AnimeProcessor._finish_encode(source_file_object, output_file, encode_preset, ffprobe_executable,
+                                             returned_code, error_text, on_stage_changed,
+                                             output_writer.crc32 if output_writer is not None else None)
+
+    @staticmethod
+    def _reserve_output_file(output_dir: Path, source_file_object: AnimeFileObject,
+                             encode_preset: EncodePresetObject) -> Path:
+        """Create an empty "<source stem>_<n><container>" in `output_dir` for ffmpeg to write to"""
+        output_file_extension: Optional[str] = encode_preset.stream_params.get("container", None)
+        if not isinstance(output_file_extension, str):
+            output_file_extension = Defaults.CONTAINER[0]
+        # fixme: Should I move all miscellaneous options like naming and container and tag divider into a Json file?
+        num = 1
+        output_file = output_dir / f"{source_file_object.file.stem}_{num}{output_file_extension}"
+        while True:
+            try:
+                # create it right away, so encodes running in parallel won't pick the same name
+                output_file.touch(exist_ok=False)
+                return output_file
+            except FileExistsError:
+                num += 1
+                output_file = output_dir / f"{source_file_object.file.stem}_{num}{output_file_extension}"
+
+    @staticmethod
+    def _finish_encode(source_file_object: AnimeFileObject, output_file: Path, encode_preset: EncodePresetObject,
+                       ffprobe_executable: str, returned_code: Optional[int], error_text: str,
+                       on_stage_changed: Callable[[str, Path], None],
+                       encoded_crc32: Optional[str] = None) -> Tuple[Optional[Path], bool]:
+        """Rest of `process_anime_encode` once ffmpeg is done: clean up or rename"""
+        if returned_code is None or returned_code != 0:
+            # don't leave the placeholder behind if ffmpeg didn't get to write anything
+            if output_file.is_file() and output_file.stat().st_size == 0:
+                output_file.unlink()
         if returned_code is None:
             AnimeProcessor.logger.info(f"Encode canceled: {error_text}")
             return None, True
@@ -624,16 +1432,41 @@ class AnimeProcessor:
             AnimeProcessor.logger.error(f"Encode process returned non-zero exit code ({returned_code}): {error_text}")
             return None, False
 
-        encoded_file_object = AnimeFileObject()
-        naming_kw_replacement = AnimeProcessor.build_rename_keyword_replacement(
-            source_anime_object=source_file_object, encoded_anime_file=output_file,
-            encoded_anime_object=encoded_file_object, ffprobe=ffprobe_executable, encode_preset_object=encode_preset,
+        on_stage_changed(EncodeStage.ENCODED, output_file)
+        output_file = AnimeProcessor.rename_encoded_anime_file(
+            source_file_object=source_file_object, encoded_file=output_file, encode_preset=encode_preset,
+            ffprobe_executable=ffprobe_executable, encoded_crc32=encoded_crc32
         )
+        on_stage_changed(EncodeStage.RENAMED, output_file)
+        return output_file, False
 
-        output_file = AnimeProcessor.rename_encoded_file(
-            naming_template=encode_preset.naming, encoded_file=output_file, keyword_replacement=naming_kw_replacement
+    @staticmethod
+    def rename_encoded_anime_file(
+            source_file_object: AnimeFileObject,
+            encoded_file: Path,
+            encode_preset: EncodePresetObject,
+            ffprobe_executable: str = ffprobe,
+            encoded_crc32: Optional[str] = None
+    ) -> Path:
+        """
+        Last step of `process_anime_encode`, apply preset naming to a finished encode.
+
+        :param encoded_crc32: CRC32 of the encoded file if already known, or it's read again when naming needs it.
+        :return: Path of renamed file
+        """
+        if encoded_crc32 is None and "{crc32}" in encode_preset.naming:
+            # e.g. matroska/mp4, their muxers seek back to rewrite headers (see `Constants.PIPE_SAFE_CONTAINER_FORMATS`)
+            AnimeProcessor.logger.info(f'"{encoded_file.name}" was not hashed while encoding, reading it again for crc32')
+        naming_kw_replacement = AnimeProcessor.build_rename_keyword_replacement(
+            source_anime_object=source_file_object, encoded_anime_file=encoded_file,
+            encoded_anime_object=AnimeFileObject(), ffprobe=ffprobe_executable, encode_preset_object=encode_preset,
+            # no progress bar of its own, callers already show encode progress (alive_progress can't nest)
+            on_byte_read_callback=lambda byte_count: ...,
+            encoded_crc32=encoded_crc32
+        )
+        return AnimeProcessor.rename_encoded_file(
+            naming_template=encode_preset.naming, encoded_file=encoded_file, keyword_replacement=naming_kw_replacement
         )
-        return output_file, False
 
     @staticmethod
     def do_encode_task(
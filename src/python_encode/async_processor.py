@@ -0,0 +1,284 @@
+"""
+asyncio versions of the `AnimeProcessor` steps that wait on ffprobe / ffmpeg, so many probes and encodes can share
+one event loop instead of one thread each.
+
+    probe_result = await AsyncAnimeProcessor.probe_file(file)
+
+    async for progress in AsyncAnimeProcessor.encode(source_file_object, command_args):
+        print(progress)
+
+Cancelling the task (or `aclose()` on `encode()`) stops ffmpeg. Hashing (crc32, also needed by renaming) still runs
+in the default executor. Results are the same objects the blocking API returns.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import collections
+import json
+import logging
+import subprocess
+import threading
+from pathlib import Path
+from typing import Optional, Callable, Dict, List, Set, AsyncIterator, Deque
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject, EncodePresetObject, FFmpegProgress
+from python_encode.utils import EncodeStage, Constants
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncAnimeProcessor:
+
+    @staticmethod
+    async def probe_file(file: Path, ffprobe_path: str = AnimeProcessor.ffprobe, use_cache: bool = True,
+                         profile: Optional[str] = None) -> dict:
+        """Same as `AnimeProcessor.probe_file` (always ffprobe), raises `subprocess.SubprocessError` if ffprobe fails"""
+        profile = profile if profile is not None else Constants.PROBE_PROFILE
+        use_cache = use_cache and AnimeProcessor.use_probe_cache
+        if use_cache:
+            cached_result = AnimeProcessor.get_cached_probe_result(file, profile)
+            if cached_result is not None:
+                return cached_result
+        proc = await asyncio.create_subprocess_exec(
+            *AnimeProcessor.compile_probe_param(file, ffprobe_path, profile),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            raise
+        if proc.returncode != 0:
+            error_lines = stderr.splitlines()
+            raise subprocess.SubprocessError(str.format(
+                'Process "{0}" error: {1}', ffprobe_path, error_lines[-1].decode() if error_lines else proc.returncode))
+        probe_result_dict = json.loads(stdout)
+        if use_cache:
+            AnimeProcessor.get_probe_cache(profile).put(file, probe_result_dict)
+        return probe_result_dict
+
+    @staticmethod
+    async def read_anime_file(file: Path,
+                              ffprobe: str = AnimeProcessor.ffprobe,
+                              on_bytes_read_callback: Optional[Callable[[int], None]] = ...,
+                              brackets: Dict[str, str] = ...,
+                              ignoring_left_brackets: Set[str] = ...,
+                              skip_crc32: bool = False,
+                              tag_content_spliter: Optional[str] = None,
+                              crc32_workers: int = 1,
+                              probe_profile: Optional[str] = None,
+                              count_packets: Optional[bool] = None) -> Optional[AnimeFileObject]:
+        """
+        Same as `AnimeProcessor.read_anime_file`, with cancellation instead of `abort_signal` and without
+        `probe_result`. ffprobe runs on the event loop, crc32 in the default executor meanwhile
+        (`on_bytes_read_callback` is called from that thread), and so does packet counting (see
+        `AnimeProcessor.read_anime_file_streams`), which isn't stopped by cancelling.
+
+        :return: `None` if ffprobe can't read the file
+        """
+        if not isinstance(file, Path) or not file.exists() or file.is_dir():
+            raise FileNotFoundError(f'File "{file.__str__()}" is invalid.')
+        if not isinstance(on_bytes_read_callback, Callable):
+            on_bytes_read_callback = lambda byte_count: ...  # no progress bar, several files are read at once
+        if not isinstance(brackets, Dict):
+            brackets = AnimeProcessor.brackets
+        if tag_content_spliter is not None:
+            tag_content_spliter = tag_content_spliter.replace('_', " ")
+        anime = AnimeFileObject()
+        anime.file = file
+        anime.file_name = file.name
+
+        loop = asyncio.get_running_loop()
+
+        async def read_streams() -> None:
+            probe_result = await AsyncAnimeProcessor.probe_file(file, ffprobe, profile=probe_profile)
+            await loop.run_in_executor(None, AnimeProcessor.read_anime_file_streams, anime, probe_result, ffprobe,
+                                       probe_profile, count_packets)
+
+        probe_task = asyncio.ensure_future(read_streams())
+        crc32_future = None
+        # no point finishing the hash if ffprobe can't read the file (or we got cancelled). Set on the event loop,
+        # the hashing thread only reads it, it never touches the futures.
+        stop_hashing = threading.Event()
+        probe_task.add_done_callback(
+            lambda task: stop_hashing.set() if task.cancelled() or task.exception() is not None else None)
+        if not skip_crc32:
+            crc32_future = loop.run_in_executor(None, AnimeProcessor.read_anime_file_crc32, anime,
+                                                on_bytes_read_callback, stop_hashing.is_set, crc32_workers)
+        try:
+            await probe_task
+            if crc32_future is not None:
+                await crc32_future
+        except subprocess.SubprocessError:
+            if crc32_future is not None:
+                await asyncio.wait([crc32_future])
+            return None
+        except asyncio.CancelledError:
+            stop_hashing.set()
+            probe_task.cancel()
+            if crc32_future is not None:
+                crc32_future.cancel()
+            raise
+        AnimeProcessor.read_anime_file_name(anime=anime, brackets=brackets,
+                                            ignoring_left_brackets=ignoring_left_brackets,
+                                            multiple_content_spliter=tag_content_spliter)
+        return anime
+
+    @staticmethod
+    async def read_anime_files(files: List[Path],
+                               max_concurrency: int = 4,
+                               ffprobe: str = AnimeProcessor.ffprobe,
+                               on_bytes_read_callback: Optional[Callable[[int], None]] = ...,
+                               brackets: Dict[str, str] = ...,
+                               ignoring_left_brackets: Set[str] = ...,
+                               skip_crc32: bool = False,
+                               tag_content_spliter: Optional[str] = None,
+                               crc32_workers: int = 1,
+                               probe_profile: Optional[str] = None) -> List[Optional[AnimeFileObject]]:
+        """
+        `read_anime_file` on each file, `max_concurrency` at a time. Results keep input order, `None` if failed.
+
+        :param on_bytes_read_callback: Same as in `AnimeProcessor.read_anime_files`, shared by all files and the calls
+            are serialized.
+        """
+        semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        callback_lock = threading.Lock()
+        if isinstance(on_bytes_read_callback, Callable):
+            def on_chunk_read(chunk_size: int) -> None:
+                with callback_lock:
+                    on_bytes_read_callback(chunk_size)
+        else:
+            on_chunk_read = ...
+
+        async def read_one(file: Path) -> Optional[AnimeFileObject]:
+            async with semaphore:
+                try:
+                    return await AsyncAnimeProcessor.read_anime_file(
+                        file, ffprobe, on_bytes_read_callback=on_chunk_read, brackets=brackets,
+                        ignoring_left_brackets=ignoring_left_brackets, skip_crc32=skip_crc32,
+                        tag_content_spliter=tag_content_spliter, crc32_workers=crc32_workers,
+                        probe_profile=probe_profile)
+                except OSError as ex:
+                    logger.error(f'Cannot read file "{file}": {ex}')
+                    return None
+        return list(await asyncio.gather(*[read_one(_) for _ in files]))
+
+    @staticmethod
+    async def encode(source_file_object: AnimeFileObject, subprocess_args: List[str]) -> AsyncIterator[FFmpegProgress]:
+        """
+        Run ffmpeg with `subprocess_args` (see `AnimeProcessor.compile_encode_param`, output must not be a pipe) and
+        yield its progress.
+
+        Raises `subprocess.CalledProcessError` (last lines of ffmpeg output in `stderr`) if ffmpeg fails.
+        ffmpeg is stopped when the task is cancelled or the iterator is closed early.
+        """
+        # "-progress" is a global option, put it right after the executable
+        subprocess_args = [subprocess_args[0], '-progress', 'pipe:1', '-nostats'] + subprocess_args[1:]
+        proc = await asyncio.create_subprocess_exec(
+            *subprocess_args, stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE)
+        last_stdout: Deque[str] = collections.deque(maxlen=10)
+
+        async def read_console_output() -> None:
+            async for line in proc.stderr:
+                line = line.decode(errors='replace').strip()
+                if line != '':
+                    last_stdout.append(line)
+        console_task = asyncio.ensure_future(read_console_output())
+        try:
+            fields: Dict[str, str] = dict()
+            async for line in proc.stdout:
+                progress = AnimeProcessor._parse_progress_line(line, fields)
+                if progress is not None:
+                    yield progress
+            await proc.wait()
+            await console_task
+        finally:
+            if proc.returncode is None:
+                logger.info(f'Stopping encode of "{source_file_object.file_name}"')
+                await AsyncAnimeProcessor._stop_ffmpeg(proc)
+            console_task.cancel()
+        if proc.returncode != 0:
+            raise subprocess.CalledProcessError(proc.returncode, subprocess_args, stderr="\n".join(last_stdout))
+        logger.debug("encode complete")
+
+    @staticmethod
+    async def _stop_ffmpeg(proc: asyncio.subprocess.Process) -> None:
+        """Same escalation as `AnimeProcessor.stop_ffmpeg`: "q" on stdin, then SIGTERM, then SIGKILL"""
+        try:
+            proc.stdin.write(b'q')
+            proc.stdin.close()
+            await asyncio.wait_for(proc.wait(), Constants.FFMPEG_QUIT_TIMEOUT)
+            return
+        except OSError:
+            pass  # broken pipe, already on its way out
+        except asyncio.TimeoutError:
+            logger.warning(f"ffmpeg (pid {proc.pid}) still running, sending SIGTERM")
+        try:
+            proc.terminate()
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(proc.wait(), Constants.FFMPEG_TERMINATE_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"ffmpeg (pid {proc.pid}) ignored SIGTERM, killing it")
+            proc.kill()
+            await proc.wait()
+
+    @staticmethod
+    async def process_anime_encode(
+            output_dir: Path,
+            source_file_object: AnimeFileObject,
+            encode_preset: Optional[EncodePresetObject] = None,
+            selected_streams: Optional[Set[int]] = None,
+            ffmpeg_executable: str = AnimeProcessor.ffmpeg,
+            ffprobe_executable: str = AnimeProcessor.ffprobe,
+            on_progress: Optional[Callable[[FFmpegProgress], None]] = None,
+            on_stage_changed: Optional[Callable[[str, Path], None]] = None,
+    ) -> Path:
+        """
+        Same steps as `AnimeProcessor.process_anime_encode` (reserve output name, encode, rename)
+
+        :param on_progress: Called on the event loop with every ffmpeg progress update
+        :param on_stage_changed: Same as in `AnimeProcessor.process_anime_encode`
+        :return: Path of the renamed encoded file. Raises `subprocess.CalledProcessError` if ffmpeg fails.
+        """
+        if not isinstance(encode_preset, EncodePresetObject):
+            encode_preset = EncodePresetObject()
+        if not isinstance(selected_streams, Set):
+            selected_streams = source_file_object.get_all_stream_indexes()
+        if not isinstance(on_progress, Callable):
+            on_progress = lambda progress: ...
+        if not isinstance(on_stage_changed, Callable):
+            on_stage_changed = lambda stage, file: ...
+        if not isinstance(output_dir, Path) or not output_dir.is_dir():
+            raise NotADirectoryError(f'Output directory "{output_dir}" is invalid.')
+
+        output_file = AnimeProcessor._reserve_output_file(output_dir, source_file_object, encode_preset)
+        on_stage_changed(EncodeStage.ENCODING, output_file)
+        encode_command_args = AnimeProcessor.compile_encode_param(
+            anime_file=source_file_object, output_file_path=output_file, encode_preset_object=encode_preset,
+            select_video_streams=source_file_object.video_stream_indexes.intersection(selected_streams),
+            select_audio_streams=source_file_object.audio_stream_indexes.intersection(selected_streams),
+            select_subtitle_streams=source_file_object.subtitle_stream_indexes.intersection(selected_streams),
+            select_attachment_streams=source_file_object.attachment_stream_indexes.intersection(selected_streams),
+            ffmpeg=ffmpeg_executable
+        )
+        try:
+            async for progress in AsyncAnimeProcessor.encode(source_file_object, encode_command_args):
+                on_progress(progress)
+        except BaseException:
+            # don't leave the placeholder behind if ffmpeg didn't get to write anything
+            if output_file.is_file() and output_file.stat().st_size == 0:
+                output_file.unlink()
+            raise
+        on_stage_changed(EncodeStage.ENCODED, output_file)
+        output_file = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: AnimeProcessor.rename_encoded_anime_file(
+                source_file_object=source_file_object, encoded_file=output_file, encode_preset=encode_preset,
+                ffprobe_executable=ffprobe_executable))
+        on_stage_changed(EncodeStage.RENAMED, output_file)
+        return output_file
@@ -0,0 +1,164 @@
+"""
+Micro benchmarks for the slow parts of source loading.
+
+Usage: python -m python_encode.benchmark crc32 [file ...] [--workers 1 2 4 8] [--io read readinto mmap] [--repeat 3]
+       python -m python_encode.benchmark probe [file ...] [--profile lean full] [--backend ffprobe pyav] [--repeat 3]
+       python -m python_encode.benchmark names [names.txt] [--generate 50000] [--repeat 3]
+
+Note: Run it twice or use a file larger than RAM, or the first round measures the disk and the rest measure page cache.
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+from pathlib import Path
+from typing import Callable, List, Tuple, Any
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject
+from python_encode.probe_backend import PyAVProbe
+from python_encode.utils import HelperFunctions, Crc32IOBackend, Constants, ProbeBackend, ProbeProfile
+
+logger = logging.getLogger(__name__)
+
+
+def measure(func: Callable[[], Any], repeat: int = 3) -> Tuple[float, Any]:
+    """Run `func` `repeat` times, returns the best time (in seconds) and last result"""
+    best = float('inf')
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def bench_crc32(files: List[Path], workers: List[int], io_backends: List[str], chunk_sizes: List[int],
+                repeat: int = 3) -> None:
+    for file in files:
+        file_size = file.stat().st_size
+        print(f"{file.name} ({file_size / 1024 ** 2:.1f} MiB)")
+        serial_crc32 = None
+        for io_backend in io_backends:
+            for chunk_size in chunk_sizes:
+                for worker_count in workers:
+                    seconds, crc32 = measure(lambda: HelperFunctions.get_file_crc32(
+                        file, workers=worker_count, io_backend=io_backend, chunk_size=chunk_size), repeat)
+                    if serial_crc32 is None:
+                        serial_crc32 = crc32
+                    print(f"\tio={io_backend:<8} chunk={chunk_size // 1024:>6}KiB workers={worker_count:<3} "
+                          f"{seconds:8.3f}s {file_size / 1024 ** 2 / seconds:10.1f} MiB/s  "
+                          f"crc32={crc32}{'' if crc32 == serial_crc32 else ' MISMATCH'}")
+
+
+def bench_probe(files: List[Path], profiles: List[str], backends: List[str], ffprobe: str = AnimeProcessor.ffprobe,
+                repeat: int = 3) -> None:
+    """Time one probe (cache not used) per file, and check every combination reads the same info out of it"""
+    if ProbeBackend.PYAV in backends and not PyAVProbe.is_available():
+        print("PyAV (>= 14) is not installed, skipping it")
+        backends = [_ for _ in backends if _ != ProbeBackend.PYAV]
+    for file in files:
+        print(f"{file.name} ({file.stat().st_size / 1024 ** 2:.1f} MiB)")
+        reference = None
+        for backend in backends:
+            # PyAV is only used for the lean profile
+            for profile in profiles if backend == ProbeBackend.FFPROBE else [ProbeProfile.LEAN]:
+                seconds, probe_result = measure(lambda: AnimeProcessor.probe_file(
+                    file, ffprobe, use_cache=False, backend=backend, profile=profile), repeat)
+                anime = AnimeFileObject()
+                anime.file = file
+                AnimeProcessor.read_anime_file_probe_result(anime, probe_result)
+                info = (anime.video_length_seconds, anime.video_resolution, anime.video_frame_count,
+                        anime.video_stream_indexes, anime.audio_stream_indexes, anime.subtitle_stream_indexes,
+                        anime.attachment_stream_indexes, [_[2] for _ in anime.chapters])
+                if reference is None:
+                    reference = info
+                print(f"\tbackend={backend:<8} profile={profile if backend == ProbeBackend.FFPROBE else '-':<5} "
+                      f"{seconds * 1000:8.1f}ms {len(json.dumps(probe_result)) / 1024:8.1f}KiB json"
+                      f"{'' if info == reference else '  MISMATCH'}")
+
+
+def generate_release_names(count: int, seed: int = 0) -> List[str]:
+    """Names shaped like the usual release names, "[Group] Show Name - 01 (BD 1080p HEVC AAC) [ABCD1234]" and such"""
+    rng = random.Random(seed)
+    groups = ['SubsPlease', 'Erai-raws', 'Judas', 'ASW', 'Nekomoe kissaten', 'VCB-Studio', 'Ohys-Raws', 'LoliHouse']
+    words = ['Kimi', 'no', 'Na', 'wa', 'Shingeki', 'Kyojin', 'Sousou', 'Frieren', 'Spy', 'Family', 'Oshi', 'Ko',
+             'Dungeon', 'Meshi', 'Kusuriya', 'Hitorigoto', 'Season', 'The', 'Final', 'Part']
+    tags = ['1080p', '720p', '1920x1080', 'HEVC', 'AAC', 'OPUS', 'x265', 'Multiple Subtitle', 'BD', 'WEB-DL',
+            'Ma10p', 'FLAC', 'v2', 'END', 'CHS', 'Dual Audio']
+    names = list()
+    for _ in range(count):
+        name = f"[{rng.choice(groups)}] " if rng.random() < 0.9 else ""
+        name += " ".join(rng.choices(words, k=rng.randint(1, 6))) + f" - {rng.randint(1, 24):02d}"
+        for _tag in range(rng.randint(0, 4)):
+            left, right = rng.choice([('[', ']'), ('(', ')')])
+            name += f" {left}{' '.join(rng.sample(tags, rng.randint(1, 3)))}{right}"
+        if rng.random() < 0.7:
+            name += f" [{rng.getrandbits(32):08X}]"
+        names.append(name.replace(' ', '_') if rng.random() < 0.1 else name)
+    return names
+
+
+def bench_names(names: List[str], repeat: int = 3) -> None:
+    """Time `AnimeProcessor.parse_anime_file_name` over all `names` (file names without extension)"""
+    def parse_all() -> List[AnimeFileObject]:
+        anime_list = list()
+        for name in names:
+            anime = AnimeFileObject()
+            AnimeProcessor.parse_anime_file_name(anime, name)
+            anime_list.append(anime)
+        return anime_list
+    seconds, anime_list = measure(parse_all, repeat)
+    print(f"{len(names)} names {seconds:8.3f}s {len(names) / seconds:12.0f} names/s  "
+          f"{sum(_.release_group is not None for _ in anime_list)} with release group, "
+          f"{sum(len(_.non_omittable_tags) for _ in anime_list)} non omittable tags")
+
+
+def main():
+    args = argparse.ArgumentParser(prog="python -m python_encode.benchmark")
+    sub_args = args.add_subparsers(dest='benchmark', required=True)
+
+    crc32_args = sub_args.add_parser('crc32', help='Compare serial and parallel CRC32 of files')
+    crc32_args.add_argument('files', type=str, nargs='+', help='Files to hash')
+    crc32_args.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8],
+                            help='Worker counts to try, the first one is the reference result')
+    crc32_args.add_argument('--io', type=str, nargs='+', default=Crc32IOBackend.values(),
+                            choices=Crc32IOBackend.values(), help='I/O backends to try')
+    crc32_args.add_argument('--chunk-size', type=int, nargs='+', default=[65536, Constants.CRC32_CHUNK_SIZE],
+                            help='Chunk sizes (in bytes) to try')
+    crc32_args.add_argument('--repeat', type=int, default=3, help='Best of N runs')
+
+    probe_args = sub_args.add_parser('probe', help='Compare probe profiles and backends')
+    probe_args.add_argument('files', type=str, nargs='+', help='Files to probe')
+    probe_args.add_argument('--profile', type=str, nargs='+', default=ProbeProfile.values(),
+                            choices=ProbeProfile.values(), help='ffprobe profiles to try')
+    probe_args.add_argument('--backend', type=str, nargs='+', default=[ProbeBackend.FFPROBE, ProbeBackend.PYAV],
+                            choices=[ProbeBackend.FFPROBE, ProbeBackend.PYAV], help='Probe backends to try')
+    probe_args.add_argument('--ffprobe', type=str, default=AnimeProcessor.ffprobe, help='ffprobe executable')
+    probe_args.add_argument('--repeat', type=int, default=3, help='Best of N runs')
+
+    names_args = sub_args.add_parser('names', help='Parse release names')
+    names_args.add_argument('names_file', type=str, nargs='?', default=None,
+                            help='Text file with one file name per line (extension is dropped), '
+                                 'generated names are used without it')
+    names_args.add_argument('--generate', type=int, default=50000, help='How many names to generate')
+    names_args.add_argument('--repeat', type=int, default=3, help='Best of N runs')
+
+    args1 = args.parse_args()
+    if args1.benchmark == 'crc32':
+        bench_crc32([Path(_) for _ in args1.files], args1.workers, args1.io, args1.chunk_size, args1.repeat)
+    elif args1.benchmark == 'probe':
+        bench_probe([Path(_) for _ in args1.files], args1.profile, args1.backend, args1.ffprobe, args1.repeat)
+    elif args1.benchmark == 'names':
+        if args1.names_file is not None:
+            names = [Path(_.strip()).stem for _ in Path(args1.names_file).read_text(encoding='utf-8').splitlines()
+                     if _.strip() != '']
+        else:
+            names = generate_release_names(args1.generate)
+        bench_names(names, args1.repeat)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,9 @@
 import enum
 import json
 import logging
+import sys
 import warnings
+import zlib
 from pathlib import Path
 from typing import Any, Iterable, List, Dict, Tuple, Optional, Union, Set
 
@@ -117,10 +119,15 @@ class AnimeFileObject:
         'video_resolution',
         'video_length_seconds',
         'video_frame_count',
+        'video_frame_count_source',
 
         'release_group',
         'episode_name',
+        'series_title',
         'episodes',
+        'season',
+        'version',
+        'special',
         'crc32',
 
         'omittable_tags',
@@ -142,11 +149,16 @@ class AnimeFileObject:
         self.video_resolution: Tuple[Optional[str], Optional[str]] = (None, None)  # width by height, in pixel, numeric
         self.video_length_seconds: Optional[float] = None  # I wonder if floating point precision is an issue
         self.video_frame_count: Optional[int] = None
+        self.video_frame_count_source: Optional[str] = None  # one of `FrameCountSource`, estimates aren't exact
 
         # file name related
         self.release_group: Optional[str] = None
         self.episode_name: Optional[str] = None
-        self.episodes: Optional[str] = None  # it's a placeholder.
+        self.series_title: Optional[str] = None  # episode name without the episode number part
+        self.episodes: Optional[Tuple[int, int]] = None  # first and last episode, same number if it's not a batch
+        self.season: Optional[int] = None
+        self.version: Optional[int] = None  # "07v2" is 2, None if the name has no version
+        self.special: Optional[str] = None  # "OVA", "SP", "NCOP"... upper case
         self.crc32: Tuple[Optional[str], Optional[str]] = (None, None)  # (file bytes, filename label)
 
         # fixme: if there are better namings
@@ -167,6 +179,10 @@ class AnimeFileObject:
             and self.video_frame_count == other.video_frame_count \
             and self.release_group == other.release_group \
             and self.episode_name == other.episode_name \
+            and self.episodes == other.episodes \
+            and self.season == other.season \
+            and self.version == other.version \
+            and self.special == other.special \
             and self.omittable_tags.__eq__(other.omittable_tags) \
             and self.non_omittable_tags.__eq__(other.non_omittable_tags)
 
@@ -179,10 +195,10 @@ File Info:
     Chapters: {[chapter[2] for chapter in self.chapters]}
     CRC (calculated, filename): {self.crc32}
     Resolution: {'Unknown' if None in self.video_resolution else 'x'.join(self.video_resolution)}
-    Length: {self.video_length_seconds} seconds, {self.video_frame_count} frames
+    Length: {self.video_length_seconds} seconds, {self.video_frame_count} frames ({self.video_frame_count_source})
     Group: {self.release_group}
     Episode Name: {self.episode_name}
-    Episode (unavailable for now): {self.episodes}
+    Series: {self.series_title}, Season: {self.season}, Episodes: {self.episodes}, Version: {self.version}, Special: {self.special}
     Omittable Tags: {[item for item in self.omittable_tags]}
     Non Omittable Tags: {[item for item in self.non_omittable_tags]}  
 """
@@ -190,6 +206,174 @@ File Info:
     def get_all_stream_indexes(self) -> Set:
         return set().union(self.video_stream_indexes, self.audio_stream_indexes, self.subtitle_stream_indexes, self.attachment_stream_indexes)
 
+    # serialized forms, see `to_dict()`. Bump the version when a field is added or changes meaning.
+    FORMAT_VERSION = 1
+    _STREAM_TYPE_CODES = (('v', 'video_stream_indexes'), ('a', 'audio_stream_indexes'),
+                          ('s', 'subtitle_stream_indexes'), ('t', 'attachment_stream_indexes'))
+    # `to_row()` order, "streams" is the stream map
+    _ROW_KEYS = ('format', 'file', 'file_name', 'streams', 'chapters', 'video_resolution', 'video_length_seconds',
+                 'video_frame_count', 'video_frame_count_source', 'release_group', 'episode_name', 'series_title',
+                 'episodes', 'season', 'version', 'special', 'crc32', 'omittable_tags', 'non_omittable_tags')
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Every field, JSON-safe (resolution as numbers, sets as sorted lists). `from_dict()` turns it back."""
+        return {
+            'format': AnimeFileObject.FORMAT_VERSION,
+            'file': self.file.__str__() if self.file is not None else None,
+            'file_name': self.file_name,
+            **{attribute: sorted(getattr(self, attribute)) for _, attribute in AnimeFileObject._STREAM_TYPE_CODES},
+            'chapters': [list(_) for _ in self.chapters],
+            # digits only, anything else (missing width / height) is None
+            'video_resolution': [int(_) if _ is not None and _.isdigit() else None for _ in self.video_resolution],
+            'video_length_seconds': self.video_length_seconds,
+            'video_frame_count': self.video_frame_count,
+            'video_frame_count_source': self.video_frame_count_source,
+            'release_group': self.release_group,
+            'episode_name': self.episode_name,
+            'series_title': self.series_title,
+            'episodes': list(self.episodes) if self.episodes is not None else None,
+            'season': self.season,
+            'version': self.version,
+            'special': self.special,
+            'crc32': list(self.crc32),
+            'omittable_tags': sorted(self.omittable_tags),
+            'non_omittable_tags': sorted(self.non_omittable_tags),
+        }
+
+    @staticmethod
+    def from_dict(values: Dict[str, Any]) -> "AnimeFileObject":
+        """Raises `ValueError` if `values` is from another `FORMAT_VERSION`. Tag strings are interned."""
+        if values.get('format', None) != AnimeFileObject.FORMAT_VERSION:
+            raise ValueError(f"Unsupported AnimeFileObject format {values.get('format', None)}, "
+                             f"expect {AnimeFileObject.FORMAT_VERSION}")
+        intern = lambda value: sys.intern(value) if value is not None else None
+        anime = AnimeFileObject()
+        anime.file = Path(values['file']) if values['file'] is not None else None
+        anime.file_name = values['file_name']
+        for _, attribute in AnimeFileObject._STREAM_TYPE_CODES:
+            setattr(anime, attribute, set(values[attribute]))
+        anime.chapters = [tuple(_) for _ in values['chapters']]
+        anime.video_resolution = tuple(_.__str__() if _ is not None else None for _ in values['video_resolution'])
+        anime.video_length_seconds = values['video_length_seconds']
+        anime.video_frame_count = values['video_frame_count']
+        anime.video_frame_count_source = intern(values['video_frame_count_source'])
+        anime.release_group = intern(values['release_group'])
+        anime.episode_name = values['episode_name']
+        anime.series_title = values['series_title']
+        anime.episodes = tuple(values['episodes']) if values['episodes'] is not None else None
+        anime.season = values['season']
+        anime.version = values['version']
+        anime.special = intern(values['special'])
+        anime.crc32 = tuple(values['crc32'])
+        anime.omittable_tags = {sys.intern(_) for _ in values['omittable_tags']}
+        anime.non_omittable_tags = {sys.intern(_) for _ in values['non_omittable_tags']}
+        return anime
+
+    def to_row(self) -> List[Any]:
+        """
+        `to_dict()` without the keys (in `_ROW_KEYS` order), stream indexes as one stream map string with a type
+        letter per index: "vaas-t" is video 0, audio 1 and 2, subtitle 3, 4 is something else, attachment 5.
+        """
+        values = self.to_dict()
+        stream_map = ['-'] * (max(self.get_all_stream_indexes(), default=-1) + 1)
+        for code, attribute in AnimeFileObject._STREAM_TYPE_CODES:
+            for index in values.pop(attribute):
+                stream_map[index] = code
+        values['streams'] = "".join(stream_map)
+        return [values[_] for _ in AnimeFileObject._ROW_KEYS]
+
+    @staticmethod
+    def from_row(row: List[Any]) -> "AnimeFileObject":
+        values = dict(zip(AnimeFileObject._ROW_KEYS, row))
+        stream_map = values.pop('streams', "")
+        for code, attribute in AnimeFileObject._STREAM_TYPE_CODES:
+            values[attribute] = [index for index, index_code in enumerate(stream_map) if index_code == code]
+        return AnimeFileObject.from_dict(values)
+
+    def __getstate__(self) -> List[Any]:
+        # pickled (process pools) as a row, smaller than pickling every slot by name and tags come back interned
+        return self.to_row()
+
+    def __setstate__(self, row: List[Any]) -> None:
+        anime = AnimeFileObject.from_row(row)
+        for attribute in AnimeFileObject.__slots__:
+            setattr(self, attribute, getattr(anime, attribute))
+
+    @staticmethod
+    def pack(anime_objects: Iterable["AnimeFileObject"], compress: bool = True) -> bytes:
+        """JSON lines, one `to_row()` per line, zlib compressed unless `compress` is False"""
+        data = "".join(json.dumps(_.to_row(), ensure_ascii=False, separators=(',', ':')) + "\n"
+                       for _ in anime_objects).encode()
+        return zlib.compress(data) if compress else data
+
+    @staticmethod
+    def unpack(data: bytes) -> List["AnimeFileObject"]:
+        """Read what `pack()` wrote, compressed or not"""
+        if len(data) > 0 and data[:1] != b'[':  # every JSON line is a list, zlib output never starts with "["
+            data = zlib.decompress(data)
+        return [AnimeFileObject.from_row(json.loads(_)) for _ in data.splitlines() if len(_.strip()) > 0]
+
+
+class FileNameTable:
+    """
+    What file names alone say (see `AnimeProcessor.parse_anime_file_names`), one list per column, row `i` of each list
+    belongs to `names[i]`. Tags are sorted tuples.
+
+        pandas.DataFrame(table.columns())
+    """
+
+    __slots__ = (
+        'names',
+        'release_groups',
+        'episode_names',
+        'crc32_labels',
+        'series_titles',
+        'seasons',
+        'episodes',
+        'versions',
+        'specials',
+        'omittable_tags',
+        'non_omittable_tags',
+    )
+
+    def __init__(self) -> None:
+        self.names: List[str] = list()
+        self.release_groups: List[Optional[str]] = list()
+        self.episode_names: List[str] = list()
+        self.crc32_labels: List[Optional[str]] = list()
+        self.series_titles: List[Optional[str]] = list()
+        self.seasons: List[Optional[int]] = list()
+        self.episodes: List[Optional[Tuple[int, int]]] = list()
+        self.versions: List[Optional[int]] = list()
+        self.specials: List[Optional[str]] = list()
+        self.omittable_tags: List[Tuple[str, ...]] = list()
+        self.non_omittable_tags: List[Tuple[str, ...]] = list()
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def append(self, name: str, anime: "AnimeFileObject") -> None:
+        """Add file name related fields of a parsed `anime` as a row"""
+        self.names.append(name)
+        self.release_groups.append(anime.release_group)
+        self.episode_names.append(anime.episode_name)
+        self.crc32_labels.append(anime.crc32[1])
+        self.series_titles.append(anime.series_title)
+        self.seasons.append(anime.season)
+        self.episodes.append(anime.episodes)
+        self.versions.append(anime.version)
+        self.specials.append(anime.special)
+        self.omittable_tags.append(tuple(sorted(anime.omittable_tags)))
+        self.non_omittable_tags.append(tuple(sorted(anime.non_omittable_tags)))
+
+    def extend(self, other: "FileNameTable") -> None:
+        for column in FileNameTable.__slots__:
+            getattr(self, column).extend(getattr(other, column))
+
+    def columns(self) -> Dict[str, List]:
+        """Column name to column"""
+        return {column: getattr(self, column) for column in FileNameTable.__slots__}
+
 
 class AnimeObject:
     """ abandoned and may remove in the future """
@@ -572,6 +756,69 @@ class ProgramInfo:
         return self.__program_name__
 
 
+class FFmpegProgress:
+    """
+    One block of ffmpeg "-progress" output.
+
+    Values ffmpeg reports as "N/A" (e.g. bitrate before the first packet is muxed) are `None`.
+    """
+    __slots__ = (
+        'frame',
+        'fps',
+        'bitrate_kbps',
+        'out_time_seconds',
+        'speed',
+        'total_size',
+        'is_end',
+    )
+
+    # keys read from "-progress" output, everything else in a block is skipped
+    KEYS = frozenset({'frame', 'fps', 'bitrate', 'out_time_us', 'speed', 'total_size', 'progress'})
+
+    def __init__(self) -> None:
+        self.frame: int = 0
+        self.fps: Optional[float] = None
+        self.bitrate_kbps: Optional[float] = None
+        self.out_time_seconds: Optional[float] = None
+        self.speed: Optional[float] = None  # 1.0 means realtime
+        self.total_size: Optional[int] = None  # bytes written to output so far
+        self.is_end: bool = False  # last block, sent when ffmpeg is about to exit
+
+    @staticmethod
+    def _to_number(value: Optional[str], number_type: type = float, suffix: str = '') -> Optional[Union[int, float]]:
+        if value is None:
+            return None
+        value = value.strip()
+        if suffix != '' and value.endswith(suffix):
+            value = value[:-len(suffix)]
+        try:
+            return number_type(value)
+        except ValueError:
+            return None  # "N/A"
+
+    @staticmethod
+    def from_fields(fields: Dict[str, str]) -> "FFmpegProgress":
+        """:param fields: key=value pairs of one block, ending with the "progress" key"""
+        progress = FFmpegProgress()
+        progress.frame = FFmpegProgress._to_number(fields.get('frame', None), int) or 0
+        progress.fps = FFmpegProgress._to_number(fields.get('fps', None))
+        progress.bitrate_kbps = FFmpegProgress._to_number(fields.get('bitrate', None), suffix='kbits/s')
+        out_time_us = FFmpegProgress._to_number(fields.get('out_time_us', None), int)
+        progress.out_time_seconds = out_time_us / 1000000 if out_time_us is not None else None
+        progress.speed = FFmpegProgress._to_number(fields.get('speed', None), suffix='x')
+        progress.total_size = FFmpegProgress._to_number(fields.get('total_size', None), int)
+        progress.is_end = fields.get('progress', None) == 'end'
+        return progress
+
+    def __str__(self) -> str:
+        return f"frame={self.frame} " \
+               f"fps={'N/A' if self.fps is None else f'{self.fps:.1f}'} " \
+               f"bitrate={'N/A' if self.bitrate_kbps is None else f'{self.bitrate_kbps:.1f}kbits/s'} " \
+               f"time={'N/A' if self.out_time_seconds is None else f'{self.out_time_seconds:.2f}s'} " \
+               f"size={'N/A' if self.total_size is None else f'{self.total_size // 1024}KiB'} " \
+               f"speed={'N/A' if self.speed is None else f'{self.speed:.2f}x'}"
+
+
 if __name__ == "__main__":
     # print(SSAEncodeProfile().as_ffmpeg_python_args())
     print(EncodeContainerList.NAME_DICT.keys())
@@ -0,0 +1,459 @@
+"""
+Share one encode queue between several machines.
+
+The coordinator holds the queue and the preset, workers lease a job, encode it with
+`AnimeProcessor.process_anime_encode` and report back, all as JSON over HTTP (standard library only, meant for a LAN).
+Source and output paths are sent as they are, so every machine must see them at the same path (same NAS mount).
+
+A leased job has to be renewed by heartbeats. If a worker stops sending them (crashed, unplugged) the lease runs out
+and the job goes back to the queue for another worker; a worker renewing a lease it already lost is told to abort.
+
+    coordinator: POST /lease, /heartbeat, /finish and GET /status
+"""
+
+from __future__ import annotations
+
+import http.server
+import itertools
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Optional, Dict, List, Callable, Any, Tuple
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import EncodePresetObject, FFmpegProgress
+from python_encode.utils import Constants
+
+logger = logging.getLogger(__name__)
+
+
+class DistributedJobState:
+    QUEUED = 'queued'
+    LEASED = 'leased'
+    ENCODED = 'encoded'
+    FAILED = 'failed'
+
+
+class DistributedJob:
+    __slots__ = (
+        'job_id',
+        'source_file',
+        'state',
+        'worker',
+        'lease_expires_at',
+        'attempts',
+        'encoded_frames',
+        'total_frames',
+        'fps',
+        'output_file',
+        'error',
+    )
+
+    def __init__(self, job_id: int, source_file: Path):
+        self.job_id: int = job_id
+        self.source_file: Path = source_file
+        self.state: str = DistributedJobState.QUEUED
+        self.worker: Optional[str] = None  # holding the lease
+        self.lease_expires_at: float = 0.0  # time.monotonic() of the coordinator
+        self.attempts: int = 0
+        self.encoded_frames: int = 0
+        self.total_frames: int = 0
+        self.fps: Optional[float] = None
+        self.output_file: Optional[Path] = None  # partial output while leased, encoded file once ENCODED
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.job_id, 'source_file': self.source_file.__str__(), 'state': self.state,
+            'worker': self.worker, 'attempts': self.attempts, 'encoded_frames': self.encoded_frames,
+            'total_frames': self.total_frames, 'fps': self.fps,
+            'output_file': self.output_file.__str__() if self.output_file is not None else None, 'error': self.error
+        }
+
+    def __str__(self):
+        return f"DistributedJob(id={self.job_id}, file={self.source_file.name}, state={self.state}, " \
+               f"worker={self.worker}, frames={self.encoded_frames}/{self.total_frames})"
+
+
+class EncodeCoordinator:
+    """
+    Job queue served over HTTP. `submit()` files, `start()`, then `wait()` until every job is encoded or failed.
+
+    Safe to share between threads.
+    """
+
+    PRESET_FILES = ('basic.json', 'naming.txt', 'tag_divider.txt', 'extra_param.txt')
+
+    def __init__(self,
+                 output_dir: Path,
+                 preset_dir: Optional[Path] = None,
+                 host: str = '0.0.0.0',
+                 port: int = Constants.DISTRIBUTED_PORT,
+                 lease_seconds: float = Constants.DISTRIBUTED_LEASE_SECONDS,
+                 max_attempts: int = Constants.DISTRIBUTED_MAX_ATTEMPTS,
+                 token: Optional[str] = None,
+                 on_job_finished: Optional[Callable[[DistributedJob], None]] = None):
+        """
+        :param output_dir: Where workers save encoded files
+        :param preset_dir: Preset sent to workers along with each job
+        :param lease_seconds: A job goes back to the queue if its worker is silent this long
+        :param max_attempts: A job that lost its lease (or failed) this many times is given up
+        :param token: Workers must send the same token (`X-Encode-Token` header), `None` accepts anyone
+        :param on_job_finished: Called when a job is encoded or given up
+        """
+        self.output_dir: Path = output_dir
+        self.preset_files: Dict[str, str] = dict()
+        if isinstance(preset_dir, Path) and preset_dir.is_dir():
+            for name in self.PRESET_FILES:
+                if (preset_dir / name).is_file():
+                    self.preset_files[name] = (preset_dir / name).read_text()
+        self.lease_seconds: float = lease_seconds
+        self.max_attempts: int = max(1, max_attempts)
+        self.token: Optional[str] = token
+        self.on_job_finished = on_job_finished if isinstance(on_job_finished, Callable) else lambda job: ...
+        self.jobs: List[DistributedJob] = list()
+        self._job_ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._all_done = threading.Event()
+        self._server = http.server.ThreadingHTTPServer((host, port), self._make_handler())
+        self._server.daemon_threads = True
+        self._server_thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self._server.server_address[:2]
+
+    def submit(self, source_file: Path) -> DistributedJob:
+        with self._lock:
+            job = DistributedJob(next(self._job_ids), source_file.absolute())
+            self.jobs.append(job)
+            self._all_done.clear()
+        return job
+
+    def start(self) -> None:
+        self._server_thread = threading.Thread(target=self._server.serve_forever, name="encode-coordinator",
+                                               daemon=True)
+        self._server_thread.start()
+        logger.info(f"Coordinator listening on {self.address[0]}:{self.address[1]}, {len(self.jobs)} job(s) queued")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until all jobs are encoded or failed, returns False on timeout"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while not self._all_done.is_set():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            with self._lock:
+                self._expire_leases()
+                self._check_all_done()
+            self._all_done.wait(1)
+        return True
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._server_thread is not None:
+            self._server_thread.join()
+
+    def _expire_leases(self) -> None:
+        """Requeue jobs whose worker went silent. Call with `_lock` held."""
+        now = time.monotonic()
+        for job in self.jobs:
+            if job.state != DistributedJobState.LEASED or job.lease_expires_at > now:
+                continue
+            logger.warning(f'Worker "{job.worker}" lost the lease of "{job.source_file.name}"' +
+                           (f', partial output left at "{job.output_file}"' if job.output_file is not None else ''))
+            self._release(job, f'Lease expired on worker "{job.worker}"')
+
+    def _release(self, job: DistributedJob, error: str) -> None:
+        """Back to the queue, or given up after `max_attempts`. Call with `_lock` held."""
+        job.worker, job.error, job.output_file = None, error, None
+        job.encoded_frames, job.fps = 0, None
+        if job.attempts >= self.max_attempts:
+            job.state = DistributedJobState.FAILED
+            logger.error(f'Giving up "{job.source_file.name}" after {job.attempts} attempt(s): {error}')
+            self.on_job_finished(job)
+            self._check_all_done()
+        else:
+            job.state = DistributedJobState.QUEUED
+
+    def _check_all_done(self) -> None:
+        if all(_.state in (DistributedJobState.ENCODED, DistributedJobState.FAILED) for _ in self.jobs):
+            self._all_done.set()
+
+    def _get_leased_job(self, job_id: int, worker: str) -> Optional[DistributedJob]:
+        job = next((_ for _ in self.jobs if _.job_id == job_id), None)
+        if job is None or job.state != DistributedJobState.LEASED or job.worker != worker:
+            return None
+        return job
+
+    def handle_lease(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        worker = request.get('worker', 'unknown')
+        with self._lock:
+            self._expire_leases()
+            job = next((_ for _ in self.jobs if _.state == DistributedJobState.QUEUED), None)
+            if job is None:
+                finished = all(_.state in (DistributedJobState.ENCODED, DistributedJobState.FAILED)
+                               for _ in self.jobs)
+                return 200, {'job': None, 'done': finished}
+            job.state = DistributedJobState.LEASED
+            job.worker = worker
+            job.attempts += 1
+            job.lease_expires_at = time.monotonic() + self.lease_seconds
+        logger.info(f'"{job.source_file.name}" leased to "{worker}" (attempt {job.attempts})')
+        return 200, {
+            'job': {'job_id': job.job_id, 'source_file': job.source_file.__str__(),
+                    'output_dir': self.output_dir.absolute().__str__()},
+            'preset_files': self.preset_files,
+            'lease_seconds': self.lease_seconds,
+            'done': False
+        }
+
+    def handle_heartbeat(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            self._expire_leases()  # a lease that ran out is lost, even if nobody asked for a job since
+            job = self._get_leased_job(request.get('job_id', None), request.get('worker', None))
+            if job is None:
+                return 409, {'abort': True}  # lease lost, someone else has the job now
+            job.lease_expires_at = time.monotonic() + self.lease_seconds
+            job.encoded_frames = request.get('encoded_frames', job.encoded_frames)
+            job.total_frames = request.get('total_frames', job.total_frames)
+            job.fps = request.get('fps', job.fps)
+            if request.get('output_file', None) is not None:
+                job.output_file = Path(request['output_file'])
+        return 200, {'abort': False}
+
+    def handle_finish(self, request: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            self._expire_leases()
+            job = self._get_leased_job(request.get('job_id', None), request.get('worker', None))
+            if job is None:
+                return 409, {}
+            if request.get('output_file', None) is not None:
+                job.state = DistributedJobState.ENCODED
+                job.output_file = Path(request['output_file'])
+                job.encoded_frames = job.total_frames
+                job.error = None
+                logger.info(f'"{job.source_file.name}" encoded by "{job.worker}" >> {job.output_file.name}')
+                self.on_job_finished(job)
+                self._check_all_done()
+            else:
+                logger.warning(f'"{job.worker}" failed to encode "{job.source_file.name}": {request.get("error")}')
+                self._release(job, request.get('error', None) or 'Unknown error')
+        return 200, {}
+
+    def handle_status(self) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            return 200, {'jobs': [_.to_dict() for _ in self.jobs]}
+
+    def _make_handler(self) -> type:
+        coordinator = self
+
+        class RequestHandler(http.server.BaseHTTPRequestHandler):
+            def _reply(self, code: int, body: Dict[str, Any]) -> None:
+                data = json.dumps(body).encode()
+                self.send_response(code)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _authorized(self) -> bool:
+                if coordinator.token is not None and self.headers.get('X-Encode-Token') != coordinator.token:
+                    self._reply(403, {'error': 'Invalid token'})
+                    return False
+                return True
+
+            def do_GET(self):
+                if not self._authorized():
+                    return
+                if self.path == '/status':
+                    self._reply(*coordinator.handle_status())
+                else:
+                    self._reply(404, {'error': 'Not found'})
+
+            def do_POST(self):
+                if not self._authorized():
+                    return
+                handlers = {'/lease': coordinator.handle_lease, '/heartbeat': coordinator.handle_heartbeat,
+                            '/finish': coordinator.handle_finish}
+                if self.path not in handlers:
+                    self._reply(404, {'error': 'Not found'})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                except ValueError:
+                    self._reply(400, {'error': 'Invalid JSON'})
+                    return
+                self._reply(*handlers[self.path](request))
+
+            def log_message(self, format, *args):
+                logger.debug(f"{self.address_string()} {format % args}")
+
+        return RequestHandler
+
+
+class EncodeWorker:
+    """
+    Lease jobs from a coordinator and encode them, `max_jobs` at a time, until the coordinator runs out of jobs
+    (or forever with `keep_alive`).
+    """
+
+    def __init__(self,
+                 coordinator_url: str,
+                 name: Optional[str] = None,
+                 max_jobs: int = 1,
+                 ffmpeg_executable: str = AnimeProcessor.ffmpeg,
+                 ffprobe_executable: str = AnimeProcessor.ffprobe,
+                 segment_jobs: int = 1,
+                 token: Optional[str] = None,
+                 heartbeat_seconds: float = Constants.DISTRIBUTED_HEARTBEAT_SECONDS,
+                 poll_seconds: float = Constants.DISTRIBUTED_POLL_SECONDS,
+                 skip_crc32: bool = False):
+        """
+        :param coordinator_url: e.g. "http://192.168.1.10:8265"
+        :param name: Shown on the coordinator, host name and pid by default
+        :param skip_crc32: Don't hash sources (same as "--do-not-verify-source")
+        """
+        self.coordinator_url: str = coordinator_url.rstrip('/')
+        self.name: str = name if name is not None else f"{socket.gethostname()}-{os.getpid()}"
+        self.max_jobs: int = max(1, max_jobs)
+        self.ffmpeg_executable = ffmpeg_executable
+        self.ffprobe_executable = ffprobe_executable
+        self.segment_jobs = segment_jobs
+        self.token: Optional[str] = token
+        self.heartbeat_seconds: float = heartbeat_seconds
+        self.poll_seconds: float = poll_seconds
+        self.skip_crc32: bool = skip_crc32
+        self._is_aborted = False
+
+    def _call(self, path: str, body: Optional[Dict[str, Any]] = None) -> Tuple[int, Dict[str, Any]]:
+        """POST `body` (GET if `None`), returns status code and reply"""
+        request = urllib.request.Request(
+            f"{self.coordinator_url}{path}", data=json.dumps(body).encode() if body is not None else None,
+            headers={'Content-Type': 'application/json', **({'X-Encode-Token': self.token} if self.token else {})})
+        try:
+            with urllib.request.urlopen(request, timeout=Constants.DISTRIBUTED_REQUEST_TIMEOUT) as response:
+                return response.status, json.loads(response.read() or b'{}')
+        except urllib.error.HTTPError as ex:
+            return ex.code, json.loads(ex.read() or b'{}')
+
+    def abort(self) -> None:
+        """Abort running encodes (their jobs go back to the coordinator's queue) and stop leasing"""
+        self._is_aborted = True
+
+    def run(self, keep_alive: Optional[Callable[[], bool]] = None) -> None:
+        if not isinstance(keep_alive, Callable):
+            keep_alive = lambda: False
+        workers = [threading.Thread(target=self._run_worker, args=(keep_alive,), name=f"encode-worker-{_}",
+                                    daemon=True) for _ in range(self.max_jobs)]
+        logger.info(f'Worker "{self.name}" taking jobs from {self.coordinator_url}, {self.max_jobs} at a time')
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            self.abort()
+            for worker in workers:
+                worker.join()
+            raise
+
+    def _run_worker(self, keep_alive: Callable[[], bool]) -> None:
+        failed_calls = 0
+        while not self._is_aborted:
+            try:
+                status, reply = self._call('/lease', {'worker': self.name})
+                failed_calls = 0
+            except (OSError, ValueError) as ex:
+                failed_calls += 1
+                if failed_calls >= Constants.DISTRIBUTED_MAX_FAILED_CALLS and not keep_alive():
+                    logger.info(f"Coordinator unreachable ({ex}), stopping")
+                    return
+                time.sleep(self.poll_seconds)
+                continue
+            if status != 200:
+                logger.error(f"Coordinator refused lease request ({status}): {reply.get('error')}")
+                return
+            if reply.get('job', None) is None:
+                if reply.get('done', False) and not keep_alive():
+                    return
+                time.sleep(self.poll_seconds)
+                continue
+            self._run_job(reply['job'], reply.get('preset_files', dict()))
+
+    def _run_job(self, job: Dict[str, Any], preset_files: Dict[str, str]) -> None:
+        job_id, source_file = job['job_id'], Path(job['source_file'])
+        state: Dict[str, Any] = {'worker': self.name, 'job_id': job_id, 'encoded_frames': 0, 'total_frames': 0,
+                                 'fps': None, 'output_file': None}
+        lease_lost = threading.Event()
+        job_done = threading.Event()
+
+        def send_heartbeats() -> None:
+            while not job_done.wait(self.heartbeat_seconds):
+                try:
+                    status, _ = self._call('/heartbeat', state)
+                except (OSError, ValueError) as ex:
+                    logger.warning(f"Heartbeat failed: {ex}")
+                    continue  # lease runs out on its own if the coordinator stays unreachable
+                if status == 409:
+                    logger.warning(f'Lease of "{source_file.name}" lost, aborting it')
+                    lease_lost.set()
+                    return
+
+        def on_progress(progress: FFmpegProgress) -> None:
+            state['fps'] = progress.fps
+
+        def on_frames(encoded_frames: int, total_frames: int) -> None:
+            state['encoded_frames'], state['total_frames'] = encoded_frames, total_frames or 0
+
+        heartbeat_thread = threading.Thread(target=send_heartbeats, name=f"heartbeat-{job_id}", daemon=True)
+        heartbeat_thread.start()
+        preset_dir = Path(tempfile.mkdtemp(prefix="python_encode_preset_"))
+        output_file, error = None, None
+        try:
+            for name, text in preset_files.items():
+                if name in EncodeCoordinator.PRESET_FILES:
+                    (preset_dir / name).write_text(text)
+            encode_preset = EncodePresetObject(preset_dir)
+            logger.info(f'Processing "{source_file.name}"')
+            source_file_object = AnimeProcessor.read_anime_file(
+                file=source_file, ffprobe=self.ffprobe_executable, on_bytes_read_callback=lambda byte_count: ...,
+                abort_signal=lambda: self._is_aborted or lease_lost.is_set(), skip_crc32=self.skip_crc32)
+            if source_file_object is None:
+                raise RuntimeError(f'Cannot read file "{source_file}"')
+            state['total_frames'] = source_file_object.video_frame_count or 0
+            output_file, is_aborted = AnimeProcessor.process_anime_encode(
+                output_dir=Path(job['output_dir']), source_file_object=source_file_object,
+                encode_preset=encode_preset, ffmpeg_executable=self.ffmpeg_executable,
+                ffprobe_executable=self.ffprobe_executable, encode_progress_callback=on_frames,
+                abort_signal=lambda: self._is_aborted or lease_lost.is_set(),
+                encode_progress_object_callback=on_progress,
+                on_stage_changed=lambda stage, file: state.__setitem__('output_file', file.__str__()),
+                segment_jobs=self.segment_jobs
+            )
+            if output_file is None:
+                error = "Aborted" if is_aborted else "Encode failed, see worker log"
+        except Exception as ex:
+            logger.error(f'Encode job "{source_file.name}" failed: {ex}')
+            error = f"{type(ex).__name__}: {ex}"
+        finally:
+            job_done.set()
+            heartbeat_thread.join()
+            shutil.rmtree(preset_dir, ignore_errors=True)
+        if lease_lost.is_set():
+            return
+        if output_file is not None:
+            logger.info(f"Encode complete >> {output_file.name}")
+        try:
+            self._call('/finish', {'worker': self.name, 'job_id': job_id, 'error': error,
+                                   'output_file': output_file.__str__() if output_file is not None else None})
+        except (OSError, ValueError) as ex:
+            logger.error(f'Cannot report "{source_file.name}" to coordinator: {ex}')
@@ -0,0 +1,212 @@
+"""
+Predict when each encode, and the whole queue, is going to finish.
+
+Rate of a job is taken from (first one available):
+    1. live ffmpeg fps / speed of the job itself
+    2. the preset's speed measured in earlier runs (`ThroughputHistory`)
+    3. average live fps / speed of the other running jobs
+Frame count is used when it's known, otherwise video length and realtime speed.
+"""
+
+from __future__ import annotations
+
+import datetime
+import heapq
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Dict, Tuple, List
+
+from python_encode.encode_scheduler import EncodeScheduler, EncodeJob, EncodeJobState
+from python_encode.utils import HelperFunctions
+
+logger = logging.getLogger(__name__)
+
+
+class ThroughputHistory:
+    """
+    Encode speed of each preset from earlier runs, kept under the user cache directory.
+
+    Speed is per job, so it already includes the slowdown of running several jobs at the same time.
+    Safe to share between threads.
+    """
+
+    SCHEMA_VERSION = 1
+    DEFAULT_DB_NAME = "throughput_history.sqlite3"
+    SMOOTHING = 0.3  # weight of the newest encode, older ones fade out
+
+    def __init__(self, db_file: Optional[Path] = None):
+        if not isinstance(db_file, Path):
+            db_file = HelperFunctions.get_user_cache_dir() / self.DEFAULT_DB_NAME
+        self.db_file: Path = db_file
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_file.__str__(), check_same_thread=False)
+        with self._lock, self._connection:
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS throughput")
+                self._connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS throughput ("
+                "preset TEXT PRIMARY KEY, fps REAL, speed REAL, samples INTEGER NOT NULL)"
+            )
+
+    def get(self, preset_name: str) -> Tuple[Optional[float], Optional[float]]:
+        """Returns (frames per second, realtime speed) of `preset_name`, `None` if never measured"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT fps, speed FROM throughput WHERE preset = ?", (preset_name,)).fetchone()
+        return (None, None) if row is None else (row[0], row[1])
+
+    def record(self, preset_name: str, frames: Optional[int], media_seconds: Optional[float],
+               wall_seconds: float) -> None:
+        """Add one finished encode of `preset_name`"""
+        if wall_seconds <= 0:
+            return
+        fps = frames / wall_seconds if frames else None
+        speed = media_seconds / wall_seconds if media_seconds else None
+        old_fps, old_speed = self.get(preset_name)
+
+        def smooth(old: Optional[float], new: Optional[float]) -> Optional[float]:
+            if old is None or new is None:
+                return new if new is not None else old
+            return old * (1 - self.SMOOTHING) + new * self.SMOOTHING
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO throughput (preset, fps, speed, samples) VALUES (?, ?, ?, 1) "
+                "ON CONFLICT(preset) DO UPDATE SET fps = excluded.fps, speed = excluded.speed, samples = samples + 1",
+                (preset_name, smooth(old_fps, fps), smooth(old_speed, speed))
+            )
+        logger.debug(f'Throughput of "{preset_name}": {fps} fps, {speed}x')
+
+    def purge(self) -> int:
+        with self._lock, self._connection:
+            removed = self._connection.execute("DELETE FROM throughput").rowcount
+        logger.info(f"{self.__class__.__name__} purged, {removed} entries removed.")
+        return removed
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+
+class EncodeEstimate:
+    __slots__ = 'job_remaining_seconds', 'queue_remaining_seconds', 'created_at'
+
+    def __init__(self, job_remaining_seconds: Dict[EncodeJob, Optional[float]],
+                 queue_remaining_seconds: Optional[float]):
+        # seconds from now until each job is finished (queued jobs included), `None` if unknown
+        self.job_remaining_seconds: Dict[EncodeJob, Optional[float]] = job_remaining_seconds
+        self.queue_remaining_seconds: Optional[float] = queue_remaining_seconds  # `None` if any job is unknown
+        self.created_at: datetime.datetime = datetime.datetime.now()
+
+    def finish_time(self, job: Optional[EncodeJob] = None) -> Optional[datetime.datetime]:
+        """Wall clock time `job` (or the whole queue if `job` is `None`) is expected to finish"""
+        seconds = self.queue_remaining_seconds if job is None else self.job_remaining_seconds.get(job, None)
+        return None if seconds is None else self.created_at + datetime.timedelta(seconds=seconds)
+
+    @staticmethod
+    def format_seconds(seconds: Optional[float]) -> str:
+        if seconds is None:
+            return "--:--:--"
+        seconds = int(seconds)
+        return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+    def __str__(self) -> str:
+        finish_time = self.finish_time()
+        return f"ETA {EncodeEstimate.format_seconds(self.queue_remaining_seconds)}" + \
+            ("" if finish_time is None else f" ({finish_time:%a %H:%M})")
+
+
+class EncodeEstimator:
+    """
+    ETA of the jobs of an `EncodeScheduler`.
+
+    Call `on_job_finished()` for each finished job so the preset's speed is remembered for next time.
+    """
+
+    def __init__(self, scheduler: EncodeScheduler, history: Optional[ThroughputHistory] = None):
+        self.scheduler = scheduler
+        self.history = history
+        self.preset_name: str = scheduler.encode_preset.preset_name
+        self.history_fps, self.history_speed = history.get(self.preset_name) if history is not None else (None, None)
+        self._started_at: Dict[EncodeJob, float] = dict()
+        self._lock = threading.Lock()
+        self._last_estimate: Optional[EncodeEstimate] = None
+        self._last_estimate_at: float = 0.0
+
+    def on_job_started(self, job: EncodeJob) -> None:
+        self._started_at[job] = time.monotonic()
+
+    def on_job_finished(self, job: EncodeJob) -> None:
+        started_at = self._started_at.pop(job, None)
+        if self.history is None or started_at is None or job.state != EncodeJobState.ENCODED:
+            return
+        self.history.record(self.preset_name, job.total_frames, job.source_file_object.video_length_seconds,
+                            time.monotonic() - started_at)
+
+    @staticmethod
+    def _live_rates(job: EncodeJob) -> Tuple[Optional[float], Optional[float]]:
+        progress = job.last_progress
+        if job.state != EncodeJobState.ENCODING or progress is None:
+            return None, None
+        return progress.fps or None, progress.speed or None  # ffmpeg reports 0 before the first frames
+
+    @staticmethod
+    def _average(values: List[Optional[float]]) -> Optional[float]:
+        values = [_ for _ in values if _ is not None]
+        return sum(values) / len(values) if len(values) > 0 else None
+
+    def estimate_job(self, job: EncodeJob, fallback_fps: Optional[float] = None,
+                     fallback_speed: Optional[float] = None) -> Optional[float]:
+        """Seconds until `job` is finished, `None` if there is nothing to estimate it with"""
+        if job.state not in (EncodeJobState.QUEUED, EncodeJobState.ENCODING):
+            return 0.0
+        live_fps, live_speed = self._live_rates(job)
+        fps = live_fps or self.history_fps or fallback_fps
+        speed = live_speed or self.history_speed or fallback_speed
+        if job.total_frames > 0 and fps is not None:
+            return max(0, job.total_frames - job.encoded_frames) / fps
+        length = job.source_file_object.video_length_seconds
+        if length is not None and speed is not None:
+            encoded_seconds = job.last_progress.out_time_seconds if job.last_progress is not None else None
+            return max(0.0, length - (encoded_seconds or 0.0)) / speed
+        return None
+
+    def estimate(self, max_age_seconds: float = 0.0) -> EncodeEstimate:
+        """
+        :param max_age_seconds: Return the previous estimate if it's younger than this, for callers running on every
+            ffmpeg progress update (e.g. `Constants.ESTIMATE_INTERVAL`).
+        """
+        with self._lock:
+            if self._last_estimate is not None and time.monotonic() - self._last_estimate_at < max_age_seconds:
+                return self._last_estimate
+        estimate = self._estimate()
+        with self._lock:
+            self._last_estimate, self._last_estimate_at = estimate, time.monotonic()
+        return estimate
+
+    def _estimate(self) -> EncodeEstimate:
+        jobs = list(self.scheduler.jobs)  # jobs can be submitted while this runs
+        live_rates = [self._live_rates(_) for _ in jobs]
+        fallback_fps = self._average([_[0] for _ in live_rates])
+        fallback_speed = self._average([_[1] for _ in live_rates])
+        job_remaining_seconds = {
+            job: self.estimate_job(job, fallback_fps, fallback_speed) for job in jobs
+        }
+        queue_remaining_seconds = None
+        if None not in job_remaining_seconds.values():
+            # running jobs hold the workers first, queued jobs then go to whichever worker is free first
+            workers = [0.0] * self.scheduler.max_jobs
+            running_jobs = [_ for _ in jobs if _.state == EncodeJobState.ENCODING]
+            for idx, job in enumerate(running_jobs[:len(workers)]):
+                workers[idx] = job_remaining_seconds[job]
+            heapq.heapify(workers)
+            queued_jobs = [_ for _ in jobs if _.state == EncodeJobState.QUEUED]
+            for job in sorted(queued_jobs, key=lambda _: _.priority):  # sort is stable, same as the queue
+                finish_at = heapq.heappop(workers) + job_remaining_seconds[job]
+                heapq.heappush(workers, finish_at)
+                job_remaining_seconds[job] = finish_at  # from now, not from when the job starts
+            queue_remaining_seconds = max(workers)
+        return EncodeEstimate(job_remaining_seconds, queue_remaining_seconds)
@@ -0,0 +1,313 @@
+"""
+Run several `AnimeProcessor.process_anime_encode` jobs at the same time.
+
+Useful when one ffmpeg can't use the whole machine (audio only / stream copy presets, or x265 with few pools).
+"""
+
+from __future__ import annotations
+
+import copy
+import itertools
+import logging
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Callable, List, Tuple, Dict
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject, EncodePresetObject, FFmpegProgress
+from python_encode.encode_window import EncodeWindowSchedule, ProcessSuspender
+from python_encode.utils import ProbeResultKeys
+
+logger = logging.getLogger(__name__)
+
+
+class EncodeJobState:
+    QUEUED = 'queued'
+    ENCODING = 'encoding'
+    ENCODED = 'encoded'
+    FAILED = 'failed'
+    ABORTED = 'aborted'
+
+
+class EncodeJob:
+    __slots__ = (
+        'source_file_object',
+        'priority',
+        'state',
+        'output_file',
+        'encoded_frames',
+        'last_progress',
+    )
+
+    def __init__(self, source_file_object: AnimeFileObject, priority: int = 0):
+        self.source_file_object: AnimeFileObject = source_file_object
+        self.priority: int = priority  # smaller number starts first, same priority starts in submit order
+        self.state: str = EncodeJobState.QUEUED
+        self.output_file: Optional[Path] = None
+        self.encoded_frames: int = 0
+        self.last_progress: Optional[FFmpegProgress] = None  # latest ffmpeg progress while encoding
+
+    @property
+    def total_frames(self) -> int:
+        return self.source_file_object.video_frame_count or 0
+
+    def __str__(self):
+        return f"EncodeJob(file={self.source_file_object.file_name}, priority={self.priority}, state={self.state}, " \
+               f"frames={self.encoded_frames}/{self.total_frames}, output_file={self.output_file})"
+
+
+class EncodeScheduler:
+    """
+    A priority queue of encode jobs and `max_jobs` worker threads each running one ffmpeg at a time.
+
+    Usage: `submit()` jobs, then `run()` blocks until the queue is empty (or aborted).
+    """
+
+    IDLE_WAIT_SECONDS = 0.5  # how often idle workers check `keep_alive` and abort signal
+    WINDOW_CHECK_SECONDS = 5  # how often encode windows are checked
+
+    def __init__(self,
+                 output_dir: Path,
+                 encode_preset: Optional[EncodePresetObject] = None,
+                 max_jobs: int = 1,
+                 threads_per_job: Optional[int] = None,
+                 ffmpeg_executable: str = AnimeProcessor.ffmpeg,
+                 ffprobe_executable: str = AnimeProcessor.ffprobe,
+                 show_ffmpeg_stdout: bool = False,
+                 on_job_started: Optional[Callable[[EncodeJob], None]] = None,
+                 on_job_finished: Optional[Callable[[EncodeJob], None]] = None,
+                 on_progress: Optional[Callable[[int, int], None]] = None,
+                 on_job_progress: Optional[Callable[[EncodeJob, FFmpegProgress], None]] = None,
+                 on_job_stage_changed: Optional[Callable[[EncodeJob, str, Path], None]] = None,
+                 abort_signal: Optional[Callable[[], bool]] = None,
+                 encode_windows: Optional[EncodeWindowSchedule] = None,
+                 segment_jobs: int = 1):
+        """
+        :param output_dir: Where encoded files are saved
+        :param encode_preset: Preset for all jobs
+        :param max_jobs: Number of ffmpeg processes running at the same time
+        :param threads_per_job: Limit threads of each ffmpeg (ffmpeg "-threads", x265 "pools"). `None` means no limit.
+        :param on_job_started: Called (from a worker thread) before a job starts encoding
+        :param on_job_finished: Called (from a worker thread) after a job is encoded, failed or aborted
+        :param on_progress: (encoded frames, total frames) of all submitted jobs combined. Calls are serialized.
+        :param on_job_progress: ffmpeg progress of one job (fps, bitrate, speed...). Calls are serialized.
+        :param on_job_stage_changed: (job, `EncodeStage`, output file) see `AnimeProcessor.process_anime_encode`
+        :param abort_signal: Running jobs are aborted and queued jobs are skipped once it returns True
+        :param encode_windows: Jobs only start while a window is open, running ffmpeg is suspended when all close.
+        :param segment_jobs: Cut each file at keyframes and encode this many segments of it at the same time,
+            see `SegmentEncoder`. Every job runs up to this many ffmpeg processes.
+        """
+        if not isinstance(encode_preset, EncodePresetObject):
+            encode_preset = EncodePresetObject()
+        self.output_dir = output_dir
+        self.max_jobs = max(1, max_jobs)
+        self.encode_preset = encode_preset if threads_per_job is None \
+            else EncodeScheduler.apply_thread_limit(encode_preset, threads_per_job)
+        self.ffmpeg_executable = ffmpeg_executable
+        self.ffprobe_executable = ffprobe_executable
+        self.show_ffmpeg_stdout = show_ffmpeg_stdout
+        self.segment_jobs = max(1, segment_jobs)
+        self.on_job_started = on_job_started if isinstance(on_job_started, Callable) else lambda job: ...
+        self.on_job_finished = on_job_finished if isinstance(on_job_finished, Callable) else lambda job: ...
+        self.on_progress = on_progress if isinstance(on_progress, Callable) else lambda encoded, total: ...
+        self.on_job_progress = on_job_progress if isinstance(on_job_progress, Callable) else lambda job, progress: ...
+        self.on_job_stage_changed = on_job_stage_changed if isinstance(on_job_stage_changed, Callable) \
+            else lambda job, stage, file: ...
+        self.abort_signal = abort_signal if isinstance(abort_signal, Callable) else lambda: False
+
+        self.jobs: List[EncodeJob] = list()
+        self._queue: queue.PriorityQueue = queue.PriorityQueue()
+        self._sequence = itertools.count()  # keeps FIFO order within the same priority
+        self._progress_lock = threading.Lock()
+        self._is_aborted = False
+        self.encode_windows = encode_windows if encode_windows is not None else EncodeWindowSchedule()
+        self._processes: Dict[EncodeJob, List[subprocess.Popen]] = dict()  # ffmpeg of running jobs
+        self._process_lock = threading.Lock()
+        self._is_suspended = False
+
+    @staticmethod
+    def apply_thread_limit(encode_preset: EncodePresetObject, threads: int) -> EncodePresetObject:
+        """Returns a copy of `encode_preset` with ffmpeg "-threads" and x265 "pools" set to `threads`"""
+        limited_preset = copy.deepcopy(encode_preset)
+        options = limited_preset.extra_options
+        video_params = limited_preset.stream_params.get(ProbeResultKeys.StreamTypes.VIDEO, dict())
+        if '-threads' not in options and video_params.get('threads', None) is None:
+            options.extend(['-threads', str(threads)])
+
+        # add to the preset's own x265 params, ffmpeg only takes one of them
+        if video_params.get('x265-params', None) is not None:
+            if 'pools=' not in str(video_params['x265-params']):
+                video_params['x265-params'] = f"{video_params['x265-params']}:pools={threads}"
+        elif '-x265-params' in options:
+            idx = options.index('-x265-params') + 1
+            if idx < len(options) and 'pools=' not in options[idx]:
+                options[idx] = f"{options[idx]}:pools={threads}"
+        elif video_params.get('c', None) == 'libx265':
+            options.extend(['-x265-params', f'pools={threads}'])
+        logger.debug(f"Preset extra options with thread limit: {options}")
+        return limited_preset
+
+    def submit(self, source_file_object: AnimeFileObject, priority: int = 0) -> EncodeJob:
+        job = EncodeJob(source_file_object, priority)
+        self.jobs.append(job)
+        self._queue.put((priority, next(self._sequence), job))
+        return job
+
+    def get_progress(self) -> Tuple[int, int]:
+        """(encoded frames, total frames) of all jobs"""
+        return sum(_.encoded_frames for _ in self.jobs), sum(_.total_frames for _ in self.jobs)
+
+    def _should_abort(self) -> bool:
+        if not self._is_aborted and self.abort_signal():
+            self._is_aborted = True
+        return self._is_aborted
+
+    def _update_progress(self, job: EncodeJob, encoded_frames: int) -> None:
+        with self._progress_lock:
+            job.encoded_frames = encoded_frames
+            self.on_progress(*self.get_progress())
+
+    def _update_job_progress(self, job: EncodeJob, progress: FFmpegProgress) -> None:
+        with self._progress_lock:
+            job.last_progress = progress
+            self.on_job_progress(job, progress)
+
+    def running_jobs(self) -> List[EncodeJob]:
+        return [_ for _ in self.jobs if _.state == EncodeJobState.ENCODING]
+
+    def _on_process_started(self, job: EncodeJob, proc: subprocess.Popen) -> None:
+        with self._process_lock:
+            self._processes.setdefault(job, list()).append(proc)
+            if self._is_suspended:
+                # started right as the window closed
+                ProcessSuspender.suspend(proc)
+
+    def _set_suspended(self, suspended: bool) -> None:
+        with self._process_lock:
+            if self._is_suspended == suspended:
+                return
+            self._is_suspended = suspended
+            running = [(job, proc) for job, procs in self._processes.items() for proc in procs if proc.poll() is None]
+            for job, proc in running:
+                try:
+                    ProcessSuspender.suspend(proc) if suspended else ProcessSuspender.resume(proc)
+                except OSError as ex:
+                    logger.warning(f'Cannot {"suspend" if suspended else "resume"} encode of '
+                                   f'"{job.source_file_object.file_name}": {ex}')
+        if len(running) > 0:
+            logger.info(f"{'Suspended' if suspended else 'Resumed'} {len(running)} running encode(s)")
+
+    def _wait_for_window(self) -> None:
+        """Block until an encode window is open (or aborted)"""
+        if self.encode_windows.is_open():
+            return
+        logger.info(f"Outside encode windows ({self.encode_windows}), waiting until {self.encode_windows.next_change()}")
+        while not self.encode_windows.is_open() and not self._should_abort():
+            time.sleep(self.IDLE_WAIT_SECONDS)
+
+    def _run_window_monitor(self, is_running: Callable[[], bool]) -> None:
+        last_check = 0.0
+        while is_running():
+            if self._should_abort():
+                self._set_suspended(False)  # a stopped ffmpeg can't be terminated
+            elif time.monotonic() - last_check >= self.WINDOW_CHECK_SECONDS:
+                last_check = time.monotonic()
+                is_open = self.encode_windows.is_open()
+                if is_open == self._is_suspended:
+                    logger.info(f"Encode window {'opened' if is_open else 'closed'}, next change at "
+                                f"{self.encode_windows.next_change()}")
+                    self._set_suspended(not is_open)
+            time.sleep(self.IDLE_WAIT_SECONDS)
+        self._set_suspended(False)
+
+    def _run_worker(self, keep_alive: Callable[[], bool]) -> None:
+        while True:
+            try:
+                _, _, job = self._queue.get(timeout=self.IDLE_WAIT_SECONDS) if keep_alive() \
+                    else self._queue.get_nowait()
+            except queue.Empty:
+                if keep_alive() and not self._should_abort():
+                    continue
+                return
+            self._wait_for_window()
+            if self._should_abort():
+                job.state = EncodeJobState.ABORTED
+                continue
+            job.state = EncodeJobState.ENCODING
+            self.on_job_started(job)
+            try:
+                job.output_file, is_aborted = AnimeProcessor.process_anime_encode(
+                    output_dir=self.output_dir, source_file_object=job.source_file_object,
+                    encode_preset=self.encode_preset, ffmpeg_executable=self.ffmpeg_executable,
+                    ffprobe_executable=self.ffprobe_executable,
+                    encode_progress_callback=lambda encoded_frames, total_frames: self._update_progress(
+                        job, encoded_frames),
+                    show_ffmpeg_stdout=self.show_ffmpeg_stdout, abort_signal=self._should_abort,
+                    encode_progress_object_callback=lambda progress: self._update_job_progress(job, progress),
+                    on_stage_changed=lambda stage, file: self.on_job_stage_changed(job, stage, file),
+                    on_process_started=lambda proc: self._on_process_started(job, proc),
+                    segment_jobs=self.segment_jobs
+                )
+            except Exception as ex:
+                logger.error(f'Encode job "{job.source_file_object.file_name}" failed: {ex}')
+                job.output_file, is_aborted = None, False
+            with self._process_lock:
+                self._processes.pop(job, None)
+            if is_aborted:
+                job.state = EncodeJobState.ABORTED
+            elif job.output_file is None:
+                job.state = EncodeJobState.FAILED
+            else:
+                job.state = EncodeJobState.ENCODED
+                self._update_progress(job, job.total_frames)
+            self.on_job_finished(job)
+
+    def run(self, keep_alive: Optional[Callable[[], bool]] = None) -> List[EncodeJob]:
+        """
+        Encode all submitted jobs, returns them in submit order
+
+        :param keep_alive: Workers wait for more jobs (`submit()` from another thread) while it returns True,
+            instead of returning as soon as the queue is empty.
+        """
+        if not isinstance(keep_alive, Callable):
+            keep_alive = lambda: False
+            logger.info(f"Encoding {self._queue.qsize()} file(s), {self.max_jobs} at a time")
+            worker_count = min(self.max_jobs, max(1, self._queue.qsize()))
+        else:
+            logger.info(f"Waiting for files to encode, {self.max_jobs} at a time")
+            worker_count = self.max_jobs
+        workers = [threading.Thread(target=self._run_worker, args=(keep_alive,), name=f"encode-worker-{_}",
+                                    daemon=True) for _ in range(worker_count)]
+        for worker in workers:
+            worker.start()
+        window_monitor = None
+        if len(self.encode_windows.windows) > 0:
+            window_monitor = threading.Thread(
+                target=self._run_window_monitor, args=(lambda: any(_.is_alive() for _ in workers),),
+                name="encode-window-monitor", daemon=True)
+            window_monitor.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # let the workers stop their ffmpeg before leaving
+            self.abort()
+            for worker in workers:
+                worker.join()
+            raise
+        finally:
+            if window_monitor is not None:
+                window_monitor.join()
+        return self.jobs
+
+    def abort(self) -> None:
+        """Stop running jobs and skip queued ones, same as `abort_signal` returning True"""
+        self._is_aborted = True
+        self._set_suspended(False)  # a stopped ffmpeg can't be terminated
+
+    @property
+    def is_aborted(self) -> bool:
+        return self._is_aborted
@@ -0,0 +1,161 @@
+"""
+Only let ffmpeg run inside encode windows (e.g. nights and weekends).
+
+Unlike `SleepModule`, which only decides whether the next file may start, encodes still running when a window
+closes are suspended (SIGSTOP, or NtSuspendProcess on Windows) and continue where they were when the next one opens.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import datetime
+import logging
+import os
+import signal
+import subprocess
+from typing import List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class EncodeWindow:
+    """
+    Weekdays + time of day range. The range crosses midnight if end <= start, and then belongs to the day it starts on
+    ("fri 22:00-07:00" is friday night to saturday morning).
+
+    Written as "[days ]HH:MM-HH:MM", days being a comma separated list of names or ranges: "mon-fri", "sat,sun".
+    "24:00" is allowed as end time. No days means every day.
+    """
+    __slots__ = 'weekdays', 'start', 'end'
+
+    WEEKDAYS = ['mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun']
+
+    def __init__(self, weekdays: Set[int], start: datetime.timedelta, end: datetime.timedelta):
+        self.weekdays: Set[int] = weekdays  # 0 = monday, same as datetime.weekday()
+        self.start: datetime.timedelta = start  # from midnight
+        self.end: datetime.timedelta = end
+
+    @staticmethod
+    def _parse_time(text: str) -> datetime.timedelta:
+        hour, _, minute = text.strip().partition(':')
+        hour, minute = int(hour), int(minute or 0)
+        if not 0 <= hour <= 24 or not 0 <= minute < 60 or (hour == 24 and minute != 0):
+            raise ValueError(f'Invalid time "{text}"')
+        return datetime.timedelta(hours=hour, minutes=minute)
+
+    @staticmethod
+    def _parse_weekdays(text: str) -> Set[int]:
+        weekdays = set()
+        for part in text.lower().split(','):
+            first, _, last = part.strip().partition('-')
+            if first[:3] not in EncodeWindow.WEEKDAYS or (last != '' and last[:3] not in EncodeWindow.WEEKDAYS):
+                raise ValueError(f'Invalid weekday "{part}", expect {", ".join(EncodeWindow.WEEKDAYS)}')
+            first_idx = EncodeWindow.WEEKDAYS.index(first[:3])
+            last_idx = EncodeWindow.WEEKDAYS.index(last[:3]) if last != '' else first_idx
+            idx = first_idx
+            while True:  # "sat-mon" wraps around
+                weekdays.add(idx)
+                if idx == last_idx:
+                    break
+                idx = (idx + 1) % 7
+        return weekdays
+
+    @staticmethod
+    def parse(text: str) -> EncodeWindow:
+        parts = text.strip().split()
+        if len(parts) not in (1, 2) or '-' not in parts[-1]:
+            raise ValueError(f'Invalid encode window "{text}", expect "[days ]HH:MM-HH:MM"')
+        start, _, end = parts[-1].partition('-')
+        weekdays = EncodeWindow._parse_weekdays(parts[0]) if len(parts) == 2 else set(range(7))
+        return EncodeWindow(weekdays, EncodeWindow._parse_time(start), EncodeWindow._parse_time(end))
+
+    def _open_ranges(self, day: datetime.datetime) -> List[tuple]:
+        """(open, close) datetimes of this window starting on `day`'s date, empty if `day` isn't one of its weekdays"""
+        if day.weekday() not in self.weekdays:
+            return []
+        midnight = day.replace(hour=0, minute=0, second=0, microsecond=0)
+        end = self.end if self.end > self.start else self.end + datetime.timedelta(days=1)
+        return [(midnight + self.start, midnight + end)]
+
+    def is_open(self, now: datetime.datetime) -> bool:
+        # a window crossing midnight could have started yesterday
+        for day in (now - datetime.timedelta(days=1), now):
+            for open_at, close_at in self._open_ranges(day):
+                if open_at <= now < close_at:
+                    return True
+        return False
+
+    def __str__(self):
+        days = ','.join(EncodeWindow.WEEKDAYS[_] for _ in sorted(self.weekdays))
+
+        def hh_mm(delta: datetime.timedelta) -> str:
+            return f"{int(delta.total_seconds()) // 3600:02d}:{int(delta.total_seconds()) // 60 % 60:02d}"
+        return f"{days} {hh_mm(self.start)}-{hh_mm(self.end)}"
+
+
+class EncodeWindowSchedule:
+    """Encoding is allowed while any of the windows is open. No windows means always allowed."""
+
+    def __init__(self, windows: Optional[List[EncodeWindow]] = None):
+        self.windows: List[EncodeWindow] = windows if windows is not None else list()
+
+    @staticmethod
+    def parse(texts: List[str]) -> EncodeWindowSchedule:
+        return EncodeWindowSchedule([EncodeWindow.parse(_) for _ in texts])
+
+    def is_open(self, now: Optional[datetime.datetime] = None) -> bool:
+        if len(self.windows) == 0:
+            return True
+        now = now if now is not None else datetime.datetime.now()
+        return any(_.is_open(now) for _ in self.windows)
+
+    def next_change(self, now: Optional[datetime.datetime] = None) -> Optional[datetime.datetime]:
+        """When `is_open()` changes next, `None` if it never does (no windows, or they cover the whole week)"""
+        now = now if now is not None else datetime.datetime.now()
+        state = self.is_open(now)
+        # the schedule repeats every week, so it changes (if ever) at one of the window edges of the next 7 days.
+        # An edge inside another open window changes nothing, hence checking each one in order
+        edges = set()
+        for days in range(-1, 8):
+            for window in self.windows:
+                for open_at, close_at in window._open_ranges(now + datetime.timedelta(days=days)):
+                    edges.update(_ for _ in (open_at, close_at) if _ > now)
+        for moment in sorted(edges):
+            if self.is_open(moment) != state:
+                return moment
+        return None
+
+    def __str__(self):
+        return ", ".join(_.__str__() for _ in self.windows) if len(self.windows) > 0 else "always"
+
+
+class ProcessSuspender:
+    """Suspend / resume a running process without killing it"""
+
+    @staticmethod
+    def suspend(proc: subprocess.Popen) -> None:
+        if os.name == 'nt':
+            ProcessSuspender._nt_call('NtSuspendProcess', proc.pid)
+        else:
+            os.kill(proc.pid, signal.SIGSTOP)
+
+    @staticmethod
+    def resume(proc: subprocess.Popen) -> None:
+        if os.name == 'nt':
+            ProcessSuspender._nt_call('NtResumeProcess', proc.pid)
+        else:
+            os.kill(proc.pid, signal.SIGCONT)
+
+    @staticmethod
+    def _nt_call(function_name: str, pid: int) -> None:
+        process_suspend_resume = 0x0800
+        kernel32 = ctypes.WinDLL('kernel32', use_last_error=True)
+        handle = kernel32.OpenProcess(process_suspend_resume, False, pid)
+        if not handle:
+            raise ctypes.WinError(ctypes.get_last_error())
+        try:
+            status = getattr(ctypes.WinDLL('ntdll'), function_name)(handle)
+            if status != 0:
+                raise OSError(f"{function_name} failed with NTSTATUS {status:#x}")
+        finally:
+            kernel32.CloseHandle(handle)
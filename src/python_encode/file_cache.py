@@ -0,0 +1,243 @@
+"""
+On-disk caches for things that are expensive to recompute from a video file (ffprobe output and CRC32).
+
+Everything is keyed by the file's identity (absolute path + size + mtime, and inode where the OS has one),
+so an entry goes stale by itself as soon as the file is replaced or modified.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from python_encode.utils import HelperFunctions
+
+logger = logging.getLogger(__name__)
+
+
+class FileIdentity:
+    """Snapshot of `os.stat()` fields that tell whether a file has changed since it was cached"""
+    __slots__ = 'path', 'size', 'mtime_ns', 'inode'
+
+    def __init__(self, path: str, size: int, mtime_ns: int, inode: int = 0):
+        self.path: str = path
+        self.size: int = size
+        self.mtime_ns: int = mtime_ns
+        self.inode: int = inode  # 0 when not available (e.g. some network shares) or not used
+
+    @staticmethod
+    def of(file: Path, use_inode: bool = True) -> FileIdentity:
+        stat = file.stat()
+        return FileIdentity(
+            path=file.absolute().__str__(),
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            inode=stat.st_ino if use_inode else 0
+        )
+
+    def matches(self, size: int, mtime_ns: int, inode: int) -> bool:
+        return self.size == size and self.mtime_ns == mtime_ns and (self.inode == 0 or inode == 0 or self.inode == inode)
+
+    def __str__(self):
+        return f"FileIdentity(path={self.path}, size={self.size}, mtime_ns={self.mtime_ns}, inode={self.inode})"
+
+
+class FileIdentityCache:
+    """
+    SQLite-backed cache of one value per file, stored under the user cache directory by default.
+
+    Safe to share between threads. Hit/miss counters are per instance (i.e. per session).
+    Subclasses set table name, db name and how values are stored.
+    """
+
+    SCHEMA_VERSION = 1
+    TABLE_NAME = ""
+    DEFAULT_DB_NAME = ""
+    VALUE_TYPE = "TEXT"
+    LOCK_TIMEOUT = 5.0  # seconds to wait for another process holding the database, then it's a miss
+
+    def __init__(self, db_file: Optional[Path] = None, use_inode: bool = True):
+        if not isinstance(db_file, Path):
+            db_file = HelperFunctions.get_user_cache_dir() / self.DEFAULT_DB_NAME
+        self.db_file: Path = db_file
+        self.use_inode: bool = use_inode
+        self.hits: int = 0
+        self.misses: int = 0
+        self.bytes_avoided: int = 0  # total size of files whose cached value was used
+        self._lock = threading.Lock()
+        # `None` when the database can't be used, every lookup is a miss then
+        self._connection: Optional[sqlite3.Connection] = None
+        try:
+            self._connect()
+        except sqlite3.OperationalError as ex:
+            # locked by another process, read only, gone network share...
+            logger.warning(f'{self.__class__.__name__} disabled, cannot open "{self.db_file}": {ex}')
+        except sqlite3.DatabaseError as ex:
+            # not a database (anymore), and it's only a cache
+            logger.warning(f'{self.__class__.__name__} "{self.db_file}" is corrupt ({ex}), recreating it.')
+            self.db_file.unlink(missing_ok=True)
+            self._connect()
+        logger.debug(f"{self.__class__.__name__} opened: {self.db_file}")
+
+    def _connect(self) -> None:
+        self._connection = sqlite3.connect(self.db_file.__str__(), timeout=self.LOCK_TIMEOUT, check_same_thread=False)
+        try:
+            self._create_tables()
+        except sqlite3.DatabaseError:
+            self._connection.close()
+            self._connection = None
+            raise
+
+    def _create_tables(self) -> None:
+        with self._lock, self._connection:
+            version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+            if version != self.SCHEMA_VERSION:
+                # it's a cache, throwing old data away is cheaper than migrating it
+                logger.debug(f"{self.db_file.name} schema version {version} != {self.SCHEMA_VERSION}, recreating tables.")
+                self._connection.execute(f"DROP TABLE IF EXISTS {self.TABLE_NAME}")
+                self._connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._connection.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.TABLE_NAME} ("
+                f"path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                f"value {self.VALUE_TYPE} NOT NULL)"
+            )
+
+    def _encode_value(self, value: Any) -> Any:
+        return value
+
+    def _decode_value(self, value: Any) -> Any:
+        return value
+
+    def get(self, file: Path) -> Optional[Any]:
+        """
+        Return cached value of `file`, or `None` if not cached, the file has changed since, or the database can't be
+        read (locked, corrupt).
+        """
+        identity = FileIdentity.of(file, self.use_inode)
+        with self._lock:
+            row = None
+            try:
+                if self._connection is not None:
+                    row = self._connection.execute(
+                        f"SELECT size, mtime_ns, inode, value FROM {self.TABLE_NAME} WHERE path = ?", (identity.path,)
+                    ).fetchone()
+                if row is not None and not identity.matches(row[0], row[1], row[2]):
+                    logger.debug(f"{self.__class__.__name__} entry is stale: {identity}")
+                    row = None
+                    with self._connection:
+                        self._connection.execute(f"DELETE FROM {self.TABLE_NAME} WHERE path = ?", (identity.path,))
+            except sqlite3.DatabaseError as ex:
+                logger.warning(f'{self.__class__.__name__} cannot read "{self.db_file}": {ex}')
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.bytes_avoided += identity.size
+        logger.debug(f"{self.__class__.__name__} hit: {identity.path}")
+        return self._decode_value(row[3])
+
+    def put(self, file: Path, value: Any) -> None:
+        """Cache `value` for `file`, nothing happens if the database can't be written (locked, corrupt)"""
+        identity = FileIdentity.of(file, self.use_inode)
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                with self._connection:
+                    self._connection.execute(
+                        f"INSERT OR REPLACE INTO {self.TABLE_NAME} (path, size, mtime_ns, inode, value) "
+                        f"VALUES (?, ?, ?, ?, ?)",
+                        (identity.path, identity.size, identity.mtime_ns, identity.inode, self._encode_value(value))
+                    )
+            except sqlite3.DatabaseError as ex:
+                logger.warning(f'{self.__class__.__name__} cannot write "{self.db_file}": {ex}')
+
+    def purge(self) -> int:
+        """Remove all entries. Returns number of entries removed."""
+        with self._lock:
+            if self._connection is None:
+                return 0
+            with self._connection:
+                removed = self._connection.execute(f"DELETE FROM {self.TABLE_NAME}").rowcount
+        logger.info(f"{self.__class__.__name__} purged, {removed} entries removed.")
+        return removed
+
+    def stats(self) -> str:
+        total = self.hits + self.misses
+        return f"{self.TABLE_NAME} cache: {self.hits} hit(s), {self.misses} miss(es)" + \
+            (f" ({self.hits / total:.0%} hit rate)" if total > 0 else "")
+
+    def close(self) -> None:
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+
+
+class ProbeCache(FileIdentityCache):
+    """ffprobe json output of a file"""
+    SCHEMA_VERSION = 2
+    TABLE_NAME = "probe"
+    DEFAULT_DB_NAME = "probe_cache.sqlite3"
+
+    def _encode_value(self, value: Dict[str, Any]) -> str:
+        return json.dumps(value)
+
+    def _decode_value(self, value: str) -> Dict[str, Any]:
+        return json.loads(value)
+
+
+class LeanProbeCache(ProbeCache):
+    """ffprobe json output of a file, only the entries of `ProbeProfile.LEAN`"""
+    SCHEMA_VERSION = 3
+    TABLE_NAME = "probe_lean"
+    DEFAULT_DB_NAME = "probe_cache_lean.sqlite3"
+
+
+class Crc32Cache(FileIdentityCache):
+    """Calculated CRC32 (as the `'08X'` string `HelperFunctions.get_file_crc32` returns) of a file"""
+    TABLE_NAME = "crc32"
+    DEFAULT_DB_NAME = "crc32_cache.sqlite3"
+
+    def stats(self) -> str:
+        return f"{super().stats()}, {self.bytes_avoided / 1024 ** 3:.2f} GiB not hashed again"
+
+
+class SfvSidecar:
+    """
+    Read checksums from `.sfv` files shipped alongside releases.
+
+    Each non-comment line of an sfv file is "<file name> <crc32>", comment lines start with ";".
+    (`.md5` sidecars can't be used here, there's no way to get CRC32 from an MD5 without reading the file)
+    """
+
+    @staticmethod
+    def parse(sfv_file: Path) -> Dict[str, str]:
+        """Returns {file name: upper case crc32}"""
+        checksums = dict()
+        try:
+            lines = sfv_file.read_text(errors='replace').splitlines()
+        except OSError as ex:
+            logger.warning(f'Cannot read sfv file "{sfv_file}": {ex}')
+            return checksums
+        for line in lines:
+            line = line.strip()
+            if len(line) == 0 or line.startswith(';'):
+                continue
+            name, _, crc32 = line.rpartition(' ')
+            if len(crc32) == 8 and len(name.strip()) > 0:
+                checksums[name.strip()] = crc32.upper()
+        return checksums
+
+    @staticmethod
+    def find_crc32(file: Path) -> Optional[str]:
+        """Look for `file` in any sfv file in the same directory. Returns `None` if not listed anywhere."""
+        for sfv_file in sorted(file.parent.glob('*.sfv')):
+            crc32 = SfvSidecar.parse(sfv_file).get(file.name, None)
+            if crc32 is not None:
+                logger.debug(f'Using crc32 of "{file.name}" from "{sfv_file.name}"')
+                return crc32
+        return None
@@ -0,0 +1,169 @@
+"""
+Find out about new files in a folder as soon as they show up.
+
+inotify (through ctypes, no extra package) on Linux, polling everywhere else and on file systems where inotify
+doesn't see changes (network shares).
+A new file is only handed out once it stops growing, see `StableFileTracker`.
+"""
+
+from __future__ import annotations
+
+import abc
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Set, Tuple, List, Optional
+
+from python_encode.utils import Constants
+
+logger = logging.getLogger(__name__)
+
+
+class FolderWatcher(abc.ABC):
+    """Reports files of a folder (not recursive) that were created, written or moved in"""
+
+    def __init__(self, folder: Path):
+        self.folder: Path = folder
+
+    @abc.abstractmethod
+    def wait_for_changes(self, timeout: float) -> Set[Path]:
+        """Block up to `timeout` seconds, returns changed files (empty if nothing changed)"""
+
+    def close(self) -> None:
+        pass
+
+    @staticmethod
+    def create(folder: Path, poll_interval: float = Constants.WATCH_POLL_INTERVAL,
+               force_polling: bool = False) -> FolderWatcher:
+        if not force_polling:
+            try:
+                return InotifyWatcher(folder)
+            except OSError as ex:
+                logger.info(f"inotify not available ({ex}), checking folder every {poll_interval} second(s)")
+        return PollingWatcher(folder, poll_interval)
+
+
+class InotifyWatcher(FolderWatcher):
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_Q_OVERFLOW = 0x00004000
+    IN_ISDIR = 0x40000000
+    EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+    def __init__(self, folder: Path):
+        super().__init__(folder)
+        if not hasattr(os, 'O_CLOEXEC'):
+            raise OSError(errno.ENOSYS, "not a Linux system")
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "libc has no inotify")
+        self._fd: int = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        mask = self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE
+        if libc.inotify_add_watch(self._fd, os.fsencode(folder.absolute().__str__()), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self._fd)
+            raise OSError(error, os.strerror(error))
+        logger.debug(f"Watching {folder} with inotify")
+
+    def wait_for_changes(self, timeout: float) -> Set[Path]:
+        changed: Set[Path] = set()
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if len(readable) == 0:
+            return changed
+        while True:
+            try:
+                data = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return changed
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_length = self.EVENT_HEADER.unpack_from(data, offset)
+                offset += self.EVENT_HEADER.size
+                name = data[offset:offset + name_length].rstrip(b'\0')
+                offset += name_length
+                if mask & self.IN_Q_OVERFLOW:
+                    # missed events, report everything
+                    changed.update(_ for _ in self.folder.iterdir() if _.is_file())
+                elif not mask & self.IN_ISDIR and len(name) > 0:
+                    changed.add(self.folder / os.fsdecode(name))
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class PollingWatcher(FolderWatcher):
+
+    def __init__(self, folder: Path, poll_interval: float = Constants.WATCH_POLL_INTERVAL):
+        super().__init__(folder)
+        self.poll_interval = poll_interval
+        self._snapshot: Dict[Path, Tuple[int, int]] = self._take_snapshot()
+
+    def _take_snapshot(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = dict()
+        try:
+            for entry in os.scandir(self.folder):
+                try:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        snapshot[Path(entry.path)] = (stat.st_size, stat.st_mtime_ns)
+                except OSError:
+                    continue  # removed while scanning
+        except OSError as ex:
+            logger.warning(f'Cannot list "{self.folder}": {ex}')
+        return snapshot
+
+    def wait_for_changes(self, timeout: float) -> Set[Path]:
+        time.sleep(min(timeout, self.poll_interval))
+        snapshot = self._take_snapshot()
+        changed = {path for path, stat in snapshot.items() if self._snapshot.get(path, None) != stat}
+        self._snapshot = snapshot
+        return changed
+
+
+class StableFileTracker:
+    """
+    Hold new files back until they are completely written, i.e. size and mtime haven't changed for `settle_seconds`.
+
+    Files with a suffix in `Constants.WATCH_IGNORED_SUFFIXES` (unfinished downloads and such) are never reported.
+    """
+
+    def __init__(self, settle_seconds: float = Constants.WATCH_SETTLE_SECONDS):
+        self.settle_seconds = settle_seconds
+        self._pending: Dict[Path, Tuple[Optional[Tuple[int, int]], float]] = dict()  # file: (size and mtime, since)
+
+    def add(self, file: Path) -> None:
+        if file.name.startswith('.') or file.suffix.lower() in Constants.WATCH_IGNORED_SUFFIXES:
+            return
+        if file not in self._pending:
+            logger.debug(f'Waiting for "{file.name}" to settle')
+        self._pending[file] = (None, time.monotonic())
+
+    def has_pending(self) -> bool:
+        return len(self._pending) > 0
+
+    def pop_stable(self) -> List[Path]:
+        stable_files = list()
+        now = time.monotonic()
+        for file, (last_stat, since) in list(self._pending.items()):
+            try:
+                stat = file.stat()
+            except OSError:
+                self._pending.pop(file)  # deleted or renamed (e.g. ".part" renamed when download finishes)
+                continue
+            current_stat = (stat.st_size, stat.st_mtime_ns)
+            if current_stat != last_stat:
+                self._pending[file] = (current_stat, now)
+            elif now - since >= self.settle_seconds:
+                self._pending.pop(file)
+                stable_files.append(file)
+        return sorted(stable_files)
@@ -0,0 +1,123 @@
+"""
+Remember where each source file of a batch got to, so a batch killed half way (reboot, Ctrl+C) can be run again
+without redoing finished work.
+
+A job is one source file encoded with one preset into one output directory. Its `EncodeStage` is written to SQLite
+as soon as it changes. A job is forgotten (starts over) once its source file changes.
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+
+from python_encode.file_cache import FileIdentity
+from python_encode.utils import HelperFunctions, EncodeStage
+
+logger = logging.getLogger(__name__)
+
+
+class JournalEntry:
+    __slots__ = 'source_file', 'stage', 'output_file'
+
+    def __init__(self, source_file: Path, stage: str, output_file: Optional[Path] = None):
+        self.source_file: Path = source_file
+        self.stage: str = stage  # one of `EncodeStage`
+        self.output_file: Optional[Path] = output_file  # partial output while ENCODING, final file once RENAMED
+
+    def __str__(self):
+        return f"JournalEntry(source_file={self.source_file}, stage={self.stage}, output_file={self.output_file})"
+
+
+class JobJournal:
+    """
+    Stage of every job of a preset + output directory pair, stored under the user cache directory by default.
+
+    Safe to share between threads.
+    """
+
+    SCHEMA_VERSION = 1
+    DEFAULT_DB_NAME = "job_journal.sqlite3"
+
+    def __init__(self, preset_name: str, output_dir: Path, db_file: Optional[Path] = None):
+        if not isinstance(db_file, Path):
+            db_file = HelperFunctions.get_user_cache_dir() / self.DEFAULT_DB_NAME
+        self.db_file: Path = db_file
+        self.preset_name: str = preset_name
+        self.output_dir: str = output_dir.absolute().__str__()
+        self._lock = threading.Lock()
+        try:
+            self._connect()
+        except sqlite3.OperationalError:
+            raise  # locked by another run of the same batch, or can't be opened at all: not ours to throw away
+        except sqlite3.DatabaseError as ex:
+            logger.warning(f'Job journal "{self.db_file}" is corrupt ({ex}), starting a new one. '
+                           f'Jobs finished by earlier runs are done again.')
+            self.db_file.unlink(missing_ok=True)
+            self._connect()
+        logger.debug(f"{self.__class__.__name__} opened: {self.db_file}")
+
+    def _connect(self) -> None:
+        self._connection = sqlite3.connect(self.db_file.__str__(), check_same_thread=False)
+        try:
+            self._create_tables()
+        except sqlite3.DatabaseError:
+            self._connection.close()
+            raise
+
+    def _create_tables(self) -> None:
+        with self._lock, self._connection:
+            # a truncated file can look fine until the damaged page is read, which would be half way into a batch
+            if self._connection.execute("PRAGMA quick_check").fetchone()[0] != "ok":
+                raise sqlite3.DatabaseError("quick_check failed")
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS jobs")
+                self._connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "source TEXT NOT NULL, preset TEXT NOT NULL, output_dir TEXT NOT NULL, "
+                "size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "stage TEXT NOT NULL, output_file TEXT, updated_at REAL NOT NULL, "
+                "PRIMARY KEY (source, preset, output_dir))"
+            )
+
+    def get(self, source_file: Path) -> Optional[JournalEntry]:
+        """Returns `None` if the job isn't in the journal, or the source file has changed since"""
+        identity = FileIdentity.of(source_file)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT size, mtime_ns, inode, stage, output_file FROM jobs "
+                "WHERE source = ? AND preset = ? AND output_dir = ?",
+                (identity.path, self.preset_name, self.output_dir)
+            ).fetchone()
+        if row is None or not identity.matches(row[0], row[1], row[2]):
+            return None
+        return JournalEntry(source_file, row[3], Path(row[4]) if row[4] is not None else None)
+
+    def set(self, source_file: Path, stage: str, output_file: Optional[Path] = None) -> None:
+        assert stage in EncodeStage.values(), f"Unknown stage {stage}"
+        identity = FileIdentity.of(source_file)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO jobs "
+                "(source, preset, output_dir, size, mtime_ns, inode, stage, output_file, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, self.preset_name, self.output_dir, identity.size, identity.mtime_ns, identity.inode,
+                 stage, output_file.absolute().__str__() if output_file is not None else None, time.time())
+            )
+        logger.debug(f'Journal: "{source_file.name}" -> {stage}' + (f" ({output_file.name})" if output_file else ""))
+
+    def forget(self, source_file: Path) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM jobs WHERE source = ? AND preset = ? AND output_dir = ?",
+                (source_file.absolute().__str__(), self.preset_name, self.output_dir)
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
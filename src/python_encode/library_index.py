@@ -0,0 +1,205 @@
+"""
+Index of every source file read and every encode made from it, across batches, presets and output directories.
+
+Sources are matched by content (calculated CRC32 + size), so a copy or a moved file is still known to be encoded.
+Without a CRC32 (source not verified) only the same, unchanged path matches.
+
+    library_index = LibraryIndex()
+    if library_index.should_encode(source_file_object, encode_preset.preset_name):
+        ...
+        library_index.add_encode(source_file_object, encode_preset.preset_name, output_file)
+"""
+
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, List, Dict, Tuple
+
+from python_encode.custom_objects import AnimeFileObject
+from python_encode.file_cache import FileIdentity
+from python_encode.utils import HelperFunctions
+
+logger = logging.getLogger(__name__)
+
+
+class LibraryEntry:
+    __slots__ = 'source_file', 'size', 'crc32', 'preset', 'output_file', 'encoded_at'
+
+    def __init__(self, source_file: Path, size: int, crc32: Optional[str], preset: str, output_file: Path,
+                 encoded_at: float):
+        self.source_file: Path = source_file  # where the source was when it was encoded
+        self.size: int = size
+        self.crc32: Optional[str] = crc32
+        self.preset: str = preset
+        self.output_file: Path = output_file
+        self.encoded_at: float = encoded_at  # unix time
+
+    def __str__(self):
+        return f"LibraryEntry(source_file={self.source_file}, crc32={self.crc32}, preset={self.preset}, " \
+               f"output_file={self.output_file})"
+
+
+class LibraryIndex:
+    """
+    Sources (path, size, CRC32, release group, episode name, resolution) and encodes (source, preset, output path),
+    stored under the user cache directory by default.
+
+    Safe to share between threads.
+    """
+
+    SCHEMA_VERSION = 1
+    DEFAULT_DB_NAME = "library_index.sqlite3"
+
+    def __init__(self, db_file: Optional[Path] = None):
+        if not isinstance(db_file, Path):
+            db_file = HelperFunctions.get_user_cache_dir() / self.DEFAULT_DB_NAME
+        self.db_file: Path = db_file
+        self._queued: Dict[Tuple[str, int], Path] = dict()  # content of sources `should_encode` let through
+        # copies of a queued source, held back until it's encoded (dropped) or fails (next one goes), see `encode_failed`
+        self._waiting: Dict[Tuple[str, int], List[AnimeFileObject]] = dict()
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.db_file.__str__(), check_same_thread=False)
+        with self._lock, self._connection:
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+                self._connection.execute("DROP TABLE IF EXISTS sources")
+                self._connection.execute("DROP TABLE IF EXISTS encodes")
+                self._connection.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS sources ("
+                "path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "crc32 TEXT, release_group TEXT, episode_name TEXT, width INTEGER, height INTEGER, "
+                "indexed_at REAL NOT NULL)"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS sources_content ON sources (crc32, size)")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS encodes ("
+                "source TEXT NOT NULL, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, "
+                "crc32 TEXT, preset TEXT NOT NULL, output_file TEXT NOT NULL, encoded_at REAL NOT NULL, "
+                "PRIMARY KEY (source, preset, output_file))"
+            )
+            self._connection.execute("CREATE INDEX IF NOT EXISTS encodes_content ON encodes (crc32, size, preset)")
+        logger.debug(f"{self.__class__.__name__} opened: {self.db_file}")
+
+    @staticmethod
+    def _content(anime: AnimeFileObject) -> Optional[Tuple[str, int]]:
+        return (anime.crc32[0], anime.file.stat().st_size) if anime.crc32[0] is not None else None
+
+    @staticmethod
+    def _int_or_none(value: Optional[str]) -> Optional[int]:
+        return int(value) if value is not None and value.isdigit() else None
+
+    def add_source(self, anime: AnimeFileObject) -> None:
+        """Index (or update) a source file read by `AnimeProcessor.read_anime_file`"""
+        identity = FileIdentity.of(anime.file)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO sources "
+                "(path, size, mtime_ns, inode, crc32, release_group, episode_name, width, height, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, identity.size, identity.mtime_ns, identity.inode, anime.crc32[0], anime.release_group,
+                 anime.episode_name, self._int_or_none(anime.video_resolution[0]),
+                 self._int_or_none(anime.video_resolution[1]), time.time())
+            )
+
+    def add_encode(self, anime: AnimeFileObject, preset_name: str, output_file: Path) -> None:
+        """Remember `anime` was encoded with `preset_name` into `output_file`"""
+        self.add_source(anime)
+        identity = FileIdentity.of(anime.file)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO encodes "
+                "(source, size, mtime_ns, inode, crc32, preset, output_file, encoded_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (identity.path, identity.size, identity.mtime_ns, identity.inode, anime.crc32[0], preset_name,
+                 output_file.absolute().__str__(), time.time())
+            )
+            content = self._content(anime)
+            if content is not None:
+                self._waiting.pop(content, None)
+
+    def find_encodes(self, anime: AnimeFileObject, preset_name: Optional[str] = None) -> List[LibraryEntry]:
+        """
+        Encodes of the same content (same path if `anime` has no calculated CRC32), newest first, of `preset_name` or
+        any preset. Outputs deleted since are left out.
+        """
+        identity = FileIdentity.of(anime.file)
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT source, size, mtime_ns, inode, crc32, preset, output_file, encoded_at FROM encodes "
+                "WHERE ((crc32 = ? AND size = ?) OR source = ?) AND (? IS NULL OR preset = ?) "
+                "ORDER BY encoded_at DESC",
+                (anime.crc32[0], identity.size, identity.path, preset_name, preset_name)
+            ).fetchall()
+        entries = list()
+        for source, size, mtime_ns, inode, crc32, preset, output_file, encoded_at in rows:
+            if (crc32 is None or crc32 != anime.crc32[0]) and not identity.matches(size, mtime_ns, inode):
+                continue  # matched by path, but the file has changed since
+            if not Path(output_file).is_file():
+                continue
+            entries.append(LibraryEntry(Path(source), size, crc32, preset, Path(output_file), encoded_at))
+        return entries
+
+    def should_encode(self, anime: AnimeFileObject, preset_name: str) -> bool:
+        """
+        Index `anime` and tell whether it's worth queueing: `False` if it's already encoded with `preset_name`, or a
+        byte-identical copy of a source this index already let through (this session). Copies are held back, and
+        handed out by `encode_failed` if that source can't be encoded.
+        """
+        self.add_source(anime)
+        encodes = self.find_encodes(anime, preset_name)
+        if len(encodes) > 0:
+            logger.info(f'Skipping "{anime.file_name}", already encoded with preset {preset_name}: '
+                        f'"{encodes[0].output_file}"')
+            return False
+        content = self._content(anime)
+        if content is None:
+            return True
+        with self._lock:
+            queued_file = self._queued.setdefault(content, anime.file)
+            if queued_file != anime.file:
+                self._waiting.setdefault(content, list()).append(anime)
+        if queued_file != anime.file:
+            logger.info(f'Holding back "{anime.file_name}", same file as "{queued_file}" (encoded if that one fails)')
+            return False
+        return True
+
+    def encode_failed(self, anime: AnimeFileObject) -> Optional[AnimeFileObject]:
+        """
+        `anime` (let through by `should_encode`) failed to encode. Returns a copy of it that was held back, which
+        takes its place, or `None` if there is none.
+        """
+        content = self._content(anime)
+        if content is None:
+            return None
+        with self._lock:
+            if self._queued.get(content, None) != anime.file:
+                return None
+            waiting = self._waiting.get(content, list())
+            if len(waiting) == 0:
+                self._queued.pop(content)
+                return None
+            copy = waiting.pop(0)
+            self._queued[content] = copy.file
+        logger.info(f'Trying "{copy.file_name}" instead of "{anime.file_name}", same file')
+        return copy
+
+    def duplicates(self) -> List[List[Path]]:
+        """Indexed sources with the same content (calculated CRC32 + size), each group sorted by path"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT crc32, size, path FROM sources WHERE crc32 IS NOT NULL AND (crc32, size) IN ("
+                "SELECT crc32, size FROM sources WHERE crc32 IS NOT NULL GROUP BY crc32, size HAVING COUNT(*) > 1) "
+                "ORDER BY crc32, size, path"
+            ).fetchall()
+        groups: Dict[Tuple[str, int], List[Path]] = dict()
+        for crc32, size, path in rows:
+            groups.setdefault((crc32, size), list()).append(Path(path))
+        return list(groups.values())
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
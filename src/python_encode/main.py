@@ -5,11 +5,24 @@ Deprecation for "main_deprecating.py" file is planned because code refactor brok
 # from modules import SleepModule
 import argparse
 import logging
+import threading
+import time
 from pathlib import Path
-from typing import Sized, Optional
+from typing import Sized, Optional, List, Tuple, Dict, Callable
+
+import alive_progress
 
 from python_encode.anime_processor import AnimeProcessor
-from python_encode.utils_site_package import HelperFunctions
+from python_encode.custom_objects import FFmpegProgress
+from python_encode.distributed import EncodeCoordinator, EncodeWorker, DistributedJobState
+from python_encode.encode_estimator import EncodeEstimator, ThroughputHistory
+from python_encode.encode_scheduler import EncodeScheduler, EncodeJob, EncodeJobState
+from python_encode.encode_window import EncodeWindowSchedule
+from python_encode.folder_watcher import FolderWatcher, StableFileTracker
+from python_encode.job_journal import JobJournal
+from python_encode.library_index import LibraryIndex
+from python_encode.utils import Crc32IOBackend, EncodeStage, ProbeBackend, ProbeProfile
+from python_encode.utils_site_package import HelperFunctions, Constants
 from python_encode.custom_objects import EncodePresetObject
 
 logger = logging.getLogger(__name__)
@@ -25,32 +38,296 @@ def run_in_cli(
         ffmpeg_verbose: bool = False,
         watch_input: bool = False,
         no_verify_source: bool = False,
+        use_probe_cache: bool = True,
+        read_workers: int = 4,
+        crc32_workers: int = 1,
+        use_crc32_cache: bool = True,
+        trust_sfv_sidecar: bool = False,
+        jobs: int = 1,
+        threads_per_job: Optional[int] = None,
+        use_journal: bool = True,
+        resume: bool = True,
+        settle_seconds: float = Constants.WATCH_SETTLE_SECONDS,
+        poll_interval: float = Constants.WATCH_POLL_INTERVAL,
+        force_polling: bool = False,
+        encode_windows: Optional[EncodeWindowSchedule] = None,
+        segment_jobs: int = 1,
+        drop_old_versions: bool = False,
+        use_library_index: bool = True,
 ):
+    AnimeProcessor.use_probe_cache = use_probe_cache
+    AnimeProcessor.use_crc32_cache = use_crc32_cache
+    AnimeProcessor.trust_sfv_sidecar = trust_sfv_sidecar
+    if watch_input and not input_file_or_folder.is_dir():
+        logger.warning(f'Cannot watch "{input_file_or_folder}", not a directory. Encoding it once instead.')
+        watch_input = False
+    if watch_input and (output_folder.resolve() == input_file_or_folder.resolve()
+                        or input_file_or_folder.resolve() in output_folder.resolve().parents):
+        # every output would settle, get picked up as a new source and be encoded again, forever
+        raise ValueError(f'Cannot watch "{input_file_or_folder}", output directory "{output_folder.resolve()}" is inside it')
     input_files = [input_file_or_folder] if input_file_or_folder.is_file() else list(input_file_or_folder.glob('*.*'))
+    input_files = AnimeProcessor.order_episode_files(input_files, drop_old_versions)
 
     encode_preset = EncodePresetObject(preset_dir=presets)
     logger.info(f"Using presets: {encode_preset.preset_name}")
     logger.debug("Input list:\n\t"+"\n\t".join([_.name for _ in input_files]))
 
+    journal = JobJournal(encode_preset.preset_name, output_folder) if use_journal else None
+    library_index = LibraryIndex() if use_library_index else None
+    if journal is not None and not resume:
+        for input_file in input_files:
+            journal.forget(input_file)
+
     failed_encodes: list[Path] = list()
-    for input_file in input_files:
-        logger.info(f"Processing {input_file.name}")
-        encoded_file, aborted = AnimeProcessor.do_encode_task(
-            source_file=input_file, output_dir=output_folder,
-            encode_preset=encode_preset, ffmpeg_executable=ffmpeg_path, ffprobe_executable=ffprobe_path,
-            show_ffmpeg_stdout=ffmpeg_verbose
-        )
-        if aborted:
+    scheduler = EncodeScheduler(
+        output_dir=output_folder, encode_preset=encode_preset, max_jobs=jobs, threads_per_job=threads_per_job,
+        ffmpeg_executable=ffmpeg_path, ffprobe_executable=ffprobe_path, show_ffmpeg_stdout=ffmpeg_verbose,
+        encode_windows=encode_windows, segment_jobs=segment_jobs
+    )
+    if encode_windows is not None and len(encode_windows.windows) > 0:
+        logger.info(f"Encode windows: {encode_windows}")
+    if journal is not None:
+        scheduler.on_job_stage_changed = lambda job, stage, file: journal.set(job.source_file_object.file, stage, file)
+    throughput_history = ThroughputHistory()
+    estimator = EncodeEstimator(scheduler, throughput_history)
+
+    def submit_files(files: List[Path], show_progress: bool = True) -> int:
+        """Probe and hash `files`, then queue them for encoding. Returns number of files queued."""
+        unrenamed_outputs: Dict[Path, Path] = dict()
+        if journal is not None:
+            files, unrenamed_outputs = resume_from_journal(journal, files)
+        if len(files) == 0:
+            return 0
+        with alive_progress.alive_bar(sum(_.stat().st_size for _ in files), title="Reading sources",
+                                      theme='classic', scale=2, disable=not show_progress) as bar:
+            source_file_objects = AnimeProcessor.read_anime_files(
+                files=files, max_workers=read_workers, ffprobe=ffprobe_path, on_bytes_read_callback=bar,
+                on_file_read=lambda idx, file, result, exception: logger.debug(
+                    f"Read ({idx + 1}/{len(files)}) {file.name}: {'OK' if result is not None else 'failed'}"),
+                skip_crc32=no_verify_source, crc32_workers=crc32_workers
+            )
+        submitted_count = 0
+        for input_file, source_file_object in zip(files, source_file_objects):
+            if source_file_object is None:
+                logger.warning(f'Cannot read file "{input_file}"')
+                failed_encodes.append(input_file)
+                if journal is not None:
+                    journal.set(input_file, EncodeStage.FAILED)
+                continue
+            if input_file in unrenamed_outputs:
+                # encoded in an earlier run, which stopped before renaming it
+                output_file = AnimeProcessor.rename_encoded_anime_file(
+                    source_file_object=source_file_object, encoded_file=unrenamed_outputs[input_file],
+                    encode_preset=encode_preset, ffprobe_executable=ffprobe_path)
+                journal.set(input_file, EncodeStage.RENAMED, output_file)
+                if library_index is not None:
+                    library_index.add_encode(source_file_object, encode_preset.preset_name, output_file)
+                logger.info(f"Encode complete (from earlier run) >> {output_file.name}")
+                continue
+            if library_index is not None:
+                if not resume:
+                    library_index.add_source(source_file_object)  # encode everything again, as --no-resume says
+                elif not library_index.should_encode(source_file_object, encode_preset.preset_name):
+                    continue
+            if journal is not None:
+                journal.set(input_file, EncodeStage.PROBED if no_verify_source else EncodeStage.HASHED)
+            scheduler.submit(source_file_object)
+            submitted_count += 1
+        return submitted_count
+
+    def on_job_started(job: EncodeJob) -> None:
+        estimator.on_job_started(job)
+        logger.info(f"Processing {job.source_file_object.file_name}")
+
+    def on_job_finished(job: EncodeJob) -> None:
+        estimator.on_job_finished(job)
+        if job.state == EncodeJobState.ENCODED:
+            logger.info(f"Encode complete >> {job.output_file.name}")
+            if library_index is not None:
+                library_index.add_encode(job.source_file_object, encode_preset.preset_name, job.output_file)
+        elif job.state == EncodeJobState.FAILED:
+            logger.warning(f'Encode failed for file "{job.source_file_object.file}"')
+            failed_encodes.append(job.source_file_object.file)
+            if journal is not None:
+                entry = journal.get(job.source_file_object.file)
+                journal.set(job.source_file_object.file, EncodeStage.FAILED,
+                            entry.output_file if entry is not None else None)
+            copy = library_index.encode_failed(job.source_file_object) if library_index is not None else None
+            if copy is not None:
+                if journal is not None:
+                    journal.set(copy.file, EncodeStage.PROBED if no_verify_source else EncodeStage.HASHED)
+                scheduler.submit(copy)  # picked up by this worker once this callback returns
+
+    scheduler.on_job_started = on_job_started
+    scheduler.on_job_finished = on_job_finished
+    try:
+        if watch_input:
+            watch_and_encode(input_file_or_folder, scheduler, submit_files, settle_seconds, poll_interval,
+                             force_polling)
+            return
+        if submit_files(input_files) == 0:
+            logger.info("Nothing left to encode.")
             return
-        if encoded_file is None:
-            logger.warning(f'Encode failed for file "{input_file}"')
-            failed_encodes.append(input_file)
-            continue
-        logger.info(f"Encode complete >> {encoded_file.name}")
+        estimate = estimator.estimate()
+        if estimate.queue_remaining_seconds is not None:
+            logger.info(f"Estimated from earlier encodes of this preset: {estimate}")
+        encoded_frames, total_frames = scheduler.get_progress()
+        with alive_progress.alive_bar(total_frames if total_frames > 0 else None, title="Encoding", unit="frames",
+                                      theme='classic', disable=ffmpeg_verbose) as bar:
+            def on_progress(encoded: int, total: int) -> None:
+                bar(encoded - bar.current)
+
+            def on_job_progress(job: EncodeJob, progress: FFmpegProgress) -> None:
+                running_jobs = [_ for _ in scheduler.running_jobs() if _.last_progress is not None]
+                if len(running_jobs) > 1:
+                    text = f"{len(running_jobs)} jobs, {sum(_.last_progress.fps or 0 for _ in running_jobs):.1f} fps"
+                else:
+                    text = f"{progress.fps or 0:.1f} fps, {progress.bitrate_kbps or 0:.0f} kbits/s, " \
+                           f"{progress.speed or 0:.2f}x"
+                bar.text(f"{text}, queue {estimator.estimate(Constants.ESTIMATE_INTERVAL)}")
+
+            scheduler.on_progress = on_progress
+            scheduler.on_job_progress = on_job_progress
+            scheduler.run()
+    except KeyboardInterrupt:
+        logger.info("User pressed Ctrl+C.")
+        return
+    finally:
+        throughput_history.close()
+        if journal is not None:
+            journal.close()
+        if library_index is not None:
+            library_index.close()
+    if scheduler.is_aborted:
+        return
     logger.info("Process completed. ")
     if not HelperFunctions.is_subject_empty(failed_encodes):
         failed_encodes_str = "\n\t".join([_.__str__() for _ in failed_encodes])
         logger.info(f"The following file(s) did not encode:\n\t{failed_encodes_str}")
+    if use_probe_cache:
+        for probe_cache in AnimeProcessor.probe_caches.values():
+            logger.info(probe_cache.stats())
+    if use_crc32_cache:
+        logger.info(AnimeProcessor.get_crc32_cache().stats())
+
+
+def watch_and_encode(
+        input_folder: Path,
+        scheduler: EncodeScheduler,
+        submit_files: Callable[[List[Path], bool], int],
+        settle_seconds: float = Constants.WATCH_SETTLE_SECONDS,
+        poll_interval: float = Constants.WATCH_POLL_INTERVAL,
+        force_polling: bool = False,
+) -> None:
+    """
+    Encode files already in `input_folder`, then every new file once it's completely written, until Ctrl+C.
+
+    Files finished in an earlier run are skipped by the job journal, so sources don't have to be moved away.
+    """
+    watcher = FolderWatcher.create(input_folder, poll_interval, force_polling)
+    tracker = StableFileTracker(settle_seconds)
+    for file in input_folder.glob('*.*'):
+        tracker.add(file)
+    stop_watching = threading.Event()
+    encode_thread = threading.Thread(target=scheduler.run, args=(lambda: not stop_watching.is_set(),),
+                                     name="encode-scheduler", daemon=True)
+    encode_thread.start()
+    logger.info(f'Watching "{input_folder}" for new files, press Ctrl+C to stop')
+    try:
+        while True:
+            for file in watcher.wait_for_changes(timeout=1 if tracker.has_pending() else poll_interval):
+                tracker.add(file)
+            stable_files = [_ for _ in tracker.pop_stable() if _.is_file()]
+            if len(stable_files) > 0:
+                submitted_count = submit_files(stable_files, False)
+                logger.info(f"{submitted_count} new file(s) queued" if submitted_count > 0 else
+                            f"Nothing new to encode in {len(stable_files)} changed file(s)")
+    except KeyboardInterrupt:
+        logger.info("Stopping, unfinished encodes are picked up again next run.")
+        scheduler.abort()
+        raise
+    finally:
+        stop_watching.set()
+        watcher.close()
+        encode_thread.join()
+
+
+def resume_from_journal(journal: JobJournal, input_files: List[Path]) -> Tuple[List[Path], Dict[Path, Path]]:
+    """
+    Skip what an earlier (interrupted) run of the same batch finished, and remove its half written outputs.
+
+    :return: files still to be processed, and {source: output} of those only missing the rename step
+    """
+    remaining_files: List[Path] = list()
+    unrenamed_outputs: Dict[Path, Path] = dict()
+    for input_file in input_files:
+        entry = journal.get(input_file)
+        output_exists = entry is not None and entry.output_file is not None and entry.output_file.is_file()
+        if entry is None:
+            remaining_files.append(input_file)
+        elif entry.stage == EncodeStage.RENAMED and output_exists:
+            logger.info(f'Skipping "{input_file.name}", already encoded to "{entry.output_file.name}"')
+        elif entry.stage == EncodeStage.ENCODED and output_exists:
+            unrenamed_outputs[input_file] = entry.output_file
+            remaining_files.append(input_file)
+        else:
+            if entry.stage in (EncodeStage.ENCODING, EncodeStage.FAILED) and output_exists:
+                logger.info(f'Removing partial output of earlier run "{entry.output_file}"')
+                entry.output_file.unlink()
+            remaining_files.append(input_file)
+    return remaining_files, unrenamed_outputs
+
+
+def run_coordinator(
+        input_file_or_folder: Path,
+        output_folder: Path,
+        presets: Optional[Path] = None,
+        listen: str = f"0.0.0.0:{Constants.DISTRIBUTED_PORT}",
+        token: Optional[str] = None,
+) -> None:
+    """Hand the input files out to `run_worker()`s on other machines, returns once all are encoded or failed"""
+    host, _, port = listen.rpartition(':')
+    input_files = [input_file_or_folder] if input_file_or_folder.is_file() else list(input_file_or_folder.glob('*.*'))
+    failed_encodes: List[Path] = list()
+    coordinator = EncodeCoordinator(
+        output_dir=output_folder, preset_dir=presets, host=host or '0.0.0.0', port=int(port), token=token,
+        on_job_finished=lambda job: failed_encodes.append(job.source_file)
+        if job.state == DistributedJobState.FAILED else None)
+    for input_file in input_files:
+        coordinator.submit(input_file)
+    coordinator.start()
+    try:
+        coordinator.wait()
+        # workers asking for more in the meantime are told there is nothing left
+        time.sleep(Constants.DISTRIBUTED_POLL_SECONDS)
+    except KeyboardInterrupt:
+        logger.info("User pressed Ctrl+C.")
+        return
+    finally:
+        coordinator.stop()
+    logger.info("Process completed. ")
+    if not HelperFunctions.is_subject_empty(failed_encodes):
+        failed_encodes_str = "\n\t".join([_.__str__() for _ in failed_encodes])
+        logger.info(f"The following file(s) did not encode:\n\t{failed_encodes_str}")
+
+
+def run_worker(
+        coordinator_url: str,
+        ffmpeg_path: str = "ffmpeg",
+        ffprobe_path: str = "ffprobe",
+        jobs: int = 1,
+        segment_jobs: int = 1,
+        no_verify_source: bool = False,
+        token: Optional[str] = None,
+) -> None:
+    """Encode jobs of a `run_coordinator()` until it has none left"""
+    worker = EncodeWorker(coordinator_url, max_jobs=jobs, ffmpeg_executable=ffmpeg_path,
+                          ffprobe_executable=ffprobe_path, segment_jobs=segment_jobs, token=token,
+                          skip_crc32=no_verify_source)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        logger.info("User pressed Ctrl+C, unfinished jobs go back to the coordinator.")
 
 
 def get_cmd_argument(argument: any, default: any = None, argument_size: int = 1):
@@ -69,7 +346,9 @@ def main():
     args.add_argument('-o', '--output-dir', dest='output', nargs=1, type=str,
                       required=False, help='Save encoded file to this directory')
     args.add_argument('--presets', dest='presets', nargs=1, type=str,
-                      required=False, help='A directory containing encode presets for encoding')
+                      required=False, help='A directory containing encode presets for encoding. A "{crc32}" in '
+                                           'naming.txt is hashed while encoding for .ts/.m2ts/.nut/.flv outputs, '
+                                           'other containers (.mkv, .mp4) are read again once encoded')
     args.add_argument('--ffmpeg', dest='ffmpeg', nargs=1, type=str,
                       required=False, help='Specify ffmpeg executable location')
     args.add_argument('--ffprobe', dest='ffprobe', nargs=1, type=str,
@@ -78,31 +357,146 @@ def main():
                       required=False, help='Do not verify source CRC checksum')
     args.add_argument('--ffmpeg-verbose', dest="ffmpeg_verbose", action="store_true",
                       required=False, help='Display ffmpeg stdout')
+    args.add_argument('-j', '--jobs', dest='jobs', nargs=1, type=int,
+                      required=False, help='Number of files to encode at the same time (default: 1)')
+    args.add_argument('--threads-per-job', dest='threads_per_job', nargs=1, type=int,
+                      required=False, help='Limit threads of each encode job (ffmpeg -threads, x265 pools)')
+    args.add_argument('--segment-jobs', dest='segment_jobs', nargs=1, type=int,
+                      required=False, help='Cut each file at keyframes and encode this many segments of it at the '
+                                           'same time (default: 1, encode in one piece)')
+    args.add_argument('--read-workers', dest='read_workers', nargs=1, type=int,
+                      required=False, help='Number of source files hashed concurrently (default: 4)')
+    args.add_argument('--crc32-workers', dest='crc32_workers', nargs=1, type=int,
+                      required=False, help='Number of threads hashing each source file (default: 1)')
+    args.add_argument('--crc32-io', dest='crc32_io', nargs=1, type=str, choices=Crc32IOBackend.values(),
+                      required=False, help=f'How source files are read for hashing (default: {Constants.CRC32_IO_BACKEND})')
+    args.add_argument('--crc32-chunk-size', dest='crc32_chunk_size', nargs=1, type=int,
+                      required=False, help=f'Bytes hashed per read (default: {Constants.CRC32_CHUNK_SIZE})')
+    args.add_argument('--probe-backend', dest='probe_backend', nargs=1, type=str, choices=ProbeBackend.values(),
+                      required=False, help=f'What reads source files\' streams and chapters, "auto" is PyAV if it\'s '
+                                           f'installed and ffprobe otherwise (default: {Constants.PROBE_BACKEND})')
+    args.add_argument('--probe-profile', dest='probe_profile', nargs=1, type=str, choices=ProbeProfile.values(),
+                      required=False, help=f'Ask ffprobe for only what encoding needs (lean) or everything (full) '
+                                           f'(default: {Constants.PROBE_PROFILE})')
+    args.add_argument('--probe-workers', dest='probe_workers', nargs=1, type=int,
+                      required=False, help=f'Number of source files probed concurrently (default: {Constants.PROBE_WORKERS})')
+    args.add_argument('--count-packets', dest="count_packets", action="store_true",
+                      required=False, help='Count video packets of sources without an exact frame count, for exact '
+                                           'progress (reads the whole file, next to hashing)')
+    args.add_argument('--no-probe-cache', dest="no_probe_cache", action="store_true",
+                      required=False, help='Always run ffprobe instead of reusing cached probe results')
+    args.add_argument('--purge-probe-cache', dest="purge_probe_cache", action="store_true",
+                      required=False, help='Remove all cached probe results before processing')
+    args.add_argument('--no-crc32-cache', dest="no_crc32_cache", action="store_true",
+                      required=False, help='Always hash source files instead of reusing cached CRC32')
+    args.add_argument('--purge-crc32-cache', dest="purge_crc32_cache", action="store_true",
+                      required=False, help='Remove all cached CRC32 before processing')
+    args.add_argument('--trust-sfv', dest="trust_sfv", action="store_true",
+                      required=False, help='Use CRC32 listed in .sfv files next to sources instead of hashing them')
+    args.add_argument('--no-library-index', dest="no_library_index", action="store_true",
+                      required=False, help='Encode sources even if they were encoded with the same preset before '
+                                           '(anywhere), or are copies of another input (a copy is tried if the first one '
+                                           'fails). Implied by --no-resume')
+    args.add_argument('--drop-old-versions', dest="drop_old_versions", action="store_true",
+                      required=False, help='Skip inputs with a newer version of the same episode ("07" next to "07v2")')
+    args.add_argument('--watch', dest="watch", action="store_true",
+                      required=False, help='Keep running and encode new files as they appear in the input folder')
+    args.add_argument('--settle-seconds', dest='settle_seconds', nargs=1, type=float, required=False,
+                      help=f'Watch mode: wait until a new file is unchanged this long (default: {Constants.WATCH_SETTLE_SECONDS})')
+    args.add_argument('--poll-interval', dest='poll_interval', nargs=1, type=float, required=False,
+                      help=f'Watch mode: seconds between folder scans without inotify (default: {Constants.WATCH_POLL_INTERVAL})')
+    args.add_argument('--watch-polling', dest="watch_polling", action="store_true", required=False,
+                      help='Watch mode: scan the folder instead of using inotify (e.g. for network shares)')
+    args.add_argument('--encode-window', dest='encode_windows', action='append', type=str, required=False,
+                      help='Only encode inside this window, running encodes are suspended outside of it. '
+                           'Format "[days ]HH:MM-HH:MM", e.g. "22:00-07:00", "mon-fri 22:00-07:00", '
+                           '"sat,sun 00:00-24:00". Can be given multiple times.')
+    args.add_argument('--no-journal', dest="no_journal", action="store_true",
+                      required=False, help='Do not record progress of this batch for resuming it later')
+    args.add_argument('--no-resume', dest="no_resume", action="store_true",
+                      required=False, help='Encode everything again even if an earlier run of this batch, or the '
+                                           'library index, says it is done')
+    args.add_argument('--serve', dest='serve', nargs=1, type=str, required=False, metavar='[HOST:]PORT',
+                      help='Coordinate: hand the input files out to "--worker"s instead of encoding them here')
+    args.add_argument('--worker', dest='worker', nargs=1, type=str, required=False, metavar='URL',
+                      help='Encode jobs of a "--serve" coordinator, e.g. http://192.168.1.10:8265 '
+                           '(paths must be the same on every machine)')
+    args.add_argument('--cluster-token', dest='cluster_token', nargs=1, type=str, required=False,
+                      help='Shared secret between "--serve" and "--worker"')
     args.add_argument('--debug', dest="debug", action="store_true",
                       required=False, help='Display debug info')
     # args.print_help()
 
     args1 = args.parse_args()
+    global logger
+    logger = HelperFunctions.setup_logger(__name__, log_level="DEBUG" if get_cmd_argument(args1.debug, False) else "INFO")
+
+    if args1.purge_probe_cache:
+        for profile in ProbeProfile.values():
+            AnimeProcessor.get_probe_cache(profile).purge()
+    if args1.purge_crc32_cache:
+        AnimeProcessor.get_crc32_cache().purge()
+    if (args1.purge_probe_cache or args1.purge_crc32_cache) and args1.input is None:
+        return
+    Constants.PROBE_BACKEND = get_cmd_argument(args1.probe_backend, Constants.PROBE_BACKEND)
+    Constants.PROBE_PROFILE = get_cmd_argument(args1.probe_profile, Constants.PROBE_PROFILE)
+    Constants.PROBE_WORKERS = get_cmd_argument(args1.probe_workers, Constants.PROBE_WORKERS)
+    Constants.COUNT_PACKETS = args1.count_packets
+    if args1.worker is not None:
+        run_worker(coordinator_url=args1.worker[0],
+                   ffmpeg_path=get_cmd_argument(args1.ffmpeg, "ffmpeg"),
+                   ffprobe_path=get_cmd_argument(args1.ffprobe, "ffprobe"),
+                   jobs=get_cmd_argument(args1.jobs, 1),
+                   segment_jobs=get_cmd_argument(args1.segment_jobs, 1),
+                   no_verify_source=args1.no_verify_source,
+                   token=get_cmd_argument(args1.cluster_token, None))
+        return
     if args1.input is None:
         raise Exception("must specify an input (-i|--input [file|folder])")
     input = Path(args1.input[0])
 
     if args1.output is None:
         raise Exception("must specify an output directory (-o|--output-dir [folder])")
+    try:
+        encode_windows = EncodeWindowSchedule.parse(args1.encode_windows if args1.encode_windows is not None else [])
+    except ValueError as ex:
+        args.error(str(ex))
 
     ffmpeg_path = get_cmd_argument(args1.ffmpeg, "ffmpeg")
     ffprobe_path = get_cmd_argument(args1.ffprobe, "ffprobe")
     # encode_hour = get_cmd_argument(args1.schedule_encode_hour, argument_size=2)
 
     presets_dir = get_cmd_argument(args1.presets, "")
-    global logger
-    logger = HelperFunctions.setup_logger(__name__, log_level="DEBUG" if get_cmd_argument(args1.debug, False) else "INFO")
+    Constants.CRC32_IO_BACKEND = get_cmd_argument(args1.crc32_io, Constants.CRC32_IO_BACKEND)
+    Constants.CRC32_CHUNK_SIZE = get_cmd_argument(args1.crc32_chunk_size, Constants.CRC32_CHUNK_SIZE)
 
+    if args1.serve is not None:
+        run_coordinator(input_file_or_folder=input, output_folder=Path(get_cmd_argument(args1.output, "")),
+                        presets=Path(presets_dir), listen=args1.serve[0],
+                        token=get_cmd_argument(args1.cluster_token, None))
+        return
     run_in_cli(input_file_or_folder=input, output_folder=Path(get_cmd_argument(args1.output, "")),
                presets=Path(presets_dir),
                ffmpeg_path=ffmpeg_path, ffprobe_path=ffprobe_path,
                ffmpeg_verbose=args1.ffmpeg_verbose,
-               no_verify_source=args1.no_verify_source)
+               no_verify_source=args1.no_verify_source,
+               use_probe_cache=not args1.no_probe_cache,
+               read_workers=get_cmd_argument(args1.read_workers, 4),
+               crc32_workers=get_cmd_argument(args1.crc32_workers, 1),
+               use_crc32_cache=not args1.no_crc32_cache,
+               trust_sfv_sidecar=args1.trust_sfv,
+               jobs=get_cmd_argument(args1.jobs, 1),
+               threads_per_job=get_cmd_argument(args1.threads_per_job, None),
+               use_journal=not args1.no_journal,
+               resume=not args1.no_resume,
+               watch_input=args1.watch,
+               settle_seconds=get_cmd_argument(args1.settle_seconds, Constants.WATCH_SETTLE_SECONDS),
+               poll_interval=get_cmd_argument(args1.poll_interval, Constants.WATCH_POLL_INTERVAL),
+               force_polling=args1.watch_polling,
+               encode_windows=encode_windows,
+               segment_jobs=get_cmd_argument(args1.segment_jobs, 1),
+               drop_old_versions=args1.drop_old_versions,
+               use_library_index=not args1.no_library_index)
 
 
 if __name__ == "__main__":
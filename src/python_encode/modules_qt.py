@@ -6,7 +6,11 @@ from typing import List, Callable, Optional, Set, Union
 from PySide6.QtCore import QThread, Signal, QObject, SignalInstance
 
 from python_encode.anime_processor import AnimeProcessor
-from python_encode.custom_objects import AnimeFileObject, EncodePresetObject, ProgramInfo
+from python_encode.custom_objects import AnimeFileObject, EncodePresetObject, ProgramInfo, FFmpegProgress
+from python_encode.encode_estimator import EncodeEstimator, EncodeEstimate, ThroughputHistory
+from python_encode.encode_scheduler import EncodeScheduler, EncodeJob
+from python_encode.encode_window import EncodeWindowSchedule
+from python_encode.utils import ProbeProfile, Constants
 
 logger = logging.getLogger(__name__)
 
@@ -22,10 +26,12 @@ class AnimeFileObjectWorkerQT(QThread):
     result: List[AnimeFileObject] = list()
     bytes_read: int = 0
     ffprobe_path: str = 'ffprobe'
+    max_workers: int = 4  # files probed and hashed concurrently
     
-    def __init__(self, ffprobe: str = 'ffprobe') -> None:
+    def __init__(self, ffprobe: str = 'ffprobe', max_workers: int = 4) -> None:
         super().__init__()
         self.ffprobe_path = ffprobe
+        self.max_workers = max_workers
 
     def get_abort_signal(self) -> bool:
         return self.should_quit_immediately
@@ -43,21 +49,25 @@ class AnimeFileObjectWorkerQT(QThread):
             self.on_finishing.emit()
             return
 
-        for idx, subject in enumerate(self.input_subjects):
-            logger.debug(f"Loading: {subject}")
-            if self.should_quit_immediately:
-                break
-            self.bytes_read = 0
-            self.on_progresstitle_update.emit(subject, idx)
-            subject_file = Path(subject)
-            ao = AnimeProcessor.read_anime_file(
-                file=subject_file, ffprobe=self.ffprobe_path,
-                on_bytes_read_callback=lambda chunk_size: self.on_progressbar_update.emit(
-                    self.on_bytes_read(chunk_size, subject_file.stat().st_size)),
-                abort_signal=self.get_abort_signal
-            )
-            logger.debug(f"Result: {ao}")
-            self.result.append(ao)
+        subject_files = [Path(subject) for subject in self.input_subjects]
+        self.bytes_read = 0
+        total_size = sum(_.stat().st_size for _ in subject_files if _.is_file())
+        files_read = 0
+
+        def on_file_read(idx: int, file: Path, result: Optional[AnimeFileObject], exception: Optional[Exception]):
+            nonlocal files_read
+            files_read += 1
+            logger.debug(f"Result: {result}")
+            self.on_progresstitle_update.emit(file.name, files_read - 1)
+
+        self.result = AnimeProcessor.read_anime_files(
+            files=subject_files, max_workers=self.max_workers, ffprobe=self.ffprobe_path,
+            on_bytes_read_callback=lambda chunk_size: self.on_progressbar_update.emit(
+                self.on_bytes_read(chunk_size, max(total_size, 1))),
+            on_file_read=on_file_read,
+            abort_signal=self.get_abort_signal,
+            probe_profile=ProbeProfile.FULL  # for the info pane
+        )
         self.on_finishing.emit()
         self.on_result_return.emit(self.result)
 
@@ -72,6 +82,8 @@ class AnimeEncodeWorkerQT(QThread):
         '__encode_preset',
         '__ffmpeg',
         '__ffprobe',
+        '__max_jobs',
+        '__encode_windows',
 
         '__selected_video_streams',  # temporarily removed because I'm not good at designing its processing logic
         '__selected_audio_streams',
@@ -85,6 +97,8 @@ class AnimeEncodeWorkerQT(QThread):
     __on_encode_task_starting: SignalInstance = Signal(str)
     __on_progressbar_update: SignalInstance = Signal(int)  # argument range should be [0, 100]
     __on_progress_label_update: SignalInstance = Signal(str)
+    __on_ffmpeg_progress_update: SignalInstance = Signal(object)  # FFmpegProgress
+    __on_estimate_update: SignalInstance = Signal(object)  # EncodeEstimate
     __on_encode_task_finishing: SignalInstance = Signal()
     __return_encoded_files: SignalInstance = Signal(list)
 
@@ -94,7 +108,9 @@ class AnimeEncodeWorkerQT(QThread):
                  , ffmpeg: ProgramInfo
                  , ffprobe: ProgramInfo
                  , encode_preset: Optional[Union[Path, EncodePresetObject]] = None
-                 , selected_streams: Set = ...):
+                 , selected_streams: Set = ...
+                 , max_jobs: int = 1
+                 , encode_windows: Optional[EncodeWindowSchedule] = None):
         """
         Setup encode thread.
         :param encode_file: File to be encoded
@@ -103,6 +119,8 @@ class AnimeEncodeWorkerQT(QThread):
         :param ffprobe: ProgramInfo of ffprobe program
         :param encode_preset: How file should be encoded. Use ffmpeg default if not provided.
         :param selected_streams: Which streams in the file should be encoded. "All" if not specified.
+        :param max_jobs: Number of files encoded at the same time.
+        :param encode_windows: Only encode inside these time windows, running encodes are suspended outside of them.
         """
         super().__init__()
 
@@ -119,6 +137,8 @@ class AnimeEncodeWorkerQT(QThread):
 
         self.__ffmpeg = ffmpeg
         self.__ffprobe = ffprobe
+        self.__max_jobs = max_jobs
+        self.__encode_windows = encode_windows
 
         # fixme: make stream selection available when I have the idea
 
@@ -133,7 +153,9 @@ class AnimeEncodeWorkerQT(QThread):
                       , on_progress_percentage_update_callback: Callable[[int], None]
                       , on_progress_text_update_callback: Callable[[str], None]
                       , on_encode_finished: List[Callable[[], None]]
-                      , return_encoded_file: Callable[[Path], None]):
+                      , return_encoded_file: Callable[[Path], None]
+                      , on_ffmpeg_progress_update_callback: Optional[Callable[[FFmpegProgress], None]] = None
+                      , on_estimate_update_callback: Optional[Callable[[EncodeEstimate], None]] = None):
         """
         Setup encode thread.
         :param on_starting_callbacks: This function will be called before encoding a file, and filename is passed into it.
@@ -141,6 +163,8 @@ class AnimeEncodeWorkerQT(QThread):
         :param on_progress_percentage_update_callback: A callable object taking one integer as parameter. Param value in [0, 100]
         :param on_progress_text_update_callback:
         :param on_encode_finished: A collection of callables taking no parameter which will be called upon completion.
+        :param on_ffmpeg_progress_update_callback: Takes a `FFmpegProgress` (fps, bitrate, speed...) of the running encode.
+        :param on_estimate_update_callback: Takes an `EncodeEstimate` (remaining time of each file and the whole queue).
         """
         for starting_callback in on_starting_callbacks:
             self.__on_encode_task_starting.connect(starting_callback)
@@ -149,6 +173,10 @@ class AnimeEncodeWorkerQT(QThread):
         for finish_callback in on_encode_finished:
             self.__on_encode_task_finishing.connect(finish_callback)
         self.__return_encoded_files.connect(return_encoded_file)
+        if isinstance(on_ffmpeg_progress_update_callback, Callable):
+            self.__on_ffmpeg_progress_update.connect(on_ffmpeg_progress_update_callback)
+        if isinstance(on_estimate_update_callback, Callable):
+            self.__on_estimate_update.connect(on_estimate_update_callback)
 
     def signal_quit(self):
         self.__should_quit_immediately = True
@@ -158,45 +186,60 @@ class AnimeEncodeWorkerQT(QThread):
         Calculates percentage from encoded frame count and total frame count.
 
         Call progress update callback with an integer value ranged from 0 to 100 indicating percentage.
+        Nothing is sent if the frame count is unknown, it's capped at 100 as the count can be an estimate.
         """
-        self.__on_progressbar_update.emit(int(encoded_frames / total_frames * 100))
+        if not total_frames:
+            return
+        self.__on_progressbar_update.emit(min(100, int(encoded_frames / total_frames * 100)))
 
     def handle_string_progress_update(self, text: str) -> None:
         self.__on_progress_label_update.emit(text)
 
+    def handle_ffmpeg_progress_update(self, progress: FFmpegProgress) -> None:
+        self.__on_ffmpeg_progress_update.emit(progress)
+        self.handle_string_progress_update(progress.__str__())
+
     def run(self) -> None:
         self.__is_running = True
-        output_list: List[Optional[Path]] = list()
-        # encode_file_object = self.__encode_file_objects
+        # fixme: Keeping all stream from input file is fine for now.
+        scheduler = EncodeScheduler(
+            output_dir=self.__output_dir,
+            encode_preset=self.__encode_preset,
+            max_jobs=self.__max_jobs,
+            encode_windows=self.__encode_windows,
+            ffmpeg_executable=self.__ffmpeg.executable,
+            ffprobe_executable=self.__ffprobe.executable,
+            on_progress=self.handle_integer_progress_update,
+            abort_signal=lambda: self.__should_quit_immediately
+        )
+        throughput_history = ThroughputHistory()
+        estimator = EncodeEstimator(scheduler, throughput_history)
+
+        def on_job_started(job: EncodeJob) -> None:
+            estimator.on_job_started(job)
+            self.__on_encode_task_starting.emit(job.source_file_object.file_name)
+
+        last_estimate: Optional[EncodeEstimate] = None
+
+        def on_job_progress(job: EncodeJob, progress: FFmpegProgress) -> None:
+            nonlocal last_estimate
+            self.handle_ffmpeg_progress_update(progress)
+            estimate = estimator.estimate(Constants.ESTIMATE_INTERVAL)
+            if estimate is not last_estimate:  # the same one again until it's older than ESTIMATE_INTERVAL
+                last_estimate = estimate
+                self.__on_estimate_update.emit(estimate)
+
+        scheduler.on_job_started = on_job_started
+        scheduler.on_job_progress = on_job_progress
+        scheduler.on_job_finished = estimator.on_job_finished
         for encode_file_object in self.__encode_file_objects:
-            self.__on_encode_task_starting.emit(encode_file_object.file_name)
-            if self.__should_quit_immediately:
-                output_list.append(None)
-                continue
-
-            output_file = self.__output_dir / f"{encode_file_object.file.stem}{self.__encode_preset.container_extension}"
-            count = 1
-            while output_file.exists():
-                output_file = self.__output_dir / f"{encode_file_object.file.stem}_{count}{self.__encode_preset.container_extension}"
-                count += 1
-
-            # fixme: Keeping all stream from input file is fine for now.
-            encoded_file, is_aborted = AnimeProcessor.process_anime_encode(
-                output_dir=self.__output_dir,
-                source_file_object=encode_file_object,
-                encode_preset=self.__encode_preset,
-                selected_streams=...,
-                ffmpeg_executable=self.__ffmpeg.executable,
-                ffprobe_executable=self.__ffprobe.executable,
-                encode_progress_callback=self.handle_integer_progress_update,
-                abort_signal=lambda: self.__should_quit_immediately
-            )
-
-            if encoded_file is None:
-                output_list.append(None)
-                continue
-            output_list.append(output_file)
+            scheduler.submit(encode_file_object)
+        self.__on_estimate_update.emit(estimator.estimate())
+        try:
+            output_list: List[Optional[Path]] = [_.output_file for _ in scheduler.run()]
+        finally:
+            throughput_history.close()
 
         self.__return_encoded_files.emit(output_list)
+        self.__is_running = False  # before the signal, its slots may check isRunning() (e.g. closing the window)
         self.__on_encode_task_finishing.emit()
-        self.__is_running = False
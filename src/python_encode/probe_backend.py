@@ -0,0 +1,134 @@
+"""
+Probing without spawning ffprobe: PyAV (libav bindings, `pip install av`) opens the file in-process and its result is
+converted to the same dict ffprobe's json output gives, so `AnimeProcessor.read_anime_file_probe_result` and the
+probe cache don't care where it came from.
+
+PyAV is optional. `ProbeBackend.AUTO` uses it when it's installed (and new enough to read chapters), ffprobe otherwise.
+Its dict only has what `ProbeProfile.LEAN` asks for, full profile probes always go to ffprobe.
+"""
+
+from __future__ import annotations
+
+import logging
+from fractions import Fraction
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+
+from python_encode.utils import ProbeBackend, Constants
+
+logger = logging.getLogger(__name__)
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+class PyAVProbe:
+    AV_TIME_BASE = 1000000  # container start time / duration unit
+
+    _warned_unavailable = False
+
+    @staticmethod
+    def is_available() -> bool:
+        # InputContainer.chapters() came with PyAV 14, chapters are needed for segment planning and the output
+        return av is not None and hasattr(av.container.InputContainer, 'chapters')
+
+    @staticmethod
+    def resolve(backend: Optional[str] = None) -> str:
+        """Turn `backend` (one of `ProbeBackend`, default `Constants.PROBE_BACKEND`) into the one actually used"""
+        backend = backend if backend is not None else Constants.PROBE_BACKEND
+        if backend not in ProbeBackend.values():
+            raise ValueError(f"Unknown probe backend {backend}, expect one of {ProbeBackend.values()}")
+        if backend == ProbeBackend.FFPROBE:
+            return ProbeBackend.FFPROBE
+        if PyAVProbe.is_available():
+            return ProbeBackend.PYAV
+        if backend == ProbeBackend.PYAV and not PyAVProbe._warned_unavailable:
+            PyAVProbe._warned_unavailable = True
+            logger.warning("PyAV (>= 14) is not installed, probing with ffprobe instead")
+        return ProbeBackend.FFPROBE
+
+    @staticmethod
+    def _rational(value: Optional[Fraction]) -> str:
+        return f"{value.numerator}/{value.denominator}" if value else "0/0"
+
+    @staticmethod
+    def _seconds(value: Optional[int], time_base: Optional[Fraction]) -> Optional[str]:
+        # ffprobe prints timestamps as seconds with 6 decimals
+        if value is None or not time_base:
+            return None
+        return f"{float(value * time_base):.6f}"
+
+    @staticmethod
+    def _stream_dict(stream) -> Dict[str, Any]:
+        stream_dict: Dict[str, Any] = {
+            'index': stream.index,
+            'codec_type': stream.type,
+            'time_base': PyAVProbe._rational(stream.time_base),
+        }
+        codec_context = stream.codec_context
+        if codec_context is not None:
+            stream_dict['codec_name'] = codec_context.name
+            if stream.type == 'video':
+                stream_dict['width'] = codec_context.width
+                stream_dict['height'] = codec_context.height
+                stream_dict['pix_fmt'] = codec_context.format.name if codec_context.format is not None else None
+                stream_dict['r_frame_rate'] = PyAVProbe._rational(stream.base_rate)
+                stream_dict['avg_frame_rate'] = PyAVProbe._rational(stream.average_rate)
+            elif stream.type == 'audio':
+                stream_dict['sample_rate'] = str(codec_context.sample_rate)
+                stream_dict['channels'] = codec_context.layout.nb_channels
+                stream_dict['channel_layout'] = codec_context.layout.name
+        for key, value in (('start_time', stream.start_time), ('duration', stream.duration)):
+            seconds = PyAVProbe._seconds(value, stream.time_base)
+            if seconds is not None:
+                stream_dict[key] = seconds
+        if stream.frames:
+            stream_dict['nb_frames'] = str(stream.frames)
+        stream_dict['tags'] = dict(stream.metadata)  # ffprobe leaves "tags" out when empty, readers expect it
+        return stream_dict
+
+    @staticmethod
+    def _chapter_dicts(container) -> List[Dict[str, Any]]:
+        chapter_dicts = list()
+        for chapter in container.chapters():
+            time_base = chapter['time_base']
+            chapter_dicts.append({
+                'id': chapter['id'],
+                'time_base': PyAVProbe._rational(time_base),
+                'start': chapter['start'],
+                'start_time': PyAVProbe._seconds(chapter['start'], time_base),
+                'end': chapter['end'],
+                'end_time': PyAVProbe._seconds(chapter['end'], time_base),
+                'tags': dict(chapter['metadata']),
+            })
+        return chapter_dicts
+
+    @staticmethod
+    def probe(file: Path) -> Dict[str, Any]:
+        """
+        Same dict as `ffprobe -show_format -show_streams -show_chapters -print_format json`, only with the fields this
+        package reads (and a few close to them). Raises whatever PyAV raises (`av.FFmpegError`, `OSError`) on failure.
+        """
+        with av.open(file.absolute().__str__(), metadata_errors='ignore') as container:
+            format_dict: Dict[str, Any] = {
+                'filename': file.absolute().__str__(),
+                'nb_streams': len(container.streams),
+                'format_name': container.format.name,
+                'format_long_name': container.format.long_name,
+                'size': str(file.stat().st_size),
+                'tags': dict(container.metadata),
+            }
+            time_base = Fraction(1, PyAVProbe.AV_TIME_BASE)
+            for key, value in (('start_time', container.start_time), ('duration', container.duration)):
+                seconds = PyAVProbe._seconds(value, time_base)
+                if seconds is not None:
+                    format_dict[key] = seconds
+            if container.bit_rate:
+                format_dict['bit_rate'] = str(container.bit_rate)
+            return {
+                'streams': [PyAVProbe._stream_dict(_) for _ in container.streams],
+                'chapters': PyAVProbe._chapter_dicts(container),
+                'format': format_dict,
+            }
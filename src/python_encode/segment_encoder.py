@@ -0,0 +1,347 @@
+"""
+Encode one file as several video segments at the same time, for encoders that can't use the whole machine on their
+own (x265 slow, one 24 minute episode).
+
+    1. video stream is cut (stream copy, nothing re-encoded) at keyframes, chapter starts first so OP / ED stay whole
+    2. segments are encoded in parallel with the preset's video parameters
+    3. encoded segments are joined (concat demuxer, stream copy) and audio / subtitles / attachments / chapters of the
+       source are muxed back in with the preset's parameters for them
+    4. frame count of the result has to match the source, or the encode counts as failed
+
+Every ffmpeg goes through `AnimeProcessor.calling_subprocess_encode`, so abort and suspend work the same as a normal
+encode.
+"""
+
+from __future__ import annotations
+
+import bisect
+import concurrent.futures
+import logging
+import subprocess
+import tempfile
+import threading
+from pathlib import Path
+from typing import Optional, Callable, List, Dict, Tuple
+
+import alive_progress
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject, EncodePresetObject, FFmpegProgress
+from python_encode.utils import Constants, ProbeResultKeys, FrameCountSource
+
+logger = logging.getLogger(__name__)
+
+
+class SegmentPlan:
+    __slots__ = 'video_stream_index', 'cut_times', 'first_pts', 'packet_count'
+
+    def __init__(self, video_stream_index: int, cut_times: List[float], first_pts: float, packet_count: int):
+        self.video_stream_index: int = video_stream_index
+        self.cut_times: List[float] = cut_times  # keyframe timestamps each segment (except the first) starts at
+        self.first_pts: float = first_pts  # timestamp of the first video packet
+        self.packet_count: int = packet_count  # video packets (= frames) in the source
+
+    @property
+    def segment_count(self) -> int:
+        return len(self.cut_times) + 1
+
+    def __str__(self):
+        return f"SegmentPlan(stream={self.video_stream_index}, segments={self.segment_count}, " \
+               f"cuts={[round(_, 3) for _ in self.cut_times]}, packets={self.packet_count})"
+
+
+class SegmentEncoder:
+
+    @staticmethod
+    def probe_video_packets(file: Path, video_stream_index: int,
+                            ffprobe: str = AnimeProcessor.ffprobe) -> Tuple[List[float], Optional[float], int]:
+        """
+        Read packet timestamps of a video stream (demux only, nothing is decoded)
+
+        :return: keyframe timestamps (sorted), timestamp of the first packet, packet count
+        """
+        result = subprocess.run([
+            ffprobe, "-v", "error",
+            "-select_streams", str(video_stream_index),
+            "-show_entries", "packet=pts_time,flags",
+            "-of", "csv=p=0",
+            file.absolute().__str__()
+        ], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if result.returncode != 0:
+            raise subprocess.SubprocessError(
+                f'Process "{ffprobe}" error: {result.stderr.decode(errors="replace").strip()}')
+        keyframes: List[float] = list()
+        first_pts: Optional[float] = None
+        packet_count = 0
+        for line in result.stdout.decode('ascii', errors='replace').splitlines():
+            pts_time, _, flags = line.strip().partition(',')
+            if pts_time == '':
+                continue
+            packet_count += 1
+            try:
+                pts = float(pts_time)
+            except ValueError:
+                continue  # "N/A"
+            first_pts = pts if first_pts is None else min(first_pts, pts)
+            if 'K' in flags:
+                keyframes.append(pts)
+        return sorted(keyframes), first_pts, packet_count
+
+    @staticmethod
+    def plan_cut_times(keyframes: List[float], start: float, end: float, chapter_starts: List[float],
+                       target_seconds: float, min_seconds: float = Constants.SEGMENT_MIN_SECONDS) -> List[float]:
+        """
+        Pick keyframes to cut at: the keyframe nearest to each chapter start, then more keyframes to split whatever
+        is still longer than `target_seconds`. No segment gets shorter than `min_seconds`.
+        """
+        def nearest_keyframe(moment: float) -> float:
+            idx = bisect.bisect_left(keyframes, moment)
+            candidates = keyframes[max(0, idx - 1):idx + 1]
+            return min(candidates, key=lambda _: abs(_ - moment))
+
+        def can_cut(cuts: List[float], moment: float) -> bool:
+            if not start < moment < end:  # a cut on (or past) either end is an empty segment
+                return False
+            bounds = [start] + cuts + [end]
+            idx = bisect.bisect_left(bounds, moment)
+            return moment - bounds[idx - 1] >= min_seconds and bounds[idx] - moment >= min_seconds
+
+        if len(keyframes) == 0:
+            return []
+        cut_times: List[float] = list()
+        for chapter_start in chapter_starts:
+            keyframe = nearest_keyframe(start + chapter_start)
+            if keyframe not in cut_times and can_cut(cut_times, keyframe):
+                bisect.insort(cut_times, keyframe)
+
+        for span_start, span_end in list(zip([start] + cut_times, cut_times + [end])):
+            pieces = round((span_end - span_start) / target_seconds)
+            for piece in range(1, pieces):
+                keyframe = nearest_keyframe(span_start + (span_end - span_start) * piece / pieces)
+                if keyframe not in cut_times and can_cut(cut_times, keyframe):
+                    bisect.insort(cut_times, keyframe)
+        return cut_times
+
+    @staticmethod
+    def plan(source_file_object: AnimeFileObject, video_stream_index: int, segment_jobs: int,
+             ffprobe: str = AnimeProcessor.ffprobe) -> Optional[SegmentPlan]:
+        """Returns `None` if the file is too short (or has too few keyframes) to be worth cutting"""
+        keyframes, first_pts, packet_count = SegmentEncoder.probe_video_packets(
+            source_file_object.file, video_stream_index, ffprobe)
+        if first_pts is None or len(keyframes) < 2:
+            return None
+        end = first_pts + source_file_object.video_length_seconds if source_file_object.video_length_seconds \
+            else keyframes[-1]
+        target_seconds = max(Constants.SEGMENT_MIN_SECONDS,
+                             (end - first_pts) / (segment_jobs * Constants.SEGMENTS_PER_JOB))
+        chapter_starts = list()
+        for chapter_start, _, _ in source_file_object.chapters:
+            try:
+                chapter_starts.append(float(chapter_start))
+            except (TypeError, ValueError):
+                continue
+        cut_times = SegmentEncoder.plan_cut_times(keyframes, first_pts, end, chapter_starts, target_seconds)
+        if len(cut_times) == 0:
+            return None
+        return SegmentPlan(video_stream_index, cut_times, first_pts, packet_count)
+
+    @staticmethod
+    def _stream_options(stream_params: Dict, stream_type: str, output_stream_idx: int) -> List[str]:
+        options = list()
+        for key, val in stream_params.get(stream_type, dict()).items():
+            if val is None:
+                continue
+            options.extend([f'-{key}:{output_stream_idx}', val])
+        return options
+
+    @staticmethod
+    def _metadata_options(extra_options: List[str]) -> List[str]:
+        """"-metadata" pairs of the preset's extra options, lost when only segments get them"""
+        options = list()
+        for idx, option in enumerate(extra_options[:-1]):
+            if option.startswith('-metadata'):
+                options.extend([option, extra_options[idx + 1]])
+        return options
+
+    @staticmethod
+    def compile_split_param(source_file_object: AnimeFileObject, plan: SegmentPlan, segment_pattern: Path,
+                            ffmpeg: str = AnimeProcessor.ffmpeg) -> List[str]:
+        # cut a millisecond early, the segment muxer cuts at the first keyframe at or after each time
+        segment_times = ','.join(f"{_ - 0.001:.6f}" for _ in plan.cut_times)
+        return [
+            ffmpeg, "-i", source_file_object.file.absolute().__str__(),
+            "-map", f"0:{plan.video_stream_index}", "-c", "copy",
+            "-f", "segment", "-segment_times", segment_times, "-segment_format", "matroska",
+            "-reset_timestamps", "1",
+            segment_pattern.absolute().__str__(), "-y"
+        ]
+
+    @staticmethod
+    def compile_segment_encode_param(segment_file: Path, encoded_segment_file: Path,
+                                     encode_preset: EncodePresetObject,
+                                     ffmpeg: str = AnimeProcessor.ffmpeg) -> List[str]:
+        command_args = [ffmpeg]
+        for key, val in encode_preset.stream_params.get('input', dict()).items():
+            command_args.extend([f"-{key}", val])
+        command_args.extend(["-i", segment_file.absolute().__str__(), "-map", "0:0"])
+        command_args.extend(SegmentEncoder._stream_options(
+            encode_preset.stream_params, ProbeResultKeys.StreamTypes.VIDEO, 0))
+        command_args.extend(encode_preset.extra_options)
+        command_args.extend([encoded_segment_file.absolute().__str__(), "-y"])
+        return command_args
+
+    @staticmethod
+    def compile_mux_param(source_file_object: AnimeFileObject, concat_list_file: Path, output_file: Path,
+                          encode_preset: EncodePresetObject, video_offset: float,
+                          select_audio_streams: List[int], select_subtitle_streams: List[int],
+                          select_attachment_streams: List[int], ffmpeg: str = AnimeProcessor.ffmpeg) -> List[str]:
+        """Same stream layout as `AnimeProcessor.compile_encode_param`, video taken from the encoded segments"""
+        st = ProbeResultKeys.StreamTypes
+        stream_params = encode_preset.stream_params
+        command_args = [ffmpeg]
+        if video_offset > 0.001:
+            command_args.extend(["-itsoffset", f"{video_offset:.6f}"])  # keep audio in sync (mpegts starting late)
+        command_args.extend(["-f", "concat", "-safe", "0", "-i", concat_list_file.absolute().__str__(),
+                             "-i", source_file_object.file.absolute().__str__(),
+                             "-map", "0:0", "-c:0", "copy"])
+        stream_counter = 1
+        for stream_type, stream_indexes in ((st.AUDIO, select_audio_streams), (st.SUBTITLE, select_subtitle_streams)):
+            for stream_idx in stream_indexes:
+                command_args.extend(['-map', f'1:{stream_idx}'])
+                command_args.extend(SegmentEncoder._stream_options(stream_params, stream_type, stream_counter))
+                stream_counter += 1
+        if len(select_attachment_streams) > 0 and stream_params.get('keep_attachments', True):
+            for stream_idx in select_attachment_streams:
+                command_args.extend(['-map', f'1:{stream_idx}'])
+            command_args.extend(['-c:t', 'copy'])
+        command_args.extend(['-map_metadata', '1'])
+        command_args.extend(['-map_chapters', '1' if stream_params.get('keep_chapters', True) else '-1'])
+        command_args.extend(SegmentEncoder._metadata_options(encode_preset.extra_options))
+        command_args.extend([output_file.absolute().__str__(), '-y'])
+        return command_args
+
+    @staticmethod
+    def encode(
+            source_file_object: AnimeFileObject,
+            output_file: Path,
+            plan: SegmentPlan,
+            encode_preset: EncodePresetObject,
+            segment_jobs: int,
+            select_audio_streams: List[int],
+            select_subtitle_streams: List[int],
+            select_attachment_streams: List[int],
+            ffmpeg_executable: str = AnimeProcessor.ffmpeg,
+            ffprobe_executable: str = AnimeProcessor.ffprobe,
+            encode_progress_callback: Optional[Callable[[int, int], None]] = ...,
+            show_ffmpeg_stdout: bool = False,
+            abort_signal: Optional[Callable[[], bool]] = ...,
+            encode_progress_object_callback: Optional[Callable[[FFmpegProgress], None]] = ...,
+            on_process_started: Optional[Callable[[subprocess.Popen], None]] = None,
+    ) -> Tuple[Optional[int], str]:
+        """
+        Drop-in for `AnimeProcessor.calling_subprocess_encode` when encoding in segments.
+
+        :param plan: From `SegmentEncoder.plan()`
+        :param segment_jobs: Segments encoded at the same time
+        :param encode_progress_callback: (encoded frames, total frames) of all segments combined
+        :param encode_progress_object_callback: Progress of all running segments summed up (frames, fps, speed...)
+        :return: return code, return message (same as `calling_subprocess_encode`)
+        """
+        # packets counted while planning are exact, an estimated frame count would fail the check at the end
+        total_frames = source_file_object.video_frame_count \
+            if FrameCountSource.is_exact(source_file_object.video_frame_count_source) else plan.packet_count
+        if not isinstance(abort_signal, Callable):
+            abort_signal = lambda: False
+        if not isinstance(encode_progress_object_callback, Callable):
+            encode_progress_object_callback = lambda progress: ...
+        bar = None
+        if not isinstance(encode_progress_callback, Callable):
+            if show_ffmpeg_stdout:
+                encode_progress_callback = lambda encoded_frame_count, total_frame_count: ...
+            else:
+                bar = alive_progress.alive_bar(total_frames, title="Encoding", unit="frames", theme='classic')
+                update_progress = bar.__enter__()
+                encode_progress_callback = lambda encoded_frame_count, total_frame_count: update_progress(
+                    encoded_frame_count - update_progress.current)
+
+        failed_text: List[str] = list()  # first failure stops every other segment
+        should_stop = lambda: len(failed_text) > 0 or abort_signal()
+        quiet = dict(progress_update_callback_integer=lambda encoded_frame_count, total_frame_count: ...,
+                     show_ffmpeg_stdout=show_ffmpeg_stdout, abort_signal=should_stop,
+                     on_process_started=on_process_started)
+        try:
+            with tempfile.TemporaryDirectory(prefix=f".{output_file.stem}_segments_", dir=output_file.parent) as tmp:
+                tmp_dir = Path(tmp)
+                logger.info(f'Encoding "{source_file_object.file_name}" in {plan.segment_count} segments, '
+                            f'{segment_jobs} at a time')
+                returned_code, error_text = AnimeProcessor.calling_subprocess_encode(
+                    anime_src_info=source_file_object, subprocess_args=SegmentEncoder.compile_split_param(
+                        source_file_object, plan, tmp_dir / "source_%04d.mkv", ffmpeg_executable), **quiet)
+                if returned_code != 0:
+                    return returned_code, f"Cannot cut video stream: {error_text}"
+                segment_files = sorted(tmp_dir.glob("source_*.mkv"))
+                if len(segment_files) != plan.segment_count:
+                    logger.warning(f"Expected {plan.segment_count} segments, ffmpeg cut {len(segment_files)}")
+
+                progress_lock = threading.Lock()
+                segment_progress: Dict[int, FFmpegProgress] = dict()
+
+                def on_segment_progress(idx: int, progress: FFmpegProgress) -> None:
+                    with progress_lock:
+                        segment_progress[idx] = progress
+                        combined = FFmpegProgress()
+                        running = [_ for _ in segment_progress.values() if not _.is_end]
+                        combined.frame = sum(_.frame or 0 for _ in segment_progress.values())
+                        combined.total_size = sum(_.total_size or 0 for _ in segment_progress.values())
+                        combined.out_time_seconds = sum(_.out_time_seconds or 0 for _ in segment_progress.values())
+                        combined.fps = sum(_.fps or 0 for _ in running)
+                        combined.speed = sum(_.speed or 0 for _ in running)
+                        encode_progress_callback(combined.frame, total_frames)
+                        encode_progress_object_callback(combined)
+
+                def encode_segment(idx: int, segment_file: Path) -> Path:
+                    encoded_segment_file = tmp_dir / f"encoded_{idx:04d}.mkv"
+                    if should_stop():
+                        return encoded_segment_file
+                    segment_object = AnimeFileObject()
+                    segment_object.file = segment_file
+                    segment_object.file_name = segment_file.name
+                    code, text = AnimeProcessor.calling_subprocess_encode(
+                        anime_src_info=segment_object,
+                        subprocess_args=SegmentEncoder.compile_segment_encode_param(
+                            segment_file, encoded_segment_file, encode_preset, ffmpeg_executable),
+                        progress_update_callback_object=lambda progress: on_segment_progress(idx, progress), **quiet)
+                    if code != 0 and len(failed_text) == 0:
+                        failed_text.append(f"Segment {idx} " + ("aborted" if code is None else f"failed: {text}"))
+                    return encoded_segment_file
+
+                with concurrent.futures.ThreadPoolExecutor(max_workers=segment_jobs,
+                                                           thread_name_prefix="segment-encode") as executor:
+                    encoded_segment_files = list(executor.map(encode_segment, range(len(segment_files)), segment_files))
+                if abort_signal():
+                    return None, "Aborted"
+                if len(failed_text) > 0:
+                    return 1, failed_text[0]
+
+                concat_list_file = tmp_dir / "concat.txt"
+                concat_list_file.write_text(''.join(
+                    "file '{}'\n".format(_.absolute().__str__().replace("'", "'\\''")) for _ in encoded_segment_files))
+                source_start = AnimeProcessor.probe_file(source_file_object.file, ffprobe_executable) \
+                    .get("format", dict()).get("start_time", None)
+                video_offset = plan.first_pts - float(source_start) if source_start is not None else 0.0
+                returned_code, error_text = AnimeProcessor.calling_subprocess_encode(
+                    anime_src_info=source_file_object, subprocess_args=SegmentEncoder.compile_mux_param(
+                        source_file_object, concat_list_file, output_file, encode_preset, video_offset,
+                        select_audio_streams, select_subtitle_streams, select_attachment_streams, ffmpeg_executable),
+                    **quiet)
+                if returned_code != 0:
+                    return returned_code, f"Cannot join segments: {error_text}"
+        finally:
+            if bar is not None:
+                bar.__exit__(None, None, None)
+
+        encoded_frames = AnimeProcessor.count_video_packets(output_file, ffprobe_executable)
+        if encoded_frames != total_frames:
+            return 1, f"Frame count mismatch: source has {total_frames} frames, encoded file has {encoded_frames}"
+        logger.debug(f"Segment encode complete, {encoded_frames} frames")
+        return 0, ""
@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 import logging
+import time
 from pathlib import Path
 from threading import Thread
 from typing import List, Optional
 
-from PySide6.QtCore import QThread, Qt, Signal, SignalInstance
+from PySide6.QtCore import QThread, QTimer, Qt, Signal, SignalInstance
 from PySide6.QtGui import QCloseEvent
 from PySide6.QtWidgets import QMainWindow, QFormLayout, QFileDialog
 
@@ -43,6 +44,11 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         self._load_video_progress_dialog = LoadDialog()
         self.read_file_worker = AnimeFileObjectWorkerQT()
         self.encode_worker: AnimeEncodeWorkerQT = ...
+        self._close_after_encode_stopped = False  # user closed the window during encode
+        self._encode_stop_requested_at = 0.0
+        self._encode_stopping_timer = QTimer(self)  # counts up the "stopping" hint, ffmpeg can take a while
+        self._encode_stopping_timer.setInterval(1000)
+        self._encode_stopping_timer.timeout.connect(self._update_encode_stopping_hint)
 
         """UI element"""
         self.info_widget_controller = SourceInfoWidget()
@@ -181,7 +187,9 @@ class MainWindow(QMainWindow, Ui_MainWindow):
             ffmpeg=self.app_setting_widget_controller.get_ffmpeg_program_info(),
             ffprobe=self.app_setting_widget_controller.get_ffprobe_program_info(),
             encode_preset=self.encode_settings_widget_controller.selected_preset,
-            selected_streams=...    # todo: add stream selection in encode settings
+            selected_streams=...,    # todo: add stream selection in encode settings
+            max_jobs=self.app_setting_widget_controller.get_encode_jobs(),
+            encode_windows=self.app_setting_widget_controller.get_encode_windows()
         )
         self.encode_worker.config_signal(
             on_starting_callbacks=[
@@ -198,9 +206,13 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 self.encode_worker.deleteLater,
                 lambda : self.label_statusTextGlobal.setText(Lp.HINT_ENCODE_COMPLETED),
                 lambda : self.widget_progressContainer.setVisible(False),
-                lambda : self.pushButton_startStopEncode.setText(Lp.BUTTON_START_ENCODE)
+                lambda : self.progressBar_statusGlobal.setFormat("%p%"),
+                lambda : self.pushButton_startStopEncode.setText(Lp.BUTTON_START_ENCODE),
+                self._on_encode_stopped
             ],
-            return_encoded_file=lambda file_list: ...
+            return_encoded_file=lambda file_list: ...,
+            on_estimate_update_callback=lambda estimate: self.progressBar_statusGlobal.setFormat(
+                str.format(Lp.HINT_ENCODE_PROGRESS_ETA, estimate))
         )
         self.encode_worker.moveToThread(self.encode_thread)
 
@@ -215,7 +227,7 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         if isinstance(self.encode_worker, AnimeEncodeWorkerQT) and self.encode_worker.isRunning():
             should_stop = self.handle_user_cancelling_encode()
             if should_stop:
-                self.encode_worker.signal_quit()
+                self.stop_encode()
             return
 
         if len(self.input_source_anime_objects) == 0:
@@ -235,19 +247,39 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         # logger.debug(f"close confirm dialog: {answer} ")
         return answer == ShowMessageBox.buttons.Yes
 
+    def stop_encode(self) -> None:
+        """Ask the encode worker to stop, without waiting. `_on_encode_stopped` is called once it did."""
+        self.encode_worker.signal_quit()
+        self.pushButton_startStopEncode.setEnabled(False)
+        self._encode_stop_requested_at = time.monotonic()
+        self._update_encode_stopping_hint()
+        self._encode_stopping_timer.start()
+
+    def _update_encode_stopping_hint(self) -> None:
+        self.label_statusTextGlobal.setText(str.format(
+            Lp.HINT_STOPPING_ENCODE, int(time.monotonic() - self._encode_stop_requested_at)))
+
+    def _on_encode_stopped(self) -> None:
+        self._encode_stopping_timer.stop()
+        self.pushButton_startStopEncode.setEnabled(True)
+        if self._close_after_encode_stopped:
+            logger.debug("Encode stopped, closing main window.")
+            self.close()
+
     def closeEvent(self, event: QCloseEvent) -> None:
         logger.debug(f"User closing main window. Encode worker is initialized and running = {isinstance(self.encode_worker, AnimeEncodeWorkerQT) and self.encode_worker.isRunning()}")
         if isinstance(self.encode_worker, type(...)) or not self.encode_worker.isRunning():
             event.accept()
             return
+        # the window stays open (and responsive) while ffmpeg finishes, `_on_encode_stopped` closes it afterwards
+        if self._close_after_encode_stopped:
+            event.ignore()  # already stopping
+            return
         if self.handle_user_cancelling_encode():
-            self.encode_worker.signal_quit()
+            self._close_after_encode_stopped = True
+            self.stop_encode()
             logger.debug("User closing windows, and encode stop signal is sent.")
-            while self.encode_worker.isRunning():
-                pass  # blocks until encode process completes
-            event.accept()
-        else:
-            event.ignore()
+        event.ignore()
 
     def dragEnterEvent(self, event):
         """ unnecessary in this case, kept for testing/debugging purpose """
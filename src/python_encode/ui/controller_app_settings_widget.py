@@ -6,6 +6,7 @@ from typing import Optional, Union, Tuple
 
 from PySide6.QtWidgets import QWidget, QLineEdit, QLabel, QFileDialog
 
+from python_encode.encode_window import EncodeWindowSchedule
 from python_encode.ui.language import AppSettingsWidgetString as lp
 from python_encode.ui.model_program_settings import ApplicationSettingsRepository as Repos, ProgramInfo
 from python_encode.ui.ui_app_settings_widget import Ui_Form
@@ -35,6 +36,14 @@ class AppSettingsWidget(QWidget, Ui_Form):
     @staticmethod
     def get_output_directory() -> Path:
         return Repos.current_output_dir.get()
+
+    @staticmethod
+    def get_encode_jobs() -> int:
+        return Repos.encode_jobs.get()
+
+    @staticmethod
+    def get_encode_windows() -> EncodeWindowSchedule:
+        return Repos.encode_windows.get()
     
     @staticmethod
     def is_ready(widget: QWidget, display_error_message_box: bool = False) -> bool:
@@ -94,6 +103,7 @@ class AppSettingsWidget(QWidget, Ui_Form):
                 self.lineEdit_ffprobeC, self.label_ffprobeC, Repos.ffprobe
             )
         })
+        self.spinBox_encodeJobs.valueChanged.connect(Repos.encode_jobs.set)
         self.reset_labels()
 
     @staticmethod
@@ -235,3 +245,4 @@ class AppSettingsWidget(QWidget, Ui_Form):
         else:
             Repos.current_output_dir.set(output_dir)
         self.lineEdit_saveDirectory.setText(output_dir.absolute().__str__())
+        self.spinBox_encodeJobs.setValue(Repos.encode_jobs.get())
@@ -31,6 +31,8 @@ class MainWindowString(VariousString):
     MSG_INFO_NO_INPUT = QCoreApplication.translate('MainWindowString', 'No file to encode.')
     HINT_ENCODING_FILE = QCoreApplication.translate("MainWindowString", "Encoding {}")
     HINT_ENCODE_COMPLETED = QCoreApplication.translate("MainWindowString", 'Encode Completed')
+    HINT_ENCODE_PROGRESS_ETA = QCoreApplication.translate("MainWindowString", '%p% - {}')  # {} is "ETA hh:mm:ss (day hh:mm)"
+    HINT_STOPPING_ENCODE = QCoreApplication.translate("MainWindowString", 'Stopping encode, waiting for ffmpeg to finish writing... ({}s)')
     OPEN_SOURCE = QCoreApplication.translate("MainWindowString", 'Open Source')
     HINT_OPEN_SOURCE = QCoreApplication.translate("MainWindowString", 'Open a file to continue...')
     HINT_MULTIPLE_INPUTS = QCoreApplication.translate("MainWindowString", 'and {} more')
@@ -4,6 +4,7 @@ from pathlib import Path
 from typing import Optional, Dict, TypeVar
 
 from python_encode.custom_objects import ProgramInfo, EncodePresetObject
+from python_encode.encode_window import EncodeWindowSchedule
 from python_encode.ui.model import DictReader, GenericObject
 
 logger = logging.getLogger(__name__)
@@ -21,6 +22,9 @@ class ApplicationSettingsRepository:
     preferred_preset: Optional[EncodePresetObject] = None
     preferred_output_dir: GenericObject[Path] = GenericObject()
     current_output_dir: GenericObject[Path] = GenericObject(Path(""))  # future me: why GenericObject class?
+    encode_jobs: GenericObject[int] = GenericObject(1)  # files encoded at the same time
+    # only encode inside these windows, e.g. ["mon-fri 22:00-07:00", "sat,sun 00:00-24:00"]. empty means always
+    encode_windows: GenericObject[EncodeWindowSchedule] = GenericObject(EncodeWindowSchedule())
 
     @staticmethod
     def load_from_preference(pref_dict: Dict = ...):
@@ -43,6 +47,12 @@ class ApplicationSettingsRepository:
         dr.set_from_val_read(ApplicationSettingsRepository.ffmpeg.set_executable, 'ffmpeg')
         dr.set_from_val_read(ApplicationSettingsRepository.ffprobe.set_executable, 'ffprobe')
         dr.set_from_val_read(lambda path: ApplicationSettingsRepository.preferred_output_dir.set(Path(path)), 'output_dir')
+        dr.set_from_val_read(lambda jobs: ApplicationSettingsRepository.encode_jobs.set(max(1, int(jobs))), 'encode_jobs')
+        try:
+            dr.set_from_val_read(lambda windows: ApplicationSettingsRepository.encode_windows.set(
+                EncodeWindowSchedule.parse(windows)), 'encode_windows')
+        except ValueError as ex:
+            logger.warning(f"Invalid encode_windows in preference file, encoding at any time: {ex}")
 
 
 ApplicationSettingsRepository.load_from_preference()
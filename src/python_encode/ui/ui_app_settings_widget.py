@@ -17,8 +17,8 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QPalette, QPixmap, QRadialGradient, QTransform)
 from PySide6.QtWidgets import (QApplication, QCheckBox, QFormLayout, QFrame,
     QGridLayout, QHBoxLayout, QLabel, QLineEdit,
-    QPushButton, QSizePolicy, QSpacerItem, QToolButton,
-    QVBoxLayout, QWidget)
+    QPushButton, QSizePolicy, QSpacerItem, QSpinBox,
+    QToolButton, QVBoxLayout, QWidget)
 
 class Ui_Form(object):
     def setupUi(self, Form):
@@ -100,7 +100,7 @@ class Ui_Form(object):
 
         self.horizontalSpacer_3 = QSpacerItem(40, 20, QSizePolicy.Expanding, QSizePolicy.Minimum)
 
-        self.formLayout.setItem(6, QFormLayout.LabelRole, self.horizontalSpacer_3)
+        self.formLayout.setItem(7, QFormLayout.LabelRole, self.horizontalSpacer_3)
 
         self.widget = QWidget(self.frame)
         self.widget.setObjectName(u"widget")
@@ -113,7 +113,7 @@ class Ui_Form(object):
         self.horizontalLayout_3.addWidget(self.pushButton_applyAppSetting)
 
 
-        self.formLayout.setWidget(6, QFormLayout.FieldRole, self.widget)
+        self.formLayout.setWidget(7, QFormLayout.FieldRole, self.widget)
 
         self.checkBox_roundBracketIsNotTag = QCheckBox(self.frame)
         self.checkBox_roundBracketIsNotTag.setObjectName(u"checkBox_roundBracketIsNotTag")
@@ -153,6 +153,18 @@ class Ui_Form(object):
 
         self.formLayout.setWidget(2, QFormLayout.FieldRole, self.frame_3)
 
+        self.label_encodeJobs = QLabel(self.frame)
+        self.label_encodeJobs.setObjectName(u"label_encodeJobs")
+
+        self.formLayout.setWidget(6, QFormLayout.LabelRole, self.label_encodeJobs)
+
+        self.spinBox_encodeJobs = QSpinBox(self.frame)
+        self.spinBox_encodeJobs.setObjectName(u"spinBox_encodeJobs")
+        self.spinBox_encodeJobs.setMinimum(1)
+        self.spinBox_encodeJobs.setMaximum(16)
+
+        self.formLayout.setWidget(6, QFormLayout.FieldRole, self.spinBox_encodeJobs)
+
         self.frame_4 = QFrame(self.frame)
         self.frame_4.setObjectName(u"frame_4")
         self.gridLayout = QGridLayout(self.frame_4)
@@ -199,6 +211,7 @@ class Ui_Form(object):
         self.label.setText(QCoreApplication.translate("Form", u"Output directory", None))
         self.toolButton_findFfprobe.setText(QCoreApplication.translate("Form", u"...", None))
         self.pushButton_verifyFfprobe.setText(QCoreApplication.translate("Form", u"Verify", None))
+        self.label_encodeJobs.setText(QCoreApplication.translate("Form", u"Parallel encodes", None))
         self.toolButton_saveDirectory.setText(QCoreApplication.translate("Form", u"...", None))
         self.lineEdit_saveDirectory.setPlaceholderText(QCoreApplication.translate("Form", u"Default: current working directory", None))
     # retranslateUi
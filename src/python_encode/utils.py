@@ -4,14 +4,18 @@ Try not to import non-buildin library plz...
 """
 
 from __future__ import annotations
+import concurrent.futures
 from datetime import datetime
 import json
 import logging
+import mmap
+import os
 import re
 from pathlib import Path
 import subprocess
 from subprocess import CompletedProcess
 import sys
+import threading
 from typing import Callable, Optional, Dict, List, Sized, Iterable, Any, Generic, Text, TextIO, AnyStr
 import zlib
 from argparse import ArgumentParser
@@ -34,6 +38,128 @@ class Constants:
     KNOWN_NON_OMITTABLE_TAGS = {'BD', 'WEB-DL'}  # it should be case-insensitive (default to upper case)
     KNOWN_OMITTABLE_TAGS = {'HEVC', 'AAC', 'OPUS'}
     LOGGER_SETUP = False
+    CRC32_SEGMENT_SIZE = 256 * 1024 * 1024  # 256 MiB per worker task in parallel CRC32 mode
+    CRC32_CHUNK_SIZE = 1024 * 1024  # bytes hashed per zlib.crc32() call (and per progress callback)
+    CRC32_IO_BACKEND = 'readinto'  # one of `Crc32IOBackend`
+    PROBE_BACKEND = 'auto'  # one of `ProbeBackend`
+    PROBE_PROFILE = 'lean'  # one of `ProbeProfile`
+    PROBE_WORKERS = 8  # files probed at the same time by `AnimeProcessor.probe_files`
+    # count video packets of sources whose frame count is only an estimate (reads the whole file, next to hashing)
+    COUNT_PACKETS = False
+    NAME_PARSE_CHUNK_SIZE = 5000  # file names per task when `AnimeProcessor.parse_anime_file_names` uses processes
+    CRC32_DROP_PAGE_CACHE = True  # tell the OS hashed pages won't be needed again (where posix_fadvise exists)
+    # containers whose muxer never seeks back, so ffmpeg can write them to a pipe without losing anything.
+    # (matroska/mp4 seek back to write cues/index/duration, and they come out degraded from a pipe)
+    PIPE_SAFE_CONTAINER_FORMATS = {'.ts': 'mpegts', '.m2ts': 'mpegts', '.nut': 'nut', '.flv': 'flv'}
+    WATCH_POLL_INTERVAL = 5  # seconds between folder scans when inotify isn't used
+    WATCH_SETTLE_SECONDS = 10  # a new file must stay unchanged this long before it's picked up
+    # unfinished downloads and sidecars, never picked up in watch mode
+    WATCH_IGNORED_SUFFIXES = {'.part', '.!qb', '.crdownload', '.tmp', '.sfv', '.md5'}
+    # stopping ffmpeg: "q" on stdin first (it finishes the file properly), SIGTERM if it's still running after
+    # FFMPEG_QUIT_TIMEOUT seconds, SIGKILL after another FFMPEG_TERMINATE_TIMEOUT
+    FFMPEG_QUIT_TIMEOUT = 15
+    FFMPEG_TERMINATE_TIMEOUT = 10
+    SEGMENT_MIN_SECONDS = 30  # segment encode never cuts a piece shorter than this
+    SEGMENTS_PER_JOB = 2  # cut about this many segments per parallel segment encode, so they finish close together
+    ESTIMATE_INTERVAL = 1.0  # seconds an ETA is reused for by progress callbacks, computing one walks every job
+    DISTRIBUTED_PORT = 8265  # coordinator default port
+    DISTRIBUTED_LEASE_SECONDS = 60  # a job goes back to the queue when its worker is silent this long
+    DISTRIBUTED_HEARTBEAT_SECONDS = 10  # workers renew their lease this often
+    DISTRIBUTED_POLL_SECONDS = 5  # idle workers ask for a job this often
+    DISTRIBUTED_MAX_ATTEMPTS = 3  # a job is given up after losing its lease / failing this many times
+    DISTRIBUTED_REQUEST_TIMEOUT = 30
+    DISTRIBUTED_MAX_FAILED_CALLS = 6  # worker stops once the coordinator is unreachable this many times in a row
+
+
+class Crc32IOBackend:
+    """ How file bytes are fed into zlib.crc32() """
+    READ = 'read'  # fh.read() into a new bytes object per chunk
+    READINTO = 'readinto'  # fh.readinto() a preallocated buffer, no allocation per chunk
+    MMAP = 'mmap'  # hash slices of a memory mapped file, no copy at all
+
+    @staticmethod
+    def values() -> List[str]:
+        return [Crc32IOBackend.READ, Crc32IOBackend.READINTO, Crc32IOBackend.MMAP]
+
+
+class ProbeBackend:
+    """ What reads streams / chapters / duration of a source file """
+    AUTO = 'auto'  # PyAV if installed, ffprobe otherwise
+    FFPROBE = 'ffprobe'  # one ffprobe process per file
+    PYAV = 'pyav'  # in-process through PyAV (libav bindings), no process spawned per file
+
+    @staticmethod
+    def values() -> List[str]:
+        return [ProbeBackend.AUTO, ProbeBackend.FFPROBE, ProbeBackend.PYAV]
+
+
+class ProbeProfile:
+    """ How much ffprobe is asked for """
+    LEAN = 'lean'  # only the entries reading / encoding a source needs (see `AnimeProcessor.LEAN_PROBE_ENTRIES`)
+    FULL = 'full'  # everything "-show_format -show_streams -show_chapters" gives, for showing file details
+
+    @staticmethod
+    def values() -> List[str]:
+        return [ProbeProfile.LEAN, ProbeProfile.FULL]
+
+
+class FrameCountSource:
+    """ Where `AnimeFileObject.video_frame_count` came from """
+    TAGS = 'tags'  # NUMBER_OF_FRAMES statistics tag (mkvmerge)
+    NB_FRAMES = 'nb_frames'  # frame count stored by the container (e.g. mp4 sample table)
+    PACKETS = 'packets'  # counted with "ffprobe -count_packets"
+    ESTIMATE = 'estimate'  # duration x average frame rate, good enough for progress bars and nothing else
+
+    @staticmethod
+    def is_exact(source: Optional[str]) -> bool:
+        return source in (FrameCountSource.TAGS, FrameCountSource.NB_FRAMES, FrameCountSource.PACKETS)
+
+
+class EncodeStage:
+    """ Where a source file is in the read -> encode -> rename pipeline """
+    PROBED = 'probed'
+    HASHED = 'hashed'  # probed and crc32 calculated
+    ENCODING = 'encoding'  # output file created, ffmpeg running (or killed half way)
+    ENCODED = 'encoded'  # ffmpeg finished, output file not renamed yet
+    RENAMED = 'renamed'  # done
+    FAILED = 'failed'
+
+    @staticmethod
+    def values() -> List[str]:
+        return [EncodeStage.PROBED, EncodeStage.HASHED, EncodeStage.ENCODING, EncodeStage.ENCODED,
+                EncodeStage.RENAMED, EncodeStage.FAILED]
+
+
+class HashingFileWriter:
+    """
+    Write-only file that calculates CRC32 of everything written to it,
+    so a file can be hashed while it's being created instead of reading it again afterwards.
+    """
+    __slots__ = '_fh', '_hash_val', 'bytes_written'
+
+    def __init__(self, file: Path):
+        self._fh = open(file.__str__(), 'wb')
+        self._hash_val = 0
+        self.bytes_written = 0
+
+    def write(self, data: bytes) -> int:
+        self._hash_val = zlib.crc32(data, self._hash_val)
+        self.bytes_written += len(data)
+        return self._fh.write(data)
+
+    def close(self) -> None:
+        self._fh.close()
+
+    @property
+    def crc32(self) -> str:
+        """Same format as `HelperFunctions.get_file_crc32`"""
+        return format((self._hash_val & 0xFFFFFFFF), '08X')
+
+    def __enter__(self) -> HashingFileWriter:
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        self.close()
 
 
 class HelperFunctions:
@@ -57,12 +183,22 @@ class HelperFunctions:
 
     @staticmethod
     def get_file_crc32(file: Path, on_file_chunk_read: Optional[Callable[[int], None]] = None,
-                       abort_signal: Optional[Callable[[], None]] = None) -> str:
+                       abort_signal: Optional[Callable[[], None]] = None,
+                       workers: int = 1, segment_size: int = Constants.CRC32_SEGMENT_SIZE,
+                       io_backend: Optional[str] = None, chunk_size: Optional[int] = None,
+                       drop_page_cache: Optional[bool] = None) -> str:
         """
         Calculate CRC32 for an episode, and return the value as string
 
         :param on_file_chunk_read: (Chunk size): Callback upon reading x bytes of data
         :param abort_signal: A function that reads if abort signal is received. Useful when using alive_progress bar.
+        :param workers: Hash the file in `segment_size` segments with this many threads, then merge segment
+            checksums with `crc32_combine`. 1 means the plain serial read. Result is the same either way.
+        :param segment_size: Size of each segment (in bytes) when `workers` > 1.
+        :param io_backend: One of `Crc32IOBackend`. Defaults to `Constants.CRC32_IO_BACKEND`.
+        :param chunk_size: Bytes per read / zlib.crc32() call. Defaults to `Constants.CRC32_CHUNK_SIZE`.
+        :param drop_page_cache: Advise the OS to read ahead and to drop hashed pages from page cache, so hashing
+            a season doesn't push out what ffmpeg is reading. Defaults to `Constants.CRC32_DROP_PAGE_CACHE`.
 
         Note
         ----
@@ -73,6 +209,8 @@ class HelperFunctions:
         and
         https://stackoverflow.com/questions/1742866/compute-crc-of-file-in-python
 
+        zlib releases GIL while hashing large enough buffers, so threads do run in parallel here.
+
         More Notes
         ----------
         0 means padding with zero (left side), 8 means the string length, X means upper case hex value.
@@ -91,17 +229,151 @@ class HelperFunctions:
             }
         if not isinstance(abort_signal, Callable):
             abort_signal = lambda: False
+        if io_backend is None:
+            io_backend = Constants.CRC32_IO_BACKEND
+        if io_backend not in Crc32IOBackend.values():
+            raise ValueError(f"Unknown CRC32 I/O backend {io_backend}, expect one of {Crc32IOBackend.values()}")
+        if chunk_size is None:
+            chunk_size = Constants.CRC32_CHUNK_SIZE
+        if drop_page_cache is None:
+            drop_page_cache = Constants.CRC32_DROP_PAGE_CACHE
+
+        def hash_range(offset: int, length: int, on_chunk_read: Callable[[int], None]) -> int:
+            return HelperFunctions._get_file_range_crc32(
+                file, offset, length, on_chunk_read, abort_signal, io_backend, chunk_size, drop_page_cache)
+
+        file_size = file.stat().st_size
+        if workers <= 1 or file_size <= segment_size:
+            hash_val = hash_range(0, file_size, on_file_chunk_read_cb)
+            # return "%08X" % (hash & 0xFFFFFFFF)
+            return format((hash_val & 0xFFFFFFFF), '08X')
+
+        # progress callbacks are not expected to be thread safe
+        callback_lock = threading.Lock()
+
+        def on_segment_chunk_read(chunk_size: int) -> None:
+            with callback_lock:
+                on_file_chunk_read_cb(chunk_size)
+
+        segments = [(offset, min(segment_size, file_size - offset)) for offset in range(0, file_size, segment_size)]
+        logger.debug(f"Hashing {file.name} in {len(segments)} segments with {workers} workers")
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            segment_hashes = list(executor.map(
+                lambda segment: hash_range(segment[0], segment[1], on_segment_chunk_read), segments
+            ))
+        hash_val = segment_hashes[0]
+        for segment, segment_hash in zip(segments[1:], segment_hashes[1:]):
+            hash_val = HelperFunctions.crc32_combine(hash_val, segment_hash, segment[1])
+        return format((hash_val & 0xFFFFFFFF), '08X')
+
+    @staticmethod
+    def _get_file_range_crc32(file: Path, offset: int, length: int, on_file_chunk_read: Callable[[int], None],
+                              abort_signal: Callable[[], bool], io_backend: str = Crc32IOBackend.READ,
+                              chunk_size: int = 65536, drop_page_cache: bool = False) -> int:
+        """CRC32 (as int) of `length` bytes starting at `offset`"""
+        # posix_fadvise is not available on Windows (and some other platforms)
+        use_fadvise = drop_page_cache and hasattr(os, 'posix_fadvise')
+        hash_val = 0
         with open(file.__str__(), 'rb') as fh:
-            hash_val = 0
+            if use_fadvise:
+                os.posix_fadvise(fh.fileno(), offset, length, os.POSIX_FADV_SEQUENTIAL)
+
+            def on_chunk_hashed(chunk_offset: int, hashed_size: int) -> None:
+                on_file_chunk_read(hashed_size)
+                if use_fadvise:
+                    os.posix_fadvise(fh.fileno(), chunk_offset, hashed_size, os.POSIX_FADV_DONTNEED)
+
+            if io_backend == Crc32IOBackend.MMAP:
+                if length == 0:
+                    return hash_val  # cannot mmap an empty range
+                # mmap offset must be aligned to allocation granularity
+                map_offset = offset - offset % mmap.ALLOCATIONGRANULARITY
+                skip = offset - map_offset
+                with mmap.mmap(fh.fileno(), length + skip, offset=map_offset, access=mmap.ACCESS_READ) as mm:
+                    with memoryview(mm) as view:
+                        position = skip
+                        while position < skip + length and not abort_signal():
+                            chunk = view[position:min(position + chunk_size, skip + length)]
+                            hash_val = zlib.crc32(chunk, hash_val)
+                            chunk.release()
+                            on_chunk_hashed(map_offset + position, min(chunk_size, skip + length - position))
+                            position += chunk_size
+                return hash_val
+
+            fh.seek(offset)
+            position = offset
+            if io_backend == Crc32IOBackend.READINTO:
+                buffer = bytearray(chunk_size)
+                buffer_view = memoryview(buffer)
+                while length > 0 and not abort_signal():
+                    read_size = fh.readinto(buffer_view[:min(chunk_size, length)])
+                    if not read_size:
+                        break
+                    hash_val = zlib.crc32(buffer_view[:read_size], hash_val)
+                    length -= read_size
+                    on_chunk_hashed(position, read_size)
+                    position += read_size
+                buffer_view.release()
+                return hash_val
+
             # ~ while abort_signal is None or abort_signal() == False
-            while not abort_signal():
-                s = fh.read(65536)
+            while length > 0 and not abort_signal():
+                s = fh.read(min(chunk_size, length))
                 if not s:
                     break
-                on_file_chunk_read_cb(len(s))
+                length -= len(s)
                 hash_val = zlib.crc32(s, hash_val)
-            # return "%08X" % (hash & 0xFFFFFFFF)
-            return format((hash_val & 0xFFFFFFFF), '08X')
+                on_chunk_hashed(position, len(s))
+                position += len(s)
+            return hash_val
+
+    @staticmethod
+    def crc32_combine(crc1: int, crc2: int, len2: int) -> int:
+        """
+        Combine CRC32 of two consecutive blocks into the CRC32 of both, like zlib's `crc32_combine()`,
+        which python's zlib module doesn't expose.
+
+        :param crc1: CRC32 of the first block
+        :param crc2: CRC32 of the second block
+        :param len2: Length (in bytes) of the second block
+        """
+
+        def gf2_matrix_times(mat: List[int], vec: int) -> int:
+            result = 0
+            idx = 0
+            while vec:
+                if vec & 1:
+                    result ^= mat[idx]
+                vec >>= 1
+                idx += 1
+            return result
+
+        def gf2_matrix_square(mat: List[int]) -> List[int]:
+            return [gf2_matrix_times(mat, row) for row in mat]
+
+        if len2 <= 0:
+            return crc1
+
+        # operator for one zero bit, then square it into 2 and 4 zero bits
+        odd = [0xEDB88320] + [1 << n for n in range(31)]
+        even = gf2_matrix_square(odd)
+        odd = gf2_matrix_square(even)
+
+        # apply len2 zeros to crc1 (first square will put the operator for one zero byte, eight zero bits, in even)
+        while True:
+            even = gf2_matrix_square(odd)
+            if len2 & 1:
+                crc1 = gf2_matrix_times(even, crc1)
+            len2 >>= 1
+            if len2 == 0:
+                break
+            odd = gf2_matrix_square(even)
+            if len2 & 1:
+                crc1 = gf2_matrix_times(odd, crc1)
+            len2 >>= 1
+            if len2 == 0:
+                break
+        return (crc1 ^ crc2) & 0xFFFFFFFF
 
     @staticmethod
     def is_string_empty(subject: str, whitespace_is_empty: bool = True) -> bool:
@@ -185,6 +457,24 @@ class HelperFunctions:
             logger.info(f'Got ffmpeg version: {to_return}')
             return to_return
 
+    @staticmethod
+    def get_user_cache_dir(app_name: str = "python_encode") -> Path:
+        """
+        Return (and create if missing) a per-user cache directory for this app.
+
+        Linux follows XDG (`$XDG_CACHE_HOME` or `~/.cache`), Windows uses `%LOCALAPPDATA%`,
+        and macOS uses `~/Library/Caches`.
+        """
+        if sys.platform == 'win32':
+            base_dir = Path(os.environ.get('LOCALAPPDATA', Path.home() / "AppData" / "Local"))
+        elif sys.platform == 'darwin':
+            base_dir = Path.home() / "Library" / "Caches"
+        else:
+            base_dir = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / ".cache"))
+        cache_dir = base_dir / app_name
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir
+
     @staticmethod
     def get_value_from_nested_dict(*keys, dict_obj: Dict, default: Any = None) -> Any:
         current_dict = dict_obj
@@ -0,0 +1,88 @@
+import asyncio
+import subprocess
+import zlib
+from pathlib import Path
+from typing import List, Optional
+
+import pytest
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.async_processor import AsyncAnimeProcessor
+from python_encode.utils import FrameCountSource
+
+NAME = "(Group) Episode Name - 01 [1080p]"
+# no frame count, only an estimate from duration x frame rate
+PROBE_RESULT = {
+    "format": {"duration": "10.0"},
+    "streams": [{"codec_type": "video", "width": 1920, "height": 1080, "avg_frame_rate": "24/1"}],
+}
+
+
+@pytest.fixture
+def source(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.setattr(AnimeProcessor, "use_probe_cache", False)
+    monkeypatch.setattr(AnimeProcessor, "use_crc32_cache", False)
+    monkeypatch.setattr(AnimeProcessor, "count_video_packets", lambda file, ffprobe, stream_index: 239)
+    file = tmp_path / f"{NAME}.mkv"
+    file.write_bytes(b"\x00\x01" * 5000)
+    return file
+
+
+def fake_probe_result() -> dict:
+    return {"format": dict(PROBE_RESULT["format"]), "streams": [dict(_) for _ in PROBE_RESULT["streams"]]}
+
+
+def fake_probe(profiles: List[Optional[str]], fail: bool = False):
+    async def probe_file(file: Path, ffprobe_path: str = AnimeProcessor.ffprobe, use_cache: bool = True,
+                         profile: Optional[str] = None) -> dict:
+        profiles.append(profile)
+        if fail:
+            raise subprocess.SubprocessError("cannot read")
+        return fake_probe_result()
+    return probe_file
+
+
+@pytest.mark.parametrize("count_packets, expected", [
+    (True, (239, FrameCountSource.PACKETS)),
+    (False, (240, FrameCountSource.ESTIMATE)),
+])
+def test_read_anime_file_matches_blocking(source: Path, monkeypatch: pytest.MonkeyPatch, count_packets: bool,
+                                          expected: tuple):
+    profiles = list()
+    monkeypatch.setattr(AsyncAnimeProcessor, "probe_file", fake_probe(profiles))
+    anime = asyncio.run(AsyncAnimeProcessor.read_anime_file(
+        source, ignoring_left_brackets={'('}, probe_profile="fast", count_packets=count_packets))
+    blocking = AnimeProcessor.read_anime_file(
+        source, probe_result=fake_probe_result(), ignoring_left_brackets={'('}, probe_profile="fast",
+        count_packets=count_packets)
+
+    assert profiles == ["fast"]
+    assert (anime.video_frame_count, anime.video_frame_count_source) == expected
+    assert anime.crc32[0] == f"{zlib.crc32(source.read_bytes()):08X}"
+    assert anime.release_group is None  # "(" isn't a bracket here
+    assert anime.to_dict() == blocking.to_dict()
+    # ignoring brackets doesn't change the defaults
+    assert '(' in AnimeProcessor.brackets
+
+
+def test_read_anime_file_probe_failed(source: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(AsyncAnimeProcessor, "probe_file", fake_probe(list(), fail=True))
+    assert asyncio.run(AsyncAnimeProcessor.read_anime_file(source)) is None
+
+
+def test_read_anime_files(source: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    profiles = list()
+    monkeypatch.setattr(AsyncAnimeProcessor, "probe_file", fake_probe(profiles))
+    other = tmp_path / "[Other] Episode Name - 02.mkv"
+    other.write_bytes(b"\x02" * 3000)
+    bytes_read = list()
+    results = asyncio.run(AsyncAnimeProcessor.read_anime_files(
+        [source, tmp_path / "missing.mkv", other], on_bytes_read_callback=bytes_read.append,
+        brackets={'[': ']'}, crc32_workers=2, probe_profile="fast"))
+
+    assert results[1] is None
+    assert [_.release_group for _ in (results[0], results[2])] == [None, "Other"]
+    assert [_.crc32[0] for _ in (results[0], results[2])] == \
+           [f"{zlib.crc32(_.read_bytes()):08X}" for _ in (source, other)]
+    assert sum(bytes_read) == source.stat().st_size + other.stat().st_size
+    assert profiles == ["fast", "fast"]
@@ -0,0 +1,102 @@
+import mmap
+import os
+import random
+import zlib
+from pathlib import Path
+
+import pytest
+
+from python_encode.utils import HelperFunctions, Crc32IOBackend
+
+SEGMENT_SIZE = 4096
+
+
+def crc(data: bytes) -> str:
+    return format(zlib.crc32(data) & 0xFFFFFFFF, '08X')
+
+
+def write(tmp_path: Path, size: int, seed: int = 0) -> Path:
+    file = tmp_path / f"{size}.bin"
+    file.write_bytes(random.Random(seed).randbytes(size))
+    return file
+
+
+@pytest.mark.parametrize("len1, len2", [(0, 0), (0, 10), (10, 0), (1, 1), (100, 4097), (4096, 4096), (65537, 3)])
+def test_crc32_combine(len1: int, len2: int):
+    generator = random.Random(len1 * 31 + len2)
+    a, b = generator.randbytes(len1), generator.randbytes(len2)
+    assert HelperFunctions.crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)) == zlib.crc32(a + b)
+
+
+def test_crc32_combine_many():
+    generator = random.Random(7)
+    blocks = [generator.randbytes(generator.randrange(0, 5000)) for _ in range(20)]
+    combined = 0
+    for block in blocks:
+        combined = HelperFunctions.crc32_combine(combined, zlib.crc32(block), len(block))
+    assert combined == zlib.crc32(b"".join(blocks))
+
+
+@pytest.mark.parametrize("size", [0, 1, SEGMENT_SIZE - 1, SEGMENT_SIZE, SEGMENT_SIZE + 1, 4 * SEGMENT_SIZE,
+                                  1024 * 1024, 1024 * 1024 + 13])
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("io_backend", Crc32IOBackend.values())
+def test_get_file_crc32(tmp_path: Path, size: int, workers: int, io_backend: str):
+    file = write(tmp_path, size)
+    read_sizes = []
+    assert HelperFunctions.get_file_crc32(file, on_file_chunk_read=read_sizes.append, workers=workers,
+                                          segment_size=SEGMENT_SIZE, io_backend=io_backend,
+                                          chunk_size=1000) == crc(file.read_bytes())
+    assert sum(read_sizes) == size
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+@pytest.mark.parametrize("io_backend", Crc32IOBackend.values())
+def test_get_file_crc32_abort(tmp_path: Path, workers: int, io_backend: str):
+    file = write(tmp_path, 64 * SEGMENT_SIZE)
+    read_sizes = []
+    result = HelperFunctions.get_file_crc32(file, on_file_chunk_read=read_sizes.append,
+                                            abort_signal=lambda: len(read_sizes) > 0, workers=workers,
+                                            segment_size=SEGMENT_SIZE, io_backend=io_backend, chunk_size=1024)
+    assert sum(read_sizes) < file.stat().st_size
+    assert result != crc(file.read_bytes())
+
+
+def test_get_file_crc32_unknown_backend(tmp_path: Path):
+    with pytest.raises(ValueError):
+        HelperFunctions.get_file_crc32(write(tmp_path, 10), io_backend="nope")
+
+
+@pytest.mark.parametrize("offset, length", [
+    (0, 0), (1, 0), (0, 1), (1, 100), (4095, 3), (12345, 50000),
+    # around the mmap allocation granularity, which the mapping has to start on
+    (mmap.ALLOCATIONGRANULARITY - 1, 2), (mmap.ALLOCATIONGRANULARITY, 1000), (mmap.ALLOCATIONGRANULARITY + 1, 1000),
+    (3 * mmap.ALLOCATIONGRANULARITY + 7, 2 * mmap.ALLOCATIONGRANULARITY),
+])
+@pytest.mark.parametrize("chunk_size", [1, 1000, 1024 * 1024])  # the last one is larger than every range
+@pytest.mark.parametrize("io_backend", Crc32IOBackend.values())
+def test_get_file_range_crc32(tmp_path: Path, offset: int, length: int, chunk_size: int, io_backend: str):
+    if chunk_size == 1 and length > 1000:
+        pytest.skip("too slow byte by byte")
+    file = write(tmp_path, 8 * mmap.ALLOCATIONGRANULARITY + 60000)
+    data = file.read_bytes()
+    read_sizes = []
+    assert HelperFunctions._get_file_range_crc32(
+        file, offset, length, read_sizes.append, lambda: False, io_backend, chunk_size
+    ) == zlib.crc32(data[offset:offset + length])
+    assert sum(read_sizes) == length
+    assert all(0 < _ <= chunk_size for _ in read_sizes)
+
+
+@pytest.mark.parametrize("has_fadvise", [True, False])
+@pytest.mark.parametrize("io_backend", Crc32IOBackend.values())
+def test_drop_page_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, has_fadvise: bool, io_backend: str):
+    if not has_fadvise:
+        # Windows and others have no posix_fadvise, dropping pages is skipped there
+        monkeypatch.delattr(os, "posix_fadvise", raising=False)
+    elif not hasattr(os, "posix_fadvise"):
+        pytest.skip("no posix_fadvise on this platform")
+    file = write(tmp_path, 3 * SEGMENT_SIZE + 5)
+    for workers in (1, 2):
+        assert HelperFunctions.get_file_crc32(file, workers=workers, segment_size=SEGMENT_SIZE, io_backend=io_backend,
+                                              chunk_size=1000, drop_page_cache=True) == crc(file.read_bytes())
@@ -0,0 +1,117 @@
+import pickle
+from pathlib import Path
+
+import pytest
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject
+from python_encode.utils import FrameCountSource
+
+
+def full_object() -> AnimeFileObject:
+    anime = AnimeFileObject()
+    anime.file = Path("/in/[Group] Show S2 - 07v2 [1080p][ABCD1234].mkv")
+    anime.file_name = anime.file.name
+    # sparse: 1 and 4 are neither, 6 is the highest index
+    anime.video_stream_indexes = {0}
+    anime.audio_stream_indexes = {2, 3}
+    anime.subtitle_stream_indexes = {6}
+    anime.attachment_stream_indexes = {5}
+    anime.chapters = [("0.000000", "90.000000", "Opening"), ("90.000000", "1420.500000", "Part A")]
+    anime.video_resolution = ("1920", "1080")
+    anime.video_length_seconds = 1420.5
+    anime.video_frame_count = 34058
+    anime.video_frame_count_source = FrameCountSource.TAGS
+    anime.release_group = "Group"
+    anime.episode_name = "Show S2 - 07v2"
+    anime.series_title = "Show S2"
+    anime.episodes = (7, 7)
+    anime.season = 2
+    anime.version = 2
+    anime.special = None
+    anime.crc32 = ("ABCD1234", "ABCD1234")
+    anime.omittable_tags = {"1080p", "HEVC"}
+    anime.non_omittable_tags = {"BD"}
+    return anime
+
+
+def round_trips(anime: AnimeFileObject) -> list:
+    return [
+        AnimeFileObject.from_dict(anime.to_dict()),
+        AnimeFileObject.from_row(anime.to_row()),
+        pickle.loads(pickle.dumps(anime)),
+        AnimeFileObject.unpack(AnimeFileObject.pack([anime]))[0],
+        AnimeFileObject.unpack(AnimeFileObject.pack([anime], compress=False))[0],
+    ]
+
+
+@pytest.mark.parametrize("anime", [AnimeFileObject(), full_object()], ids=["empty", "full"])
+def test_round_trips(anime: AnimeFileObject):
+    for copy in round_trips(anime):
+        assert copy.to_dict() == anime.to_dict()
+        for attribute in AnimeFileObject.__slots__:
+            assert getattr(copy, attribute) == getattr(anime, attribute), attribute
+
+
+def test_stream_map():
+    assert full_object().to_row()[AnimeFileObject._ROW_KEYS.index('streams')] == "v-aa-ts"
+    assert AnimeFileObject().to_row()[AnimeFileObject._ROW_KEYS.index('streams')] == ""
+
+
+def test_frame_count_source():
+    anime = full_object()
+    assert FrameCountSource.is_exact(anime.video_frame_count_source)
+    for copy in round_trips(anime):
+        assert FrameCountSource.is_exact(copy.video_frame_count_source) == \
+               FrameCountSource.is_exact(anime.video_frame_count_source)
+
+
+def test_chapters_come_back_as_tuples():
+    for copy in round_trips(full_object()):
+        assert copy.chapters == full_object().chapters
+        assert all(isinstance(_, tuple) for _ in copy.chapters)
+
+
+def test_pack():
+    objects = [full_object(), AnimeFileObject(), full_object()]
+    objects[2].file = Path("/in/other.mkv")
+    plain = AnimeFileObject.pack(objects, compress=False)
+    assert plain.startswith(b"[") and len(plain.splitlines()) == 3
+    assert [_.to_dict() for _ in AnimeFileObject.unpack(plain)] == [_.to_dict() for _ in objects]
+    assert [_.to_dict() for _ in AnimeFileObject.unpack(AnimeFileObject.pack(objects))] == \
+           [_.to_dict() for _ in objects]
+    assert AnimeFileObject.unpack(AnimeFileObject.pack([])) == []
+    assert AnimeFileObject.unpack(AnimeFileObject.pack([], compress=False)) == []
+
+
+def test_format_version_mismatch():
+    values = full_object().to_dict()
+    values['format'] = AnimeFileObject.FORMAT_VERSION + 1
+    with pytest.raises(ValueError):
+        AnimeFileObject.from_dict(values)
+    del values['format']
+    with pytest.raises(ValueError):
+        AnimeFileObject.from_dict(values)
+    row = full_object().to_row()
+    row[AnimeFileObject._ROW_KEYS.index('format')] = 0
+    with pytest.raises(ValueError):
+        AnimeFileObject.from_row(row)
+
+
+@pytest.mark.parametrize("stream, expected", [
+    ({'width': 1920, 'height': 1080}, ("1920", "1080")),
+    ({'height': 1080}, (None, "1080")),
+    ({}, (None, None)),
+])
+def test_resolution_from_probe(tmp_path: Path, stream: dict, expected: tuple):
+    # missing width / height is None, not "None", so it survives the round trips unchanged
+    anime = AnimeFileObject()
+    anime.file = tmp_path / "show.mkv"
+    anime.file.touch()
+    AnimeProcessor.read_anime_file_probe_result(anime, {
+        'streams': [{'index': 0, 'codec_type': 'video', **stream}],
+        'format': {},
+    })
+    assert anime.video_resolution == expected
+    for copy in round_trips(anime):
+        assert copy.video_resolution == expected
@@ -0,0 +1,150 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import pytest
+
+from python_encode.distributed import EncodeCoordinator, DistributedJobState
+
+
+def call(coordinator: EncodeCoordinator, path: str, body: Optional[Dict[str, Any]] = None,
+         token: Optional[str] = None) -> Tuple[int, Dict[str, Any]]:
+    host, port = coordinator.address
+    request = urllib.request.Request(
+        f"http://{host}:{port}{path}", data=json.dumps(body).encode() if body is not None else None,
+        headers={'Content-Type': 'application/json', **({'X-Encode-Token': token} if token is not None else {})})
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, json.loads(response.read() or b'{}')
+    except urllib.error.HTTPError as ex:
+        return ex.code, json.loads(ex.read() or b'{}')
+
+
+@pytest.fixture
+def make_coordinator(tmp_path: Path):
+    coordinators = []
+
+    def make(files: int = 1, **kwargs) -> EncodeCoordinator:
+        coordinator = EncodeCoordinator(tmp_path / "out", host='127.0.0.1', port=0, **kwargs)
+        for idx in range(files):
+            coordinator.submit(tmp_path / f"source {idx}.mkv")
+        coordinator.start()
+        coordinators.append(coordinator)
+        return coordinator
+    yield make
+    for _ in coordinators:
+        _.stop()
+
+
+def lease(coordinator: EncodeCoordinator, worker: str) -> Optional[int]:
+    status, reply = call(coordinator, '/lease', {'worker': worker})
+    assert status == 200
+    return reply['job']['job_id'] if reply['job'] is not None else None
+
+
+def test_each_job_leased_once(make_coordinator):
+    coordinator = make_coordinator(files=3)
+    job_ids = []
+    threads = [threading.Thread(target=lambda name=f"w{_}": job_ids.append(lease(coordinator, name)))
+               for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    leased = [_ for _ in job_ids if _ is not None]
+    assert sorted(leased) == [1, 2, 3]
+    assert all(_.state == DistributedJobState.LEASED and _.attempts == 1 for _ in coordinator.jobs)
+    status, reply = call(coordinator, '/lease', {'worker': "late"})
+    assert reply == {'job': None, 'done': False}
+
+
+def test_finish(make_coordinator, tmp_path: Path):
+    finished = []
+    coordinator = make_coordinator(files=1, on_job_finished=finished.append)
+    job_id = lease(coordinator, "a")
+    assert call(coordinator, '/heartbeat', {'worker': "a", 'job_id': job_id, 'encoded_frames': 10,
+                                            'total_frames': 100})[1] == {'abort': False}
+    assert coordinator.jobs[0].encoded_frames == 10
+    # only the worker holding the lease can renew or finish it
+    assert call(coordinator, '/heartbeat', {'worker': "b", 'job_id': job_id})[0] == 409
+    assert call(coordinator, '/finish', {'worker': "b", 'job_id': job_id, 'output_file': "x.mkv"})[0] == 409
+    assert call(coordinator, '/finish', {'worker': "a", 'job_id': job_id,
+                                         'output_file': (tmp_path / "out.mkv").__str__()})[0] == 200
+    assert coordinator.jobs[0].state == DistributedJobState.ENCODED
+    assert finished == coordinator.jobs
+    assert call(coordinator, '/lease', {'worker': "a"})[1] == {'job': None, 'done': True}
+    assert coordinator.wait(timeout=5)
+    # finishing twice does nothing
+    assert call(coordinator, '/finish', {'worker': "a", 'job_id': job_id, 'output_file': "y.mkv"})[0] == 409
+    assert len(finished) == 1
+
+
+def test_lease_expiry_requeues(make_coordinator):
+    coordinator = make_coordinator(files=1, lease_seconds=0.3)
+    job_id = lease(coordinator, "a")
+    for _ in range(3):  # heartbeats keep it
+        time.sleep(0.15)
+        assert call(coordinator, '/heartbeat', {'worker': "a", 'job_id': job_id})[1] == {'abort': False}
+    assert lease(coordinator, "b") is None
+    time.sleep(0.4)
+    assert lease(coordinator, "b") == job_id
+    assert coordinator.jobs[0].worker == "b" and coordinator.jobs[0].attempts == 2
+    # the first worker is told to abort, and its result is refused
+    assert call(coordinator, '/heartbeat', {'worker': "a", 'job_id': job_id}) == (409, {'abort': True})
+    assert call(coordinator, '/finish', {'worker': "a", 'job_id': job_id, 'output_file': "a.mkv"})[0] == 409
+    assert call(coordinator, '/finish', {'worker': "b", 'job_id': job_id, 'output_file': "b.mkv"})[0] == 200
+    assert coordinator.jobs[0].output_file == Path("b.mkv")
+
+
+def test_late_finish_before_requeue(make_coordinator):
+    # the lease ran out, but nobody asked for a job since
+    coordinator = make_coordinator(files=1, lease_seconds=0.2)
+    job_id = lease(coordinator, "a")
+    time.sleep(0.3)
+    assert call(coordinator, '/finish', {'worker': "a", 'job_id': job_id, 'output_file': "a.mkv"})[0] == 409
+    assert call(coordinator, '/heartbeat', {'worker': "a", 'job_id': job_id})[0] == 409
+    assert coordinator.jobs[0].state == DistributedJobState.QUEUED
+    assert lease(coordinator, "b") == job_id
+
+
+def test_given_up_after_max_attempts(make_coordinator):
+    finished = []
+    coordinator = make_coordinator(files=1, lease_seconds=0.2, max_attempts=2, on_job_finished=finished.append)
+    job_id = lease(coordinator, "a")
+    assert call(coordinator, '/finish', {'worker': "a", 'job_id': job_id, 'error': "ffmpeg exploded"})[0] == 200
+    assert coordinator.jobs[0].state == DistributedJobState.QUEUED
+    assert lease(coordinator, "b") == job_id
+    time.sleep(0.3)
+    assert coordinator.wait(timeout=5)
+    assert coordinator.jobs[0].state == DistributedJobState.FAILED
+    assert "Lease expired" in coordinator.jobs[0].error
+    assert finished == coordinator.jobs
+    assert call(coordinator, '/lease', {'worker': "c"})[1] == {'job': None, 'done': True}
+
+
+def test_token(make_coordinator):
+    coordinator = make_coordinator(files=1, token="secret")
+    for token in (None, "wrong"):
+        for path, body in (('/lease', {'worker': "a"}), ('/heartbeat', {'worker': "a", 'job_id': 1}),
+                           ('/finish', {'worker': "a", 'job_id': 1, 'output_file': "a.mkv"}), ('/status', None)):
+            assert call(coordinator, path, body, token) == (403, {'error': 'Invalid token'})
+    assert coordinator.jobs[0].state == DistributedJobState.QUEUED
+    status, reply = call(coordinator, '/lease', {'worker': "a"}, "secret")
+    assert status == 200 and reply['job']['job_id'] == 1
+    status, reply = call(coordinator, '/status', None, "secret")
+    assert status == 200 and reply['jobs'][0]['worker'] == "a"
+
+
+def test_bad_requests(make_coordinator):
+    coordinator = make_coordinator(files=1)
+    assert call(coordinator, '/nope', {})[0] == 404
+    assert call(coordinator, '/heartbeat', {'worker': "a", 'job_id': 99})[0] == 409
+    host, port = coordinator.address
+    request = urllib.request.Request(f"http://{host}:{port}/lease", data=b"{not json")
+    with pytest.raises(urllib.error.HTTPError) as ex:
+        urllib.request.urlopen(request, timeout=10)
+    assert ex.value.code == 400
@@ -0,0 +1,61 @@
+import copy
+from pathlib import Path
+from typing import Optional
+
+import pytest
+
+from python_encode.custom_objects import EncodePresetObject
+from python_encode.encode_scheduler import EncodeScheduler
+
+PRESETS = Path(__file__).parent.parent / "presets"
+
+
+def make_preset(extra_options: list, video_params: Optional[dict] = None) -> EncodePresetObject:
+    preset = EncodePresetObject()
+    preset.extra_options = list(extra_options)
+    if video_params is not None:
+        preset.stream_params = {"video": dict(video_params)}
+    return preset
+
+
+@pytest.mark.parametrize("extra_options, video_params, expected_options, expected_video_params", [
+    # nothing to merge with
+    ([], None, ['-threads', '4'], None),
+    ([], {'c': 'libx264'}, ['-threads', '4'], {'c': 'libx264'}),
+    ([], {'c': 'libx265'}, ['-threads', '4', '-x265-params', 'pools=4'], {'c': 'libx265'}),
+    # the preset's own options win
+    (['-threads', '2'], None, ['-threads', '2'], None),
+    (['-threads', '2'], {'c': 'libx265'}, ['-threads', '2', '-x265-params', 'pools=4'], {'c': 'libx265'}),
+    ([], {'c': 'libx264', 'threads': 2}, [], {'c': 'libx264', 'threads': 2}),
+    # pools goes into the existing x265 params
+    (['-x265-params', 'me=2:rd=4', '-y'], {'c': 'libx265'},
+     ['-x265-params', 'me=2:rd=4:pools=4', '-y', '-threads', '4'], {'c': 'libx265'}),
+    (['-x265-params', 'pools=2:me=2'], {'c': 'libx265'},
+     ['-x265-params', 'pools=2:me=2', '-threads', '4'], {'c': 'libx265'}),
+    ([], {'c': 'libx265', 'x265-params': 'me=2'}, ['-threads', '4'], {'c': 'libx265', 'x265-params': 'me=2:pools=4'}),
+    ([], {'c': 'libx265', 'x265-params': 'pools=2'}, ['-threads', '4'], {'c': 'libx265', 'x265-params': 'pools=2'}),
+])
+def test_apply_thread_limit(extra_options, video_params, expected_options, expected_video_params):
+    preset = make_preset(extra_options, video_params)
+    original = copy.deepcopy(preset)
+    limited = EncodeScheduler.apply_thread_limit(preset, 4)
+
+    assert limited.extra_options == expected_options
+    assert limited.stream_params.get("video", None) == expected_video_params
+    # the original preset is shared with everything else, it stays as it is
+    assert (preset.extra_options, preset.stream_params) == (original.extra_options, original.stream_params)
+    # applying it again changes nothing
+    limited_again = EncodeScheduler.apply_thread_limit(limited, 4)
+    assert (limited_again.extra_options, limited_again.stream_params) == (limited.extra_options, limited.stream_params)
+
+
+def test_apply_thread_limit_shipped_preset():
+    preset = EncodePresetObject(PRESETS / "h265-10bit-opus")
+    original_options = list(preset.extra_options)
+    limited = EncodeScheduler.apply_thread_limit(preset, 3)
+
+    assert limited.extra_options.count('-threads') == 1
+    assert limited.extra_options.count('-x265-params') == 1
+    x265_params = limited.extra_options[limited.extra_options.index('-x265-params') + 1]
+    assert x265_params.startswith('me=2:') and x265_params.endswith(':pools=3')
+    assert preset.extra_options == original_options
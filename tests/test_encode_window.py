@@ -0,0 +1,102 @@
+import datetime
+
+import pytest
+
+from python_encode.encode_window import EncodeWindow, EncodeWindowSchedule
+
+MONDAY = datetime.datetime(2024, 1, 1)  # a monday
+
+
+def at(days: int, hour: int, minute: int = 0) -> datetime.datetime:
+    return MONDAY + datetime.timedelta(days=days, hours=hour, minutes=minute)
+
+
+@pytest.mark.parametrize("text, weekdays, start, end", [
+    ("22:00-07:00", set(range(7)), (22, 0), (7, 0)),
+    ("mon-fri 22:00-07:00", {0, 1, 2, 3, 4}, (22, 0), (7, 0)),
+    ("sat,sun 00:00-24:00", {5, 6}, (0, 0), (24, 0)),
+    ("sat-mon 9-17:30", {5, 6, 0}, (9, 0), (17, 30)),
+    ("Monday,WED 01:05-02:00", {0, 2}, (1, 5), (2, 0)),
+    ("  fri 10:00-10:00 ", {4}, (10, 0), (10, 0)),
+])
+def test_window_parse(text, weekdays, start, end):
+    window = EncodeWindow.parse(text)
+    assert window.weekdays == weekdays
+    assert window.start == datetime.timedelta(hours=start[0], minutes=start[1])
+    assert window.end == datetime.timedelta(hours=end[0], minutes=end[1])
+    assert EncodeWindow.parse(window.__str__()).__str__() == window.__str__()
+
+
+@pytest.mark.parametrize("text", [
+    "", "22:00", "mon", "mon tue 10:00-11:00", "xyz 10:00-11:00", "mon-xyz 10:00-11:00", "mon 25:00-07:00",
+    "mon 10:60-11:00", "mon 10:00-24:30", "mon ab:00-11:00", "mon -11:00", "mon 10:00-",
+])
+def test_window_parse_malformed(text):
+    with pytest.raises(ValueError):
+        EncodeWindow.parse(text)
+
+
+@pytest.mark.parametrize("text, moment, expected", [
+    # crossing midnight belongs to the day it starts on
+    ("fri 22:00-07:00", at(4, 21, 59), False),
+    ("fri 22:00-07:00", at(4, 22), True),
+    ("fri 22:00-07:00", at(5, 6, 59), True),
+    ("fri 22:00-07:00", at(5, 7), False),
+    ("fri 22:00-07:00", at(5, 23), False),
+    ("fri 22:00-07:00", at(3, 23), False),
+    ("sun 23:00-01:00", at(7, 0, 30), True),  # sunday night into the next monday
+    ("sat,sun 00:00-24:00", at(5, 0), True),
+    ("sat,sun 00:00-24:00", at(6, 23, 59), True),
+    ("sat,sun 00:00-24:00", at(7, 0), False),
+    ("fri 10:00-10:00", at(5, 9, 59), True),  # end <= start is a whole day
+    ("fri 10:00-10:00", at(5, 10), False),
+])
+def test_window_is_open(text, moment, expected):
+    assert EncodeWindow.parse(text).is_open(moment) == expected
+
+
+def test_empty_schedule():
+    schedule = EncodeWindowSchedule.parse([])
+    assert schedule.is_open(at(0, 12))
+    assert schedule.next_change(at(0, 12)) is None
+    assert schedule.__str__() == "always"
+
+
+def test_schedule_parse_malformed():
+    with pytest.raises(ValueError):
+        EncodeWindowSchedule.parse(["22:00-07:00", "sometimes"])
+
+
+@pytest.mark.parametrize("texts, now, expected", [
+    (["22:00-07:00"], at(0, 12), at(0, 22)),
+    (["22:00-07:00"], at(0, 23), at(1, 7)),
+    (["mon-fri 22:00-07:00"], at(5, 6, 30), at(5, 7)),  # friday night
+    (["mon-fri 22:00-07:00"], at(5, 7), at(7, 22)),  # weekend off, next one is monday night
+    (["mon 10:00-11:00"], at(0, 11), at(7, 10)),
+    (["mon 10:00-11:00"], at(0, 10, 30), at(0, 11)),
+    (["mon 10:00-11:00"], at(0, 9, 59) + datetime.timedelta(seconds=30), at(0, 10)),
+    # edges inside another open window change nothing
+    (["mon 10:00-12:00", "mon 11:00-13:00"], at(0, 10, 30), at(0, 13)),
+    (["mon 10:00-11:00", "mon 11:00-12:00"], at(0, 10, 30), at(0, 12)),
+    (["sat,sun 00:00-24:00", "mon-fri 18:00-08:00"], at(4, 12), at(4, 18)),
+    (["sat,sun 00:00-24:00", "sun-fri 18:00-08:00"], at(4, 19), at(7, 8)),
+    # always open
+    (["00:00-24:00"], at(3, 5), None),
+    (["mon-sun 12:00-12:00"], at(3, 5), None),
+])
+def test_next_change(texts, now, expected):
+    assert EncodeWindowSchedule.parse(texts).next_change(now) == expected
+
+
+@pytest.mark.parametrize("texts", [
+    ["22:00-07:00"], ["mon-fri 22:00-07:00", "sat,sun 09:00-24:00"], ["wed 12:00-12:00", "thu 11:00-13:30"],
+    ["sun 23:00-01:00"],
+])
+def test_next_change_matches_scan(texts):
+    # same answer as checking minute by minute
+    schedule = EncodeWindowSchedule.parse(texts)
+    for now in [at(day, hour, 17) for day in range(0, 7, 2) for hour in range(0, 24, 7)]:
+        moment = now.replace(minute=0) + datetime.timedelta(hours=1)
+        while schedule.is_open(moment) == schedule.is_open(now):
+            moment += datetime.timedelta(minutes=1)
+        assert schedule.next_change(now) == moment
@@ -0,0 +1,241 @@
+import os
+import sqlite3
+import zlib
+from pathlib import Path
+
+import pytest
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject, EncodePresetObject
+from python_encode.file_cache import FileIdentityCache, ProbeCache, Crc32Cache, SfvSidecar
+from python_encode.utils import Constants
+
+PROBE_RESULT = {'streams': [{'index': 0, 'codec_type': 'video', 'width': 1920}], 'format': {'duration': '1.5'}}
+
+
+@pytest.fixture
+def source(tmp_path: Path) -> Path:
+    file = tmp_path / "source.mkv"
+    file.write_bytes(b"0123456789")
+    return file
+
+
+@pytest.fixture
+def probe_cache(tmp_path: Path):
+    cache = ProbeCache(tmp_path / "probe.sqlite3")
+    yield cache
+    cache.close()
+
+
+def test_hit(probe_cache: ProbeCache, source: Path):
+    assert probe_cache.get(source) is None
+    probe_cache.put(source, PROBE_RESULT)
+    assert probe_cache.get(source) == PROBE_RESULT
+    assert (probe_cache.hits, probe_cache.misses, probe_cache.bytes_avoided) == (1, 1, 10)
+
+
+def test_survives_reopen(tmp_path: Path, source: Path):
+    cache = ProbeCache(tmp_path / "probe.sqlite3")
+    cache.put(source, PROBE_RESULT)
+    cache.close()
+    cache = ProbeCache(tmp_path / "probe.sqlite3")
+    assert cache.get(source) == PROBE_RESULT
+    cache.close()
+
+
+def test_changed_size(probe_cache: ProbeCache, source: Path):
+    probe_cache.put(source, PROBE_RESULT)
+    stat = source.stat()
+    source.write_bytes(b"01234567890")
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert probe_cache.get(source) is None
+
+
+def test_changed_mtime(probe_cache: ProbeCache, source: Path):
+    probe_cache.put(source, PROBE_RESULT)
+    stat = source.stat()
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+    assert probe_cache.get(source) is None
+    # stale entries are removed, putting it back in time doesn't bring it back
+    os.utime(source, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert probe_cache.get(source) is None
+
+
+@pytest.mark.parametrize("use_inode", [True, False])
+def test_changed_inode(tmp_path: Path, source: Path, use_inode: bool):
+    cache = ProbeCache(tmp_path / "probe.sqlite3", use_inode=use_inode)
+    cache.put(source, PROBE_RESULT)
+    # same name, size and mtime, but another file
+    stat = source.stat()
+    replacement = tmp_path / "replacement.mkv"
+    replacement.write_bytes(b"9876543210")
+    os.utime(replacement, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    keep_alive = tmp_path / "old.mkv"
+    os.link(source, keep_alive)  # so the inode number isn't reused right away
+    os.replace(replacement, source)
+    if source.stat().st_ino == stat.st_ino:
+        pytest.skip("file system without inode numbers")
+    assert (cache.get(source) is None) == use_inode
+    cache.close()
+
+
+def test_identity_of_path(probe_cache: ProbeCache, source: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    probe_cache.put(source, PROBE_RESULT)
+    monkeypatch.chdir(tmp_path)
+    assert probe_cache.get(Path(source.name)) == PROBE_RESULT
+
+
+def test_corrupt_database(tmp_path: Path, source: Path):
+    db_file = tmp_path / "probe.sqlite3"
+    db_file.write_bytes(b"this is not a database" * 100)
+    cache = ProbeCache(db_file)
+    assert cache.get(source) is None
+    cache.put(source, PROBE_RESULT)
+    assert cache.get(source) == PROBE_RESULT
+    cache.close()
+
+
+def test_schema_version_change(tmp_path: Path, source: Path):
+    cache = Crc32Cache(tmp_path / "cache.sqlite3")
+    cache.put(source, "ABCD1234")
+    cache.close()
+    with sqlite3.connect(tmp_path / "cache.sqlite3") as connection:
+        connection.execute("PRAGMA user_version = 99")
+    connection.close()
+    cache = Crc32Cache(tmp_path / "cache.sqlite3")
+    assert cache.get(source) is None
+    cache.close()
+
+
+def test_locked_database(tmp_path: Path, source: Path, monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(FileIdentityCache, "LOCK_TIMEOUT", 0.05)
+    db_file = tmp_path / "probe.sqlite3"
+    cache = ProbeCache(db_file)
+    cache.put(source, PROBE_RESULT)
+    other_process = sqlite3.connect(db_file, isolation_level=None)
+    other_process.execute("BEGIN EXCLUSIVE")
+    try:
+        assert cache.get(source) is None
+        cache.put(source, PROBE_RESULT)  # not an error either
+        opened_while_locked = ProbeCache(db_file)
+        assert opened_while_locked.get(source) is None
+        opened_while_locked.put(source, PROBE_RESULT)
+        assert opened_while_locked.purge() == 0
+        opened_while_locked.close()
+    finally:
+        other_process.execute("ROLLBACK")
+        other_process.close()
+    assert cache.get(source) == PROBE_RESULT
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_purge(probe_cache: ProbeCache, source: Path):
+    probe_cache.put(source, PROBE_RESULT)
+    assert probe_cache.purge() == 1
+    assert probe_cache.get(source) is None
+
+
+@pytest.fixture
+def crc32_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    cache = Crc32Cache(tmp_path / "crc32.sqlite3")
+    monkeypatch.setattr(AnimeProcessor, "crc32_cache", cache)
+    monkeypatch.setattr(AnimeProcessor, "use_crc32_cache", True)
+    monkeypatch.setattr(AnimeProcessor, "trust_sfv_sidecar", False)
+    monkeypatch.setattr(Constants, "CRC32_CHUNK_SIZE", 16)
+    yield cache
+    cache.close()
+
+
+def anime_of(file: Path) -> AnimeFileObject:
+    anime = AnimeFileObject()
+    anime.file = file
+    anime.file_name = file.name
+    return anime
+
+
+def crc(file: Path) -> str:
+    return format(zlib.crc32(file.read_bytes()) & 0xFFFFFFFF, '08X')
+
+
+def test_source_crc32_cached(crc32_cache: Crc32Cache, source: Path):
+    anime, read_sizes = anime_of(source), []
+    AnimeProcessor.read_anime_file_crc32(anime, read_sizes.append)
+    assert anime.crc32[0] == crc(source) == crc32_cache.get(source)
+    crc32_cache.put(source, "0000ABCD")  # what's cached is used, the file isn't read again
+    anime, read_sizes = anime_of(source), []
+    AnimeProcessor.read_anime_file_crc32(anime, read_sizes.append)
+    assert anime.crc32[0] == "0000ABCD"
+    assert read_sizes == [source.stat().st_size]  # reported as read
+
+
+def test_aborted_crc32_not_cached(crc32_cache: Crc32Cache, source: Path):
+    source.write_bytes(b"0123456789" * 100)
+    anime, read_sizes = anime_of(source), []
+    AnimeProcessor.read_anime_file_crc32(anime, read_sizes.append, lambda: len(read_sizes) > 0)
+    assert sum(read_sizes) < source.stat().st_size
+    assert crc32_cache.get(source) is None
+
+
+def test_encoded_output_bypasses_crc32_cache(crc32_cache: Crc32Cache, tmp_path: Path,
+                                            monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(AnimeProcessor, "trust_sfv_sidecar", True)
+    monkeypatch.setattr(AnimeProcessor, "probe_file", lambda file, ffprobe, use_cache: {'streams': [], 'format': {}})
+    output = tmp_path / "output.mkv"
+    output.write_bytes(b"encoded")
+    crc32_cache.put(output, "0000ABCD")  # left over by an earlier output of the same name
+    (tmp_path / "output.sfv").write_text("output.mkv 1111ABCD\n")
+    preset = EncodePresetObject()
+    preset.naming = "{episode_name} [{crc32}]"
+    source_anime = anime_of(tmp_path / "source.mkv")
+    hits, misses = crc32_cache.hits, crc32_cache.misses
+    replacement = AnimeProcessor.build_rename_keyword_replacement(source_anime, output, encode_preset_object=preset,
+                                                                  on_byte_read_callback=lambda size: ...)
+    assert replacement["{crc32}"] == crc(output)
+    assert (crc32_cache.hits, crc32_cache.misses) == (hits, misses)  # not even looked up
+    assert crc32_cache.get(output) == "0000ABCD"  # nor overwritten
+
+
+def test_crc32_lookup_order(crc32_cache: Crc32Cache, source: Path, monkeypatch: pytest.MonkeyPatch):
+    (source.parent / "release.sfv").write_text(f"{source.name} 1111ABCD\n")
+    anime = anime_of(source)
+    AnimeProcessor.read_anime_file_crc32(anime, lambda size: ...)
+    assert anime.crc32[0] == crc(source)  # sfv files aren't trusted by default
+    monkeypatch.setattr(AnimeProcessor, "trust_sfv_sidecar", True)
+    AnimeProcessor.read_anime_file_crc32(anime, lambda size: ...)
+    assert anime.crc32[0] == crc(source)  # cache first
+    crc32_cache.purge()
+    AnimeProcessor.read_anime_file_crc32(anime, lambda size: ...)
+    assert anime.crc32[0] == "1111ABCD"
+    assert crc32_cache.get(source) is None  # only hashed values are cached
+    monkeypatch.setattr(AnimeProcessor, "use_crc32_cache", False)  # "--no-crc32-cache" ignores sfv files too
+    AnimeProcessor.read_anime_file_crc32(anime, lambda size: ...)
+    assert anime.crc32[0] == crc(source)
+    assert crc32_cache.get(source) is None
+
+
+def test_sfv_parse(tmp_path: Path):
+    sfv_file = tmp_path / "release.sfv"
+    sfv_file.write_bytes(
+        b"; Generated by some tool\r\n"
+        b";[Group] Commented Out - 01.mkv 00000000\r\n"
+        b"\r\n"
+        b"[Group] Show - 01 [1080p].mkv abcd1234\r\n"
+        b"  [Group] Show - 02 [1080p].mkv   0000FfFf  \r\n"
+        b"no checksum.mkv\r\n"
+        b"short checksum.mkv 1234\r\n"
+        b"[Group] Show - 03 [1080p].mkv DEADBEEF"
+    )
+    assert SfvSidecar.parse(sfv_file) == {
+        "[Group] Show - 01 [1080p].mkv": "ABCD1234",
+        "[Group] Show - 02 [1080p].mkv": "0000FFFF",
+        "[Group] Show - 03 [1080p].mkv": "DEADBEEF",
+    }
+    assert SfvSidecar.parse(tmp_path / "missing.sfv") == {}
+
+
+def test_sfv_find_crc32(tmp_path: Path):
+    (tmp_path / "a.sfv").write_text("; nothing here\n")
+    (tmp_path / "b.sfv").write_text("Show - 01.mkv abcd1234\n")
+    assert SfvSidecar.find_crc32(tmp_path / "Show - 01.mkv") == "ABCD1234"
+    assert SfvSidecar.find_crc32(tmp_path / "Show - 02.mkv") is None
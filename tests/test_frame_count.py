@@ -0,0 +1,46 @@
+import pytest
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.utils import FrameCountSource
+
+NTSC = "24000/1001"
+
+
+@pytest.mark.parametrize("video_stream, fallback_duration, expected", [
+    # NUMBER_OF_FRAMES statistics tag first, whatever else there is
+    ({'tags': {'NUMBER_OF_FRAMES-eng': '34058'}, 'nb_frames': '100', 'duration': '10', 'avg_frame_rate': NTSC},
+     None, (34058, FrameCountSource.TAGS)),
+    ({'tags': {'NUMBER_OF_FRAMES': '34058'}}, None, (34058, FrameCountSource.TAGS)),
+    # then nb_frames
+    ({'tags': {'NUMBER_OF_FRAMES-eng': 'N/A'}, 'nb_frames': '100', 'nb_read_packets': '99'},
+     None, (100, FrameCountSource.NB_FRAMES)),
+    ({'nb_frames': 100}, None, (100, FrameCountSource.NB_FRAMES)),
+    # then counted packets
+    ({'nb_frames': '0', 'nb_read_packets': '99'}, None, (99, FrameCountSource.PACKETS)),
+    ({'nb_frames': 'N/A', 'nb_read_packets': '99'}, None, (99, FrameCountSource.PACKETS)),
+    ({'tags': {'NUMBER_OF_FRAMES': '0'}, 'nb_read_packets': '99'}, None, (99, FrameCountSource.PACKETS)),
+    # then duration x frame rate: stream duration, DURATION tag, the fallback
+    ({'nb_read_packets': '0', 'duration': '10.0', 'avg_frame_rate': NTSC}, 99, (240, FrameCountSource.ESTIMATE)),
+    ({'duration': 'N/A', 'tags': {'DURATION-eng': '00:00:10.000000000'}, 'avg_frame_rate': NTSC},
+     99, (240, FrameCountSource.ESTIMATE)),
+    ({'tags': {'DURATION': '00:01:00.5'}, 'avg_frame_rate': '25/1'}, None, (1512, FrameCountSource.ESTIMATE)),
+    ({'tags': {'DURATION': 'garbage'}, 'avg_frame_rate': '25/1'}, 10, (250, FrameCountSource.ESTIMATE)),
+    ({'avg_frame_rate': NTSC}, 10.0, (240, FrameCountSource.ESTIMATE)),
+    # nothing to go by
+    ({}, None, (None, None)),
+    ({'avg_frame_rate': NTSC}, None, (None, None)),  # no duration
+    ({'duration': '0', 'avg_frame_rate': NTSC}, None, (None, None)),
+    ({'duration': '10.0', 'avg_frame_rate': '0/0'}, 10, (None, None)),  # what ffprobe says for unknown rates
+    ({'duration': '10.0'}, None, (None, None)),
+    ({'duration': '10.0', 'avg_frame_rate': None}, None, (None, None)),
+    ({'duration': '10.0', 'avg_frame_rate': '25'}, None, (None, None)),
+])
+def test_read_video_frame_count(video_stream, fallback_duration, expected):
+    assert AnimeProcessor.read_video_frame_count(video_stream, fallback_duration) == expected
+
+
+def test_frame_count_source_is_exact():
+    for source in (FrameCountSource.TAGS, FrameCountSource.NB_FRAMES, FrameCountSource.PACKETS):
+        assert FrameCountSource.is_exact(source)
+    assert not FrameCountSource.is_exact(FrameCountSource.ESTIMATE)
+    assert not FrameCountSource.is_exact(None)
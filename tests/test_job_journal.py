@@ -0,0 +1,88 @@
+from pathlib import Path
+
+import pytest
+
+from python_encode.job_journal import JobJournal
+from python_encode.main import resume_from_journal
+from python_encode.utils import EncodeStage
+
+
+def touch(file: Path, data: bytes = b"data") -> Path:
+    file.write_bytes(data)
+    return file
+
+
+@pytest.fixture
+def batch(tmp_path: Path):
+    """Journal of a batch killed half way, closed like the process died"""
+    (tmp_path / "out").mkdir()
+    sources = {name: touch(tmp_path / f"{name}.mkv") for name in ("renamed", "encoding", "encoded", "hashed",
+                                                                  "failed", "new", "renamed_deleted")}
+    outputs = {name: touch(tmp_path / "out" / f"{name} [out].mkv") for name in ("renamed", "encoding", "encoded",
+                                                                                 "failed")}
+    journal = JobJournal("hevc", tmp_path / "out", tmp_path / "journal.sqlite3")
+    journal.set(sources["renamed"], EncodeStage.RENAMED, outputs["renamed"])
+    journal.set(sources["encoding"], EncodeStage.ENCODING, outputs["encoding"])
+    journal.set(sources["encoded"], EncodeStage.ENCODED, outputs["encoded"])
+    journal.set(sources["hashed"], EncodeStage.HASHED)
+    journal.set(sources["failed"], EncodeStage.FAILED, outputs["failed"])
+    journal.set(sources["renamed_deleted"], EncodeStage.RENAMED, tmp_path / "out" / "deleted since.mkv")
+    journal.close()
+    return sources, outputs
+
+
+def test_resume(tmp_path: Path, batch):
+    sources, outputs = batch
+    journal = JobJournal("hevc", tmp_path / "out", tmp_path / "journal.sqlite3")
+    assert journal.get(sources["encoding"]).stage == EncodeStage.ENCODING
+    remaining, unrenamed = resume_from_journal(journal, list(sources.values()))
+    journal.close()
+    # finished jobs are skipped, everything else comes back
+    assert remaining == [sources[_] for _ in ("encoding", "encoded", "hashed", "failed", "new", "renamed_deleted")]
+    # encoded but not renamed only needs the rename
+    assert unrenamed == {sources["encoded"]: outputs["encoded"]}
+    # half written outputs are removed, finished ones kept
+    assert [_.is_file() for _ in outputs.values()] == [True, False, True, False]
+
+
+def test_other_batch(tmp_path: Path, batch):
+    sources, _ = batch
+    for preset_name, output_dir in (("av1", tmp_path / "out"), ("hevc", tmp_path / "elsewhere")):
+        journal = JobJournal(preset_name, output_dir, tmp_path / "journal.sqlite3")
+        assert all(journal.get(_) is None for _ in sources.values())
+        journal.close()
+
+
+def test_changed_source_starts_over(tmp_path: Path, batch):
+    sources, _ = batch
+    touch(sources["renamed"], b"a newer release")
+    journal = JobJournal("hevc", tmp_path / "out", tmp_path / "journal.sqlite3")
+    assert journal.get(sources["renamed"]) is None
+    assert resume_from_journal(journal, [sources["renamed"]])[0] == [sources["renamed"]]
+    journal.close()
+
+
+def test_forget(tmp_path: Path, batch):
+    sources, _ = batch
+    journal = JobJournal("hevc", tmp_path / "out", tmp_path / "journal.sqlite3")
+    journal.forget(sources["renamed"])
+    assert journal.get(sources["renamed"]) is None
+    assert journal.get(sources["encoded"]) is not None
+    journal.close()
+
+
+@pytest.mark.parametrize("damage", ["truncated", "garbage", "empty"])
+def test_corrupt_journal(tmp_path: Path, batch, damage: str):
+    sources, _ = batch
+    db_file = tmp_path / "journal.sqlite3"
+    data = db_file.read_bytes()
+    db_file.write_bytes({"truncated": data[:len(data) // 2], "garbage": b"not a database" * 500, "empty": b""}[damage])
+    journal = JobJournal("hevc", tmp_path / "out", db_file)
+    # starts over: every job is pending again
+    remaining, unrenamed = resume_from_journal(journal, list(sources.values()))
+    assert remaining == list(sources.values()) and unrenamed == {}
+    journal.set(sources["hashed"], EncodeStage.ENCODING)
+    journal.close()
+    journal = JobJournal("hevc", tmp_path / "out", db_file)
+    assert journal.get(sources["hashed"]).stage == EncodeStage.ENCODING
+    journal.close()
@@ -0,0 +1,120 @@
+import os
+from pathlib import Path
+
+import pytest
+
+from python_encode.custom_objects import AnimeFileObject
+from python_encode.library_index import LibraryIndex
+
+
+@pytest.fixture
+def index(tmp_path: Path):
+    library_index = LibraryIndex(tmp_path / "index.sqlite3")
+    yield library_index
+    library_index.close()
+
+
+def source(tmp_path: Path, name: str, data: bytes = b"episode", crc32: str = "ABCD1234") -> AnimeFileObject:
+    file = tmp_path / name
+    file.write_bytes(data)
+    anime = AnimeFileObject()
+    anime.file = file
+    anime.file_name = file.name
+    anime.crc32 = (crc32, None)
+    return anime
+
+
+def encode(index: LibraryIndex, anime: AnimeFileObject, preset_name: str) -> Path:
+    output_file = anime.file.parent / f"{anime.file.stem} [{preset_name}].mkv"
+    output_file.write_bytes(b"encoded")
+    index.add_encode(anime, preset_name, output_file)
+    return output_file
+
+
+def test_encoded_source_skipped(index: LibraryIndex, tmp_path: Path):
+    anime = source(tmp_path, "a.mkv")
+    assert index.should_encode(anime, "hevc")
+    output_file = encode(index, anime, "hevc")
+    assert not index.should_encode(anime, "hevc")
+    assert [_.output_file for _ in index.find_encodes(anime, "hevc")] == [output_file]
+    # a moved or renamed copy is the same content
+    moved = source(tmp_path, "moved.mkv")
+    assert not index.should_encode(moved, "hevc")
+
+
+def test_other_preset_not_skipped(index: LibraryIndex, tmp_path: Path):
+    anime = source(tmp_path, "a.mkv")
+    encode(index, anime, "hevc")
+    assert index.should_encode(anime, "av1")
+    assert len(index.find_encodes(anime)) == 1
+    assert index.find_encodes(anime, "av1") == []
+
+
+def test_deleted_output_not_skipped(index: LibraryIndex, tmp_path: Path):
+    anime = source(tmp_path, "a.mkv")
+    encode(index, anime, "hevc").unlink()
+    assert index.should_encode(anime, "hevc")
+
+
+def test_unverified_source_matched_by_path(index: LibraryIndex, tmp_path: Path):
+    anime = source(tmp_path, "a.mkv", crc32=None)
+    encode(index, anime, "hevc")
+    assert not index.should_encode(anime, "hevc")
+    assert index.should_encode(source(tmp_path, "copy.mkv", crc32=None), "hevc")  # can't tell it's a copy
+    stat = anime.file.stat()
+    os.utime(anime.file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))  # replaced since
+    assert index.should_encode(anime, "hevc")
+
+
+def test_copies_held_back(index: LibraryIndex, tmp_path: Path):
+    first, second, third = (source(tmp_path, f"{_}.mkv") for _ in "abc")
+    other = source(tmp_path, "other.mkv", b"other episode", "1111ABCD")
+    assert [index.should_encode(_, "hevc") for _ in (first, second, third, other)] == [True, False, False, True]
+    assert index.should_encode(first, "hevc")  # asking again about the queued one doesn't change anything
+
+
+def test_encode_failed_hands_out_copies(index: LibraryIndex, tmp_path: Path):
+    first, second, third = (source(tmp_path, f"{_}.mkv") for _ in "abc")
+    for anime in (first, second, third):
+        index.should_encode(anime, "hevc")
+    assert index.encode_failed(second) is None  # not the queued one
+    assert index.encode_failed(first) is second
+    assert index.encode_failed(first) is None  # second one is queued now
+    assert index.encode_failed(second) is third
+    assert index.encode_failed(third) is None
+    # nothing queued nor encoded any more, the next copy goes
+    assert index.should_encode(source(tmp_path, "d.mkv"), "hevc")
+
+
+def test_encode_failed_reenables_source(index: LibraryIndex, tmp_path: Path):
+    first = source(tmp_path, "a.mkv")
+    assert index.should_encode(first, "hevc")
+    assert index.encode_failed(first) is None
+    assert index.should_encode(source(tmp_path, "b.mkv"), "hevc")
+
+
+def test_encoded_drops_copies(index: LibraryIndex, tmp_path: Path):
+    first, second = source(tmp_path, "a.mkv"), source(tmp_path, "b.mkv")
+    index.should_encode(first, "hevc")
+    index.should_encode(second, "hevc")
+    encode(index, first, "hevc")
+    assert index.encode_failed(first) is None
+    assert not index.should_encode(second, "hevc")
+
+
+def test_duplicates(index: LibraryIndex, tmp_path: Path):
+    for anime in (source(tmp_path, "b.mkv"), source(tmp_path, "a.mkv"), source(tmp_path, "c.mkv", b"other"),
+                  source(tmp_path, "d.mkv", b"episode", "FFFF0000"), source(tmp_path, "e.mkv", crc32=None),
+                  source(tmp_path, "f.mkv", crc32=None)):
+        index.add_source(anime)
+    assert index.duplicates() == [[tmp_path / "a.mkv", tmp_path / "b.mkv"]]
+
+
+def test_survives_reopen(tmp_path: Path):
+    index = LibraryIndex(tmp_path / "index.sqlite3")
+    anime = source(tmp_path, "a.mkv")
+    encode(index, anime, "hevc")
+    index.close()
+    index = LibraryIndex(tmp_path / "index.sqlite3")
+    assert not index.should_encode(anime, "hevc")
+    index.close()
@@ -0,0 +1,134 @@
+from pathlib import Path
+
+import pytest
+
+from python_encode.anime_processor import AnimeProcessor
+from python_encode.custom_objects import AnimeFileObject
+
+
+def parse(title: str, **kwargs) -> AnimeFileObject:
+    anime = AnimeFileObject()
+    AnimeProcessor.parse_anime_file_name(anime, title, **kwargs)
+    return anime
+
+
+def name_fields(anime: AnimeFileObject) -> tuple:
+    return (anime.release_group, anime.episode_name, anime.crc32[1], sorted(anime.omittable_tags),
+            sorted(anime.non_omittable_tags))
+
+
+# expected values are what the character by character loop (before the regex tokenizer) gave
+@pytest.mark.parametrize("title, kwargs, expected", [
+    ("[Group] Show Name - 01 [1080p][ABCD1234]", {},
+     ('Group', 'Show Name - 01', 'ABCD1234', ['1080p'], [])),
+    ("Show Name - 01", {},
+     (None, 'Show Name - 01', None, [], [])),
+    ("(G) Show - 01 (1080p)", {},
+     ('G', 'Show - 01', None, ['1080p'], [])),
+    ("[G] Show [BD] text [WEB-DL] more", {},
+     ('G', 'Show text more', None, [], ['BD', 'WEB-DL'])),
+    # unclosed bracket runs to the end
+    ("[Group] Show - 01 [BD 1080p", {},
+     ('Group', 'Show - 01', None, ['BD 1080p'], [])),
+    # ... losing trailing spaces after another tag, keeping them when it's the first one
+    ("Show [BD] [WEB-DL ", {},
+     (None, 'Show', None, [], ['BD', 'WEB-DL'])),
+    ("[G] Show [BD] [WEB-DL_", {},
+     ('G', 'Show', None, [], ['BD', 'WEB-DL'])),
+    ("[G] Show [BD_HEVC] [x_", {'multiple_content_spliter': ' '},
+     ('G', 'Show', None, ['HEVC'], ['BD', 'x'])),
+    ("Show [abc ", {},
+     (None, 'Show', None, [], ['abc '])),
+    ("[G] Show [abc_", {},
+     ('G', 'Show', None, [], ['abc '])),
+    # "_" as separator
+    ("[Group]_Show_Name_-_01_[1080p]_[ABCD1234]", {},
+     ('Group', 'Show Name - 01', 'ABCD1234', ['1080p'], [])),
+    # tag content spliter, "_" in tags is a space too
+    ("[G] Show - 01 [BD 1080p HEVC]", {'multiple_content_spliter': ' '},
+     ('G', 'Show - 01', None, ['1080p', 'HEVC'], ['BD'])),
+    ("[G] Show - 01 [BD_1080p_HEVC]", {'multiple_content_spliter': ' '},
+     ('G', 'Show - 01', None, ['1080p', 'HEVC'], ['BD'])),
+    # ignoring_left_brackets
+    ("[G] Show (2019) - 01 [1080p]", {},
+     ('G', 'Show - 01', None, ['1080p'], ['2019'])),
+    ("[G] Show (2019) - 01 [1080p]", {'ignoring_left_brackets': {'('}},
+     ('G', 'Show (2019) - 01', None, ['1080p'], [])),
+    ("[G] Show (2019) - 01 [1080p]", {'ignoring_left_brackets': ['(']},
+     ('G', 'Show (2019) - 01', None, ['1080p'], [])),
+])
+def test_parse_anime_file_name(title, kwargs, expected):
+    assert name_fields(parse(title, **kwargs)) == expected
+
+
+def test_ignoring_left_brackets_keeps_brackets():
+    brackets = dict(AnimeProcessor.brackets)
+    parse("[G] Show (2019) - 01", brackets=brackets, ignoring_left_brackets={'('})
+    assert brackets == AnimeProcessor.brackets
+    assert name_fields(parse("[G] Show (2019) - 01")) == ('G', 'Show - 01', None, [], ['2019'])
+
+
+def test_empty_title():
+    assert name_fields(parse("")) == (None, "", None, [], [])
+
+
+def test_no_brackets():
+    assert name_fields(parse("[G] Show [1080p]", brackets={})) == (None, "[G] Show [1080p]", None, [], [])
+
+
+def test_read_anime_file_name(tmp_path: Path):
+    file = tmp_path / "[Group] Show Name - 01 [1080p][ABCD1234].mkv"
+    file.touch()
+    anime = AnimeFileObject()
+    anime.file = file
+    AnimeProcessor.read_anime_file_name(anime)
+    assert name_fields(anime) == name_fields(parse(file.stem))
+
+
+def test_parse_anime_file_names():
+    names = ["/not/there/[Group] Show Name - 01 [1080p][ABCD1234].mkv", "Show [abc .mkv", "[G] Show (2019) - 01"]
+    table = AnimeProcessor.parse_anime_file_names(names)
+    assert len(table) == 3
+    assert table.names == names
+    for row, name in enumerate(names):
+        anime = parse(Path(name).stem)
+        assert (table.release_groups[row], table.episode_names[row], table.crc32_labels[row],
+                list(table.omittable_tags[row]), list(table.non_omittable_tags[row])) == name_fields(anime)
+    assert AnimeProcessor.parse_anime_file_names(names, strip_extension=False).episode_names[1] == "Show"
+    assert AnimeProcessor.parse_anime_file_names(names, processes=2, chunk_size=1).columns() == table.columns()
+
+
+@pytest.mark.parametrize("title, expected", [
+    ("[SubsPlease] Sousou no Frieren - 07 (1080p) [ABCD1234]", ('Sousou no Frieren', None, (7, 7), None, None)),
+    ("[SubsPlease] Sousou no Frieren - 07v2 (1080p) [ABCD1234]", ('Sousou no Frieren', None, (7, 7), 2, None)),
+    ("[Judas] Show S2 - 01-12 (Batch)", ('Show S2', 2, (1, 12), None, None)),
+    ("[G] Show - 01 ~ 12", ('Show', None, (1, 12), None, None)),
+    ("[Nekomoe kissaten][Sousou no Frieren][07v2][1080p][CHS]", ('Sousou no Frieren', None, (7, 7), 2, None)),
+    ("[G] Show - OVA2 [BD]", ('Show', None, (2, 2), None, 'OVA')),
+    ("[VCB-Studio] Show [NCOP1][Ma10p_1080p]", ('Show', None, (1, 1), None, 'NCOP')),
+    ("[G] Show - Special 3", ('Show', None, (3, 3), None, 'SP')),
+    ("Show.S01E07.1080p.WEB-DL", ('Show', 1, (7, 7), None, None)),
+    ("[G] Show 2nd Season - 03 [720p]", ('Show 2nd Season', 2, (3, 3), None, None)),
+    ("[G] Show [v2][01]", ('Show', None, (1, 1), 2, None)),
+    ("86 - Eighty Six - 07", ('86 - Eighty Six', None, (7, 7), None, None)),
+    ("[Group] Re-Zero - 2019 - 03", ('Re-Zero - 2019', None, (3, 3), None, None)),
+    ("[G] Steins Gate 0 [BD 1080p]", ('Steins Gate 0', None, None, None, None)),
+])
+def test_parse_episode_info(title, expected):
+    anime = parse(title)
+    assert (anime.series_title, anime.season, anime.episodes, anime.version, anime.special) == expected
+
+
+def test_episode_info_keeps_episode_name():
+    # naming templates use "{episode_name}", it must not change with the episode info
+    assert parse("[G] Show S2 - 07v2 [1080p]").episode_name == "Show S2 - 07v2"
+
+
+def test_order_episode_files():
+    files = [Path(_ + ".mkv") for _ in ["[G] B - 02", "[G] B - 01v2", "[G] B - 01", "Zed", "[G] A - 03",
+                                        "[G] B - NCOP", "[H] B - 01", "Alpha", "[G] B - 02v3"]]
+    assert [_.stem for _ in AnimeProcessor.order_episode_files(files)] == [
+        "[G] A - 03", "[G] B - 01", "[H] B - 01", "[G] B - 01v2", "[G] B - 02", "[G] B - 02v3", "[G] B - NCOP",
+        "Zed", "Alpha"]
+    assert [_.stem for _ in AnimeProcessor.order_episode_files(files, drop_old_versions=True)] == [
+        "[G] A - 03", "[H] B - 01", "[G] B - 01v2", "[G] B - 02v3", "[G] B - NCOP", "Zed", "Alpha"]
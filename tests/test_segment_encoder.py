@@ -0,0 +1,54 @@
+from typing import List
+
+import pytest
+
+from python_encode.segment_encoder import SegmentEncoder
+
+EVERY_2S = [float(_) for _ in range(0, 1441, 2)]  # 24 minutes, a keyframe every 2 seconds
+
+
+def check_cuts(cut_times: List[float], keyframes: List[float], start: float, end: float, min_seconds: float) -> None:
+    assert cut_times == sorted(set(cut_times))
+    assert all(_ in keyframes and start < _ < end for _ in cut_times)
+    bounds = [start] + cut_times + [end]
+    assert all(b - a >= min_seconds and b - a > 0 for a, b in zip(bounds, bounds[1:]))
+
+
+@pytest.mark.parametrize("keyframes, start, end, chapter_starts, target_seconds, min_seconds, expected", [
+    # no keyframes, nothing to cut at
+    ([], 0, 1440, [90, 720], 300, 30, []),
+    # keyframes all outside [start, end]
+    ([-10.0, -5.0, 1000.0, 1005.0], 0, 100, [50], 10, 5, []),
+    ([200.0, 210.0], 0, 100, [50], 10, 5, []),
+    ([-5.0, 0.0, 100.0, 105.0], 0, 100, [50], 10, 5, []),
+    # even split without chapters
+    (EVERY_2S, 0, 1440, [], 360, 30, [360, 720, 1080]),
+    (EVERY_2S, 0, 1440, [], 1440, 30, []),
+    # chapter starts snap to the nearest keyframe, split what's left after
+    (EVERY_2S, 0, 1440, [0, 91.3, 1350], 360, 30, [92, 512, 930, 1350]),
+    (EVERY_2S, 0, 1440, [91.3], 10000, 30, [92]),
+    # chapter times are from the start of the file, keyframes are timestamps
+    ([10.0 + _ for _ in EVERY_2S], 10, 1450, [80], 10000, 30, [90]),
+    # shorter than the minimum next to the start, the end or another cut
+    (EVERY_2S, 0, 1440, [10, 20, 1430], 10000, 30, []),
+    (EVERY_2S, 0, 1440, [100, 110, 140], 10000, 30, [100, 140]),
+    (EVERY_2S, 0, 100, [], 10, 30, [30, 60]),
+    # end on a keyframe is never a cut, not even without a minimum
+    ([0.0, 50.0, 100.0], 0, 100, [99], 10000, 0, []),
+    ([0.0, 50.0, 100.0], 0, 100, [1, 99], 10000, 0, []),
+    ([0.0, 50.0, 100.0], 0, 100, [], 10, 0, [50]),
+    ([0.0, 50.0, 100.0], 0, 100, [60], 10000, 0, [50]),
+])
+def test_plan_cut_times(keyframes, start, end, chapter_starts, target_seconds, min_seconds, expected):
+    cut_times = SegmentEncoder.plan_cut_times(keyframes, start, end, chapter_starts, target_seconds, min_seconds)
+    assert cut_times == expected
+    check_cuts(cut_times, keyframes, start, end, min_seconds)
+
+
+@pytest.mark.parametrize("target_seconds", [1, 7, 30, 61, 200])
+@pytest.mark.parametrize("min_seconds", [0, 1, 10, 30])
+def test_plan_cut_times_bounds(target_seconds: float, min_seconds: float):
+    keyframes = [0.0, 0.5, 3.0, 3.1, 40.0, 41.7, 88.0, 119.9, 120.0, 150.0, 151.0, 200.0]
+    cut_times = SegmentEncoder.plan_cut_times(keyframes, 0, 200, [0, 3, 41, 120, 199.9, 200], target_seconds,
+                                              min_seconds)
+    check_cuts(cut_times, keyframes, 0, 200, min_seconds)